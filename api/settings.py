@@ -1,13 +1,12 @@
 import logging
 import os
+import tempfile
 import traceback
 import urllib.parse
 from datetime import timedelta
 from pathlib import Path
 
 import mongoengine
-from mongoengine import connect
-from pymongo.errors import ConnectionFailure
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # اولین middleware تا زمان‌سنجی کل درخواست را پوشش دهد
+    "chat.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -96,22 +97,17 @@ MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "chatbot1")
 
 MONGO_URL = f"mongodb://{MONGO_USER}:{MONGO_PASS}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_DB_NAME}?authSource=admin"
 
-try:
-    connect(
-        db=MONGO_DB_NAME,
-        host=MONGO_URL,
-        alias="default",
-        connectTimeoutMS=10000,
-        socketTimeoutMS=10000,
-        serverSelectionTimeoutMS=10000,
-        retryWrites=True,
-        w="majority",
-    )
-    logger.info("✅ اتصال به MongoDB با موفقیت برقرار شد.")
-except ConnectionFailure as e:
-    logger.error(f"❌ اتصال به MongoDB شکست خورد: {str(e)}")
-except Exception as e:
-    logger.error(f"❌ خطای غیرمنتظره در اتصال به MongoDB: {str(e)}")
+# اتصال در ChatConfig.ready ساخته می‌شود، پس از ثبت شنونده متریک‌های pymongo
+MONGODB = {
+    "db": MONGO_DB_NAME,
+    "host": MONGO_URL,
+    "alias": "default",
+    "connectTimeoutMS": 10000,
+    "socketTimeoutMS": 10000,
+    "serverSelectionTimeoutMS": 10000,
+    "retryWrites": True,
+    "w": "majority",
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -214,6 +210,11 @@ LOGS_DIR = BASE_DIR / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
 
 # Logging Configuration
+# لاگ‌های chat به صورت JSON از صف و رشته پس‌زمینه نوشته می‌شوند (chat.logs)
+# LOG_FILE خالی یعنی stderr؛ LOG_SAMPLE_RATE کسری از لاگ‌های INFO پرتکرار را نگه می‌دارد
+LOG_FILE = os.environ.get("LOG_FILE")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0" if DEBUG else "0.1"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -227,6 +228,15 @@ LOGGING = {
             "style": "{",
         },
     },
+    "filters": {
+        "sampling": {
+            "()": "chat.logs.SamplingFilter",
+            # فقط لاگ‌های مسیرهای خواندنی نمونه‌برداری می‌شوند؛ ایجاد، حذف، گزارش و
+            # لاگ‌های مدیریت برای ممیزی کامل نگه داشته می‌شوند
+            "rates": {"chat.views.core_views": LOG_SAMPLE_RATE},
+            "functions": ["list", "retrieve", "thread", "get"],
+        },
+    },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
@@ -237,6 +247,11 @@ LOGGING = {
             "filename": str(LOGS_DIR / "django.log"),
             "formatter": "verbose",
         },
+        "async_json": {
+            "()": "chat.logs.AsyncQueueHandler",
+            "filename": LOG_FILE,
+            "filters": ["sampling"],
+        },
     },
     "root": {
         "handlers": ["console"],
@@ -249,13 +264,100 @@ LOGGING = {
             "propagate": False,
         },
         "chat": {
-            "handlers": ["console"],  # فقط console برای جلوگیری از مشکل
+            "handlers": ["async_json"],
             "level": "DEBUG" if DEBUG else "INFO",
             "propagate": False,
         },
     },
 }
 
+# کش وضعیت اسناد برای اعتبارسنج‌ها (per-process)
+VALIDATION_CACHE = {
+    "MAXSIZE": int(os.environ.get("VALIDATION_CACHE_MAXSIZE", "10000")),
+    "TTL": int(os.environ.get("VALIDATION_CACHE_TTL", "30")),
+}
+
+# کش کاربران در احراز هویت JWT (per-process)
+USER_CACHE = {
+    "MAXSIZE": int(os.environ.get("USER_CACHE_MAXSIZE", "10000")),
+    "TTL": int(os.environ.get("USER_CACHE_TTL", "30")),
+}
+
+# ETag محتوا (chat.conditional): نسخه مجموعه محتوا تا VERSION_TTL ثانیه در هر
+# worker نگه داشته می‌شود و پاسخ‌ها MAX_AGE ثانیه در کلاینت معتبرند
+CONTENT_CACHE = {
+    "VERSION_TTL": int(os.environ.get("CONTENT_VERSION_TTL", "10")),
+    "MAX_AGE": int(os.environ.get("CONTENT_MAX_AGE", "60")),
+}
+
+# ابطال توکن‌ها (chat.revocation)؛ بن شدن حداکثر پس از REFRESH_INTERVAL ثانیه اعمال می‌شود
+TOKEN_REVOCATION = {
+    "REFRESH_INTERVAL": int(os.environ.get("TOKEN_REVOCATION_REFRESH", "5")),
+}
+
+# هش رمز عبور در استخر پروسه (chat.passwords)
+# با تغییر ROUNDS، هش کاربران در ورود بعدی با هزینه جدید ساخته می‌شود
+PASSWORD_HASHING = {
+    "ROUNDS": int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    "WORKERS": int(os.environ.get("PASSWORD_HASH_WORKERS", "2")),
+    "MAX_PENDING": int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "8")),
+    "TIMEOUT": float(os.environ.get("PASSWORD_HASH_TIMEOUT", "5")),
+}
+
+# بایگانی پیام‌های چالش‌های قدیمی (manage.py archive_messages)
+MESSAGE_ARCHIVE = {
+    "COLLECTION": "messages_archive",
+    "STATE_TTL": int(os.environ.get("MESSAGE_ARCHIVE_STATE_TTL", "30")),
+}
+
+# Realtime push (SSE / WebSocket, served by api.asgi)
+# با تنظیم REALTIME_BROKER_DIR رویدادها بین پروسه‌های worker به اشتراک گذاشته می‌شوند
+REALTIME_BROKER_DIR = os.environ.get("REALTIME_BROKER_DIR")
+if REALTIME_BROKER_DIR:
+    REALTIME_BROKER = {
+        "BACKEND": "chat.realtime.DiskCacheBroker",
+        "OPTIONS": {"directory": REALTIME_BROKER_DIR},
+    }
+else:
+    REALTIME_BROKER = {"BACKEND": "chat.realtime.InProcessBroker", "OPTIONS": {}}
+
+# ذخیره کدهای OTP؛ با OTP_STORE_DIR کدها در diskcache مشترک بین worker ها نگه داشته می‌شوند
+OTP_STORE_DIR = os.environ.get("OTP_STORE_DIR")
+OTP_MAX_ATTEMPTS = int(os.environ.get("OTP_MAX_ATTEMPTS", "5"))
+if OTP_STORE_DIR:
+    OTP_STORE = {
+        "BACKEND": "chat.otp.DiskCacheOTPStore",
+        "OPTIONS": {"directory": OTP_STORE_DIR, "max_attempts": OTP_MAX_ATTEMPTS},
+    }
+else:
+    OTP_STORE = {
+        "BACKEND": "chat.otp.MongoOTPStore",
+        "OPTIONS": {"max_attempts": OTP_MAX_ATTEMPTS},
+    }
+
+# محدودیت نرخ درخواست (chat.throttling)؛ سطل‌ها در diskcache بین worker ها مشترک‌اند
+RATE_LIMIT = {
+    "DIRECTORY": os.environ.get(
+        "RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "chatbot-ratelimit")
+    ),
+    "RATES": {
+        "otp_request": {"phone": "3/min", "ip": "20/min"},
+        "otp_verify": {"phone": "10/min", "ip": "30/min"},
+        "message_create": {"user": "30/min", "ip": "120/min"},
+        # هزینه هر درخواست گروهی به تعداد پیام‌های آن است
+        "message_bulk": {"user": "1000/h", "ip": "2000/h"},
+    },
+}
+
+# متریک‌های Prometheus در /metrics؛ هر worker آمار خود را در DIRECTORY می‌نویسد
+METRICS = {
+    "DIRECTORY": os.environ.get(
+        "METRICS_DIR", os.path.join(tempfile.gettempdir(), "chatbot-metrics")
+    ),
+    "FLUSH_INTERVAL": int(os.environ.get("METRICS_FLUSH_INTERVAL", "5")),
+    "TOKEN": os.environ.get("METRICS_TOKEN"),
+}
+
 # Session Configuration
 SESSION_ENGINE = "django.contrib.sessions.backends.db"
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
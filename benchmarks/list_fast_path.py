@@ -0,0 +1,195 @@
+"""
+List endpoints: DRF serializers over mongoengine documents vs the raw
+projection fast path (``chat.projections`` + ``FastJSONRenderer``).
+
+For each list the same page of documents is fetched once from an in-memory
+Mongo (mongomock); then each path is timed from raw BSON to response bytes:
+
+* ``drf``  build documents (as a queryset does), prefetch references,
+           ``Serializer(many=True).data`` and ``JSONRenderer``
+* ``fast`` ``Projection.serialize`` on the projected dicts and
+           ``FastJSONRenderer``
+
+Both paths must render identical bytes; the run stops if they do not.
+
+    python benchmarks/list_fast_path.py --page-sizes 50,200 --repeat 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+
+MOODS = ["happy", "sad", "angry", "stressed", "relaxed", "neutral"]
+CATEGORIES = ["meditation", "music", "story", "chatbot"]
+
+
+def setup():
+    import django
+
+    django.setup()
+
+    import mongomock
+    from mongoengine import connect, disconnect
+
+    disconnect(alias="default")
+    connect(
+        "chat_list_bench",
+        host="mongodb://localhost",
+        alias="default",
+        mongo_client_class=mongomock.MongoClient,
+    )
+
+
+def seed(size, rng):
+    from chat.models import Challenge, Content, Message, Room, User
+
+    now = datetime.now(timezone.utc)
+    users = [User(username=f"user{i}", phone=f"0992{i:07d}") for i in range(20)]
+    User.objects.insert(users)
+    rooms = [
+        Room(
+            title=f"room {i}",
+            description="توضیحات اتاق",
+            room_type="daily",
+            creator=rng.choice(users),
+            created_at=now - timedelta(seconds=i),
+        )
+        for i in range(size)
+    ]
+    Room.objects.insert(rooms)
+    challenge = Challenge(room=rooms[0], title="c", expiration_time=now).save()
+    Message.objects.insert(
+        [
+            Message(
+                challenge=challenge,
+                user_id=str(rng.choice(users).id),
+                content="پیام آزمایشی " * rng.randint(1, 12),
+                likes=[str(user.id) for user in rng.sample(users, 3)],
+                likes_count=3,
+                created_at=now - timedelta(seconds=i),
+            )
+            for i in range(size)
+        ]
+    )
+    Content.objects.insert(
+        [
+            Content(
+                title=f"content {i}",
+                description="محتوا",
+                category=CATEGORIES[i % len(CATEGORIES)],
+                mood_tags=rng.sample(MOODS, 2),
+                media_url="https://example.com/audio.mp3",
+                created_at=now - timedelta(seconds=i),
+            )
+            for i in range(size)
+        ]
+    )
+
+
+def cases():
+    """``name -> (drf(raw), fast(raw), full queryset, projected queryset)``"""
+    from chat.models import Content, Message, Room
+    from chat.prefetch import prefetch_references
+    from chat.serializers import ContentSerializer, MessageSerializer, RoomSerializer
+    from chat.views.core_views import CONTENT_LIST, MESSAGE_LIST, ROOM_LIST
+
+    def message_drf(raw):
+        documents = [Message._from_son(son) for son in raw]
+        liked_ids = {documents[0].pk}
+        return MessageSerializer(
+            documents, many=True, context={"liked_ids": liked_ids}
+        ).data
+
+    def message_fast(raw):
+        liked_ids = {raw[0]["_id"]}
+        return MESSAGE_LIST.serialize(
+            raw, methods={"liked_by_me": lambda message: message["_id"] in liked_ids}
+        )
+
+    def room_drf(raw):
+        documents = [Room._from_son(son) for son in raw]
+        prefetch_references(documents, "creator")
+        return RoomSerializer(documents, many=True).data
+
+    def content_drf(raw):
+        return ContentSerializer(
+            [Content._from_son(son) for son in raw], many=True
+        ).data
+
+    newest = "-created_at"
+    return {
+        "messages": (
+            message_drf,
+            message_fast,
+            Message.objects.exclude("likes").order_by(newest),
+            MESSAGE_LIST.queryset(Message.objects.order_by(newest)),
+        ),
+        "rooms": (
+            room_drf,
+            ROOM_LIST.serialize,
+            Room.objects.order_by(newest),
+            ROOM_LIST.queryset(Room.objects.order_by(newest)),
+        ),
+        "contents": (
+            content_drf,
+            CONTENT_LIST.serialize,
+            Content.objects.order_by(newest),
+            CONTENT_LIST.queryset(Content.objects.order_by(newest)),
+        ),
+    }
+
+
+def best_of(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--page-sizes", default="50,200")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup()
+    from chat.renderers import FastJSONRenderer
+    from rest_framework.renderers import JSONRenderer
+
+    sizes = [int(size) for size in args.page_sizes.split(",")]
+    seed(max(sizes), random.Random(args.seed))
+    slow_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+    print(f"repeat={args.repeat} (best of)")
+    for name, (drf, fast, full, projected) in cases().items():
+        for size in sizes:
+            full_raw = list(full.as_pymongo()[:size])
+            projected_raw = list(projected[:size])
+            slow_bytes = slow_renderer.render(drf(full_raw))
+            fast_bytes = fast_renderer.render(fast(projected_raw))
+            if slow_bytes != fast_bytes:
+                raise SystemExit(f"{name}: fast path output differs from DRF")
+
+            slow = best_of(lambda: slow_renderer.render(drf(full_raw)), args.repeat)
+            quick = best_of(
+                lambda: fast_renderer.render(fast(projected_raw)), args.repeat
+            )
+            print(
+                f"{name:<9} page={size:<4} drf={slow / size * 1e6:7.1f}us/item "
+                f"fast={quick / size * 1e6:7.1f}us/item "
+                f"speedup={slow / quick:4.1f}x bytes={len(fast_bytes)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+"""
+End-to-end load test: virtual users replay a realistic mix of API calls and
+the throughput and p50/p95/p99 latency of every route are written as JSON.
+
+Requests go through the whole Django stack (middleware, authentication,
+throttling, serializers) in-process, against a local ``mongod`` or, without
+``--mongo-uri``, against mongomock. Each virtual user logs in with a
+password and OTP once, then picks weighted actions from ``MIX`` until the
+run ends. The target database is dropped and seeded at the start.
+
+    python benchmarks/load_test.py --users 20 --duration 60 --output run.json
+    python benchmarks/load_test.py --mongo-uri mongodb://localhost:27017/chat_loadtest
+
+Compare two runs with ``--baseline old.json``.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+# لاگ درخواست‌ها نوشته می‌شود (هزینه‌اش جزو اندازه‌گیری است) ولی خروجی را شلوغ نمی‌کند
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+PASSWORD = "load-test-password"
+MOODS = ["happy", "sad", "angry", "stressed", "relaxed", "neutral"]
+CATEGORIES = ["meditation", "music", "story", "chatbot"]
+
+# اندازه داده‌های اولیه به ازای --scale 1
+ROOMS = 50
+CHALLENGES_PER_ROOM = 4
+MESSAGES_PER_CHALLENGE = 25
+AUTHORS = 50
+CONTENTS = 200
+
+# action -> وزن نسبی در ترکیب درخواست‌ها
+MIX = {
+    "list_rooms": 10,
+    "retrieve_room": 3,
+    "create_room": 1,
+    "list_challenges": 10,
+    "retrieve_challenge": 3,
+    "create_challenge": 1,
+    "list_messages": 20,
+    "post_message": 10,
+    "bulk_post_messages": 1,
+    "like_message": 10,
+    "unlike_message": 3,
+    "message_thread": 3,
+    "report_message": 1,
+    "delete_message": 1,
+    "respond_to_challenge": 2,
+    "list_responses": 2,
+    "submit_mood": 5,
+    "mood_suggestions": 5,
+    "popular_content": 3,
+    "categories": 2,
+    "search": 2,
+    "refresh_token": 1,
+    "moderation_queue": 1,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup(args):
+    """Point Django at the load-test database and make the run repeatable"""
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from mongoengine import connect, disconnect
+
+    disconnect(alias="default")
+    if args.mongo_uri:
+        connect(host=args.mongo_uri, alias="default")
+    else:
+        import mongomock
+
+        connect(
+            "chat_loadtest",
+            host="mongodb://localhost",
+            alias="default",
+            mongo_client_class=mongomock.MongoClient,
+        )
+
+    # محدودیت‌ها بررسی می‌شوند (هزینه‌شان اندازه‌گیری می‌شود) اما هیچ‌وقت رد نمی‌کنند
+    settings.RATE_LIMIT = {
+        "DIRECTORY": tempfile.mkdtemp(prefix="load-test-ratelimit-"),
+        "RATES": {
+            scope: {kind: "1000000/s" for kind in rates}
+            for scope, rates in settings.RATE_LIMIT.get("RATES", {}).items()
+        },
+    }
+    settings.OTP_STORE = {"BACKEND": "chat.otp.MongoOTPStore"}
+    if args.bcrypt_rounds:
+        settings.PASSWORD_HASHING = {
+            **settings.PASSWORD_HASHING,
+            "ROUNDS": args.bcrypt_rounds,
+        }
+
+
+def seed(args, rng):
+    from bson import ObjectId
+    from chat.models import Challenge, Content, Message, Room, User
+
+    db = Message._get_db()
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+    now = datetime.now(timezone.utc)
+    scale = args.scale
+    hashed = None
+    users = []
+    for index in range(args.users + 1):
+        user = User(
+            username=f"load{index}",
+            phone=f"0990{index:07d}",
+            is_admin=index == args.users,
+        )
+        if hashed is None:
+            user.set_password(PASSWORD)
+            hashed = user.password
+        user.password = hashed
+        users.append(user)
+    User.objects.insert(users)
+    admin = users.pop()
+
+    authors = [str(ObjectId()) for _ in range(max(1, int(AUTHORS * scale)))]
+    rooms = [
+        Room(
+            title=f"room {index}",
+            room_type=rng.choice(["daily", "teens", "mothers"]),
+            creator=rng.choice(users),
+            created_at=now - timedelta(minutes=index),
+        )
+        for index in range(max(1, int(ROOMS * scale)))
+    ]
+    Room.objects.insert(rooms)
+    challenges = [
+        Challenge(
+            room=room,
+            title=f"challenge {index} of {room.title}",
+            expiration_time=now + timedelta(days=7),
+            created_at=now - timedelta(minutes=index),
+        )
+        for room in rooms
+        for index in range(CHALLENGES_PER_ROOM)
+    ]
+    Challenge.objects.insert(challenges)
+
+    messages = []
+    for challenge in challenges:
+        for index in range(MESSAGES_PER_CHALLENGE):
+            likes = rng.sample(authors, rng.randint(0, min(5, len(authors))))
+            messages.append(
+                Message(
+                    challenge=challenge,
+                    user_id=rng.choice(authors),
+                    content=f"seed message {index} about {challenge.title}",
+                    likes=likes,
+                    likes_count=len(likes),
+                    created_at=now - timedelta(seconds=index),
+                )
+            )
+    Message.objects.insert(messages)
+
+    Content.objects.insert(
+        [
+            Content(
+                title=f"content {index}",
+                description="load test content",
+                category=CATEGORIES[index % len(CATEGORIES)],
+                mood_tags=rng.sample(MOODS, 2),
+                is_popular=index % 5 == 0,
+                created_at=now - timedelta(hours=index),
+            )
+            for index in range(max(1, int(CONTENTS * scale)))
+        ]
+    )
+    return {
+        "users": users,
+        "admin": admin,
+        "rooms": [str(room.id) for room in rooms],
+        "challenges": [str(challenge.id) for challenge in challenges],
+        "messages": [str(message.id) for message in messages],
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # "METHOD url-name" -> [(seconds, status)]
+        self.lock = threading.Lock()
+
+    def add(self, route, seconds, status):
+        with self.lock:
+            self.samples.setdefault(route, []).append((seconds, status))
+
+    def report(self, elapsed):
+        routes = {}
+        everything = []
+        for route, samples in sorted(self.samples.items()):
+            everything += samples
+            routes[route] = summarize(samples, elapsed)
+        return routes, summarize(everything, elapsed)
+
+
+def summarize(samples, elapsed):
+    latencies = [seconds for seconds, _ in samples]
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if status >= 400),
+        "throughput_rps": round(len(samples) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0) * 1000, 3),
+        "statuses": statuses,
+    }
+
+
+class VirtualUser:
+    """One client session: OTP login, then weighted random actions"""
+
+    def __init__(self, user, data, recorder, rng, codes, search):
+        from rest_framework.test import APIClient
+
+        self.user = user
+        self.data = data
+        self.recorder = recorder
+        self.rng = rng
+        self.codes = codes
+        self.search = search
+        self.client = APIClient()
+        self.refresh = None
+        self.own_messages = []
+        self.liked = []
+        self.responded = set()
+        self.own_rooms = []
+
+    def request(self, method, path, data=None):
+        started = time.perf_counter()
+        response = getattr(self.client, method.lower())(path, data, format="json")
+        elapsed = time.perf_counter() - started
+        match = getattr(response, "resolver_match", None)
+        route = match.url_name if match else "unmatched"
+        self.recorder.add(f"{method} {route}", elapsed, response.status_code)
+        return response
+
+    def login(self):
+        credentials = {"phone": self.user.phone, "password": PASSWORD}
+        self.request("POST", "/auth/request-code/", credentials)
+        code = self.codes.get(self.user.phone)
+        response = self.request(
+            "POST", "/auth/verify-code/", {**credentials, "code": code}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"login failed for {self.user.phone}: {response.data}")
+        self.refresh = response.data["refresh"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def run(self, deadline):
+        self.login()
+        actions = [name for name in MIX if self.search or name != "search"]
+        weights = [MIX[name] for name in actions]
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+
+    def challenge(self):
+        return self.rng.choice(self.data["challenges"])
+
+    def message(self):
+        if self.own_messages and self.rng.random() < 0.2:
+            return self.rng.choice(self.own_messages)
+        return self.rng.choice(self.data["messages"])
+
+    def list_rooms(self):
+        self.request("GET", "/api/rooms/")
+
+    def retrieve_room(self):
+        self.request("GET", f"/api/rooms/{self.rng.choice(self.data['rooms'])}/")
+
+    def create_room(self):
+        response = self.request(
+            "POST", "/api/rooms/", {"title": "load test room", "room_type": "daily"}
+        )
+        if response.status_code == 201:
+            self.own_rooms.append(response.data["id"])
+
+    def list_challenges(self):
+        room = self.rng.choice(self.data["rooms"])
+        self.request("GET", f"/api/challenges/?room_id={room}")
+
+    def retrieve_challenge(self):
+        self.request("GET", f"/api/challenges/{self.challenge()}/")
+
+    def create_challenge(self):
+        room = self.rng.choice(self.own_rooms or self.data["rooms"])
+        expiration = datetime.now(timezone.utc) + timedelta(days=1)
+        self.request(
+            "POST",
+            "/api/challenges/",
+            {
+                "room": room,
+                "title": "load test challenge",
+                "expiration_time": expiration.isoformat(),
+            },
+        )
+
+    def list_messages(self):
+        response = self.request(
+            "GET", f"/api/messages/?challenge_id={self.challenge()}"
+        )
+        # بخشی از کاربران صفحه بعد را هم می‌خوانند
+        next_page = response.status_code == 200 and response.data.get("next")
+        if next_page and self.rng.random() < 0.3:
+            self.request("GET", next_page)
+
+    def post_message(self):
+        data = {"challenge": self.challenge(), "content": "load test message"}
+        if self.rng.random() < 0.3:
+            data.update(is_reply=True, parent_message=self.message())
+        response = self.request("POST", "/api/messages/", data)
+        if response.status_code == 201:
+            self.own_messages.append(response.data["id"])
+
+    def bulk_post_messages(self):
+        items = [
+            {"challenge": self.challenge(), "content": f"bulk message {index}"}
+            for index in range(20)
+        ]
+        self.request("POST", "/api/messages/bulk/", items)
+
+    def like_message(self):
+        message = self.message()
+        response = self.request("POST", f"/api/messages/{message}/like/")
+        if response.status_code == 200:
+            self.liked.append(message)
+
+    def unlike_message(self):
+        if self.liked:
+            message = self.liked.pop(self.rng.randrange(len(self.liked)))
+            self.request("DELETE", f"/api/messages/{message}/unlike/")
+
+    def message_thread(self):
+        self.request("GET", f"/api/messages/{self.message()}/thread/")
+
+    def report_message(self):
+        self.request(
+            "POST", f"/api/messages/{self.message()}/report/", {"reason": "spam"}
+        )
+
+    def delete_message(self):
+        if self.own_messages:
+            message = self.own_messages.pop(self.rng.randrange(len(self.own_messages)))
+            self.request("DELETE", f"/api/messages/{message}/")
+
+    def respond_to_challenge(self):
+        challenge = self.challenge()
+        if challenge not in self.responded:
+            self.responded.add(challenge)
+            self.request("POST", "/api/responses/", {"challenge": challenge})
+
+    def list_responses(self):
+        self.request("GET", "/api/responses/")
+
+    def submit_mood(self):
+        self.request("POST", "/api/mood/submit/", {"mood": self.rng.choice(MOODS)})
+
+    def mood_suggestions(self):
+        self.request("GET", "/api/mood/suggestions/")
+
+    def popular_content(self):
+        self.request("GET", "/api/content/popular/")
+
+    def categories(self):
+        self.request("GET", "/api/content/categories/")
+
+    def search(self):
+        self.request("GET", "/api/search/?q=message")
+
+    def refresh_token(self):
+        response = self.request("POST", "/auth/refresh/", {"refresh": self.refresh})
+        if response.status_code == 200:
+            self.client.credentials(
+                HTTP_AUTHORIZATION=f"Bearer {response.data['access']}"
+            )
+
+    def moderation_queue(self):
+        from chat.utils import generate_tokens
+        from rest_framework.test import APIClient
+
+        # صف بررسی فقط برای ادمین است؛ با توکن ادمین و کلاینت جدا خوانده می‌شود
+        client, self.client = self.client, APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {generate_tokens(self.data['admin'])[0]}"
+        )
+        try:
+            self.request("GET", "/api/moderation/cases/")
+        finally:
+            self.client = client
+
+
+def capture_otp_codes():
+    """Let virtual users read the codes the server would have sent by SMS"""
+    from chat.otp import get_otp_store
+
+    codes = {}
+    store = get_otp_store()
+    original = store.set
+
+    def set_and_capture(phone, code, ttl):
+        codes[phone] = code
+        return original(phone, code, ttl)
+
+    store.set = set_and_capture
+    return codes
+
+
+def compare(report, baseline):
+    """Percent change of p95 and throughput against an earlier run"""
+    lines = []
+    for route, current in report["routes"].items():
+        old = baseline.get("routes", {}).get(route)
+        if not old:
+            continue
+        p95 = (current["p95_ms"] - old["p95_ms"]) / (old["p95_ms"] or 1) * 100
+        rps = (
+            (current["throughput_rps"] - old["throughput_rps"])
+            / (old["throughput_rps"] or 1)
+            * 100
+        )
+        lines.append(f"{route:<40} p95 {p95:+7.1f}%  rps {rps:+7.1f}%")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--mongo-uri",
+        help="mongod to run against, including the database name "
+        "(it is dropped and reseeded); default: in-memory mongomock",
+    )
+    parser.add_argument("--scale", type=float, default=1.0, help="seed data size")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, help="override PASSWORD_HASHING ROUNDS"
+    )
+    parser.add_argument("--output", default="load-test.json")
+    parser.add_argument("--baseline", help="earlier --output to compare with")
+    args = parser.parse_args()
+
+    setup(args)
+    rng = random.Random(args.seed)
+    data = seed(args, rng)
+    codes = capture_otp_codes()
+    recorder = Recorder()
+    # جستجوی $text در mongomock پشتیبانی نمی‌شود
+    search = bool(args.mongo_uri)
+    virtual_users = [
+        VirtualUser(user, data, recorder, random.Random(rng.random()), codes, search)
+        for user in data["users"]
+    ]
+
+    print(
+        f"users={args.users} duration={args.duration}s "
+        f"backend={'mongod' if args.mongo_uri else 'mongomock'} scale={args.scale}"
+    )
+    failures = []
+
+    def run(virtual_user):
+        try:
+            virtual_user.run(deadline)
+        except Exception as e:
+            failures.append(f"{virtual_user.user.phone}: {e!r}")
+
+    started_at = datetime.now(timezone.utc)
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=run, args=(user,)) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    routes, totals = recorder.report(elapsed)
+    report = {
+        "started_at": started_at.isoformat(),
+        "revision": git_revision(),
+        "config": {
+            "users": args.users,
+            "duration": args.duration,
+            "backend": "mongod" if args.mongo_uri else "mongomock",
+            "scale": args.scale,
+            "seed": args.seed,
+            "mix": MIX,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "totals": totals,
+        "routes": routes,
+        "failures": failures,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for route, stats in routes.items():
+        print(
+            f"{route:<40} n={stats['requests']:<6} err={stats['errors']:<4} "
+            f"rps={stats['throughput_rps']:<8} p50={stats['p50_ms']:.1f}ms "
+            f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms"
+        )
+    print(
+        f"total n={totals['requests']} err={totals['errors']} "
+        f"rps={totals['throughput_rps']} -> {args.output}"
+    )
+    for failure in failures:
+        print(f"virtual user stopped: {failure}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n".join(compare(report, json.load(f))))
+
+
+if __name__ == "__main__":
+    main()
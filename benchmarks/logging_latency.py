@@ -0,0 +1,90 @@
+"""
+Request-thread cost of view logging: off vs the old synchronous FileHandler
+vs the queued JSON pipeline (with and without sampling).
+
+Each simulated request logs the same number of INFO lines as a typical
+``core_views`` request, with a short sleep standing in for each Mongo round
+trip; the time spent inside the logging calls is reported.
+
+    python benchmarks/logging_latency.py --requests 5000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat.logs import AsyncQueueHandler, SamplingFilter  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def request(logger, pk, lines, io_seconds):
+    """Time spent in logging calls, between simulated database round trips"""
+    spent = 0.0
+    for line in range(lines):
+        started = time.perf_counter()
+        logger.info("Retrieving message with id: %s (step %s)", pk, line)
+        spent += time.perf_counter() - started
+        time.sleep(io_seconds)
+    return spent
+
+
+def configure(mode, directory):
+    logger = logging.getLogger(f"bench.{mode}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if mode == "off":
+        logger.disabled = True
+    elif mode == "sync-file":
+        handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        logger.addHandler(handler)
+    else:
+        handler = AsyncQueueHandler(os.path.join(directory, f"{mode}.jsonl"))
+        if mode == "async-sampled":
+            handler.addFilter(SamplingFilter({logger.name: 0.1}))
+        logger.addHandler(handler)
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=3, help="log lines per request")
+    parser.add_argument(
+        "--io-ms", type=float, default=0.3, help="simulated I/O after each line"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"requests={args.requests} lines/request={args.lines}")
+        for mode in ("off", "sync-file", "async", "async-sampled"):
+            logger = configure(mode, directory)
+            latencies = [
+                request(logger, index, args.lines, args.io_ms / 1000)
+                for index in range(args.requests)
+            ]
+            dropped = sum(getattr(h, "dropped", 0) for h in logger.handlers)
+            for handler in logger.handlers:
+                if isinstance(handler, AsyncQueueHandler):
+                    handler.stop()
+                handler.close()
+            print(
+                f"{mode:<14} p50={percentile(latencies, 0.5) * 1e6:.1f}us "
+                f"p99={percentile(latencies, 0.99) * 1e6:.1f}us "
+                f"max={max(latencies) * 1e6:.1f}us dropped={dropped}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Login throughput under concurrency: inline bcrypt vs the process pool.
+
+Simulates ``--concurrency`` request threads each verifying passwords (the
+CPU part of a login), while a probe thread times a cheap request-like task
+to show how much logins slow everything else down.
+
+    python benchmarks/login_throughput.py --rounds 12 --concurrency 16
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat.passwords import PasswordHasher, PasswordHasherBusy  # noqa: E402
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def probe(stop, latencies):
+    """A tiny pure-Python 'other endpoint', run back to back"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(2000))
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.005)
+
+
+def run(hasher, hashed, args):
+    latencies, probe_latencies, rejected = [], [], 0
+    lock = threading.Lock()
+
+    def login(_):
+        nonlocal rejected
+        started = time.perf_counter()
+        try:
+            hasher.verify_and_update("secret-password", hashed)
+        except PasswordHasherBusy:
+            with lock:
+                rejected += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    hasher.verify_and_update("secret-password", hashed)  # استخر گرم می‌شود
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(stop, probe_latencies))
+    prober.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(login, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    return {
+        "logins/s": len(latencies) / elapsed,
+        "p50 ms": percentile(latencies, 0.5) * 1000,
+        "p95 ms": percentile(latencies, 0.95) * 1000,
+        "rejected": rejected,
+        "probe p50 ms": statistics.median(probe_latencies or [0]) * 1000,
+        "probe p95 ms": percentile(probe_latencies, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    hashed = PasswordHasher(rounds=args.rounds, workers=0).hash("secret-password")
+    modes = {
+        "inline": PasswordHasher(rounds=args.rounds, workers=0),
+        f"pool x{args.workers}": PasswordHasher(
+            rounds=args.rounds,
+            workers=args.workers,
+            max_pending=args.max_pending,
+            timeout=args.timeout,
+        ),
+    }
+    print(
+        f"bcrypt rounds={args.rounds} concurrency={args.concurrency} "
+        f"requests={args.requests}"
+    )
+    for name, hasher in modes.items():
+        result = run(hasher, hashed, args)
+        hasher.shutdown()
+        values = (
+            f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in result.items()
+        )
+        print(f"{name:<10} " + "  ".join(values))
+
+
+if __name__ == "__main__":
+    main()
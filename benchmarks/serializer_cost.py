@@ -0,0 +1,432 @@
+"""
+Serializer cost per item: ``MessageSerializer``, ``RoomSerializer``,
+``ChallengeSerializer`` and ``ContentSerializer`` over synthetic lists.
+
+Documents are built the way a queryset builds them (``_from_son``) and the
+referenced rooms and users live in an in-memory Mongo (mongomock), so the
+three reference modes can be compared:
+
+* ``embedded``   references already loaded; only DRF's field machinery is timed
+* ``prefetched`` ``prefetch_references`` then serialize (what list views do)
+* ``lazy``       each item dereferences its reference on first access
+
+The queries of the last two modes run against mongomock, so their absolute
+numbers overstate a real server; compare them with each other and over time.
+
+The create path is timed as one ``is_valid()`` per payload; for messages also
+with the context that ``bulk_create`` resolves up front. Time is the best of
+``--repeat`` runs; peak memory is measured in a separate tracemalloc pass.
+
+    python benchmarks/serializer_cost.py --sizes 1000,10000,100000 --output ser.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+
+MOODS = ["happy", "sad", "angry", "stressed", "relaxed", "neutral"]
+CATEGORIES = ["meditation", "music", "story", "chatbot"]
+# هر سند ارجاع‌شده به طور میانگین از چند آیتم فهرست ارجاع می‌گیرد
+ITEMS_PER_REFERENCE = 4
+VALIDATION_POOL = 100
+
+
+def setup():
+    import django
+
+    django.setup()
+
+    import mongomock
+    from mongoengine import connect, disconnect
+
+    disconnect(alias="default")
+    connect(
+        "chat_serializer_bench",
+        host="mongodb://localhost",
+        alias="default",
+        mongo_client_class=mongomock.MongoClient,
+    )
+
+
+class Dataset:
+    """Raw documents of every list size and the referenced documents they need"""
+
+    def __init__(self, size, rng):
+        from bson import ObjectId
+        from chat.models import Room, User
+
+        now = datetime.now(timezone.utc)
+        self.size = size
+        references = max(1, size // ITEMS_PER_REFERENCE)
+        users = [
+            {
+                "_id": ObjectId(),
+                "username": f"user{index}",
+                "phone": f"0991{index:07d}",
+                "password": "x" * 60,
+                "created_at": now,
+            }
+            for index in range(references)
+        ]
+        rooms = [
+            {
+                "_id": ObjectId(),
+                "title": f"room {index}",
+                "room_type": "daily",
+                "language": "fa",
+                "max_members": 100,
+                "creator": rng.choice(users)["_id"],
+                "is_active": True,
+                "created_at": now,
+            }
+            for index in range(references)
+        ]
+        User._get_collection().insert_many(users)
+        Room._get_collection().insert_many(rooms)
+        self.users = {user["_id"]: User._from_son(user) for user in users}
+        self.rooms = {room["_id"]: Room._from_son(room) for room in rooms}
+
+        user_ids = list(self.users)
+        room_ids = list(self.rooms)
+        self.raw = {
+            "message": [
+                {
+                    "_id": ObjectId(),
+                    "challenge": ObjectId(),
+                    "user_id": str(rng.choice(user_ids)),
+                    "content": "پیام آزمایشی " * rng.randint(1, 12),
+                    "is_reply": index % 4 == 0,
+                    "parent_message": ObjectId() if index % 4 == 0 else None,
+                    "likes_count": rng.randint(0, 50),
+                    "created_at": now - timedelta(seconds=index),
+                }
+                for index in range(size)
+            ],
+            "room": [
+                {
+                    "_id": ObjectId(),
+                    "title": f"room {index}",
+                    "description": "توضیحات اتاق",
+                    "room_type": "daily",
+                    "language": "fa",
+                    "max_members": 100,
+                    "creator": rng.choice(user_ids),
+                    "is_active": True,
+                    "created_at": now,
+                }
+                for index in range(size)
+            ],
+            "challenge": [
+                {
+                    "_id": ObjectId(),
+                    "room": rng.choice(room_ids),
+                    "title": f"challenge {index}",
+                    "description": "توضیحات چالش",
+                    "media_url": "https://example.com/media.mp4",
+                    "expiration_time": now + timedelta(days=1),
+                    "created_at": now,
+                }
+                for index in range(size)
+            ],
+            "content": [
+                {
+                    "_id": ObjectId(),
+                    "title": f"content {index}",
+                    "description": "محتوا",
+                    "category": CATEGORIES[index % len(CATEGORIES)],
+                    "mood_tags": rng.sample(MOODS, 2),
+                    "media_url": "https://example.com/audio.mp3",
+                    "is_popular": index % 5 == 0,
+                    "created_at": now,
+                }
+                for index in range(size)
+            ],
+        }
+
+    def documents(self, case, mode):
+        from chat.models import Challenge, Content, Message, Room
+
+        document_type = {
+            "message": Message,
+            "room": Room,
+            "challenge": Challenge,
+            "content": Content,
+        }[case]
+        documents = [document_type._from_son(dict(son)) for son in self.raw[case]]
+        if mode == "embedded":
+            field, pool = {"room": ("creator", self.users)}.get(
+                case, ("room", self.rooms)
+            )
+            for document in documents:
+                document._data[field] = pool[document._data[field].id]
+        return documents
+
+    def clear(self):
+        from chat.models import Room, User
+
+        User._get_collection().drop()
+        Room._get_collection().drop()
+
+
+SERIALIZE_CASES = {
+    # case -> (ReferenceField یا None، context همان view)
+    "message": (None, {"liked_ids": set()}),
+    "room": ("creator", {}),
+    "challenge": ("room", {}),
+    "content": (None, {}),
+}
+
+
+def serialize(case, documents):
+    from chat.prefetch import prefetch_references
+    from chat.serializers import (
+        ChallengeSerializer,
+        ContentSerializer,
+        MessageSerializer,
+        RoomSerializer,
+    )
+
+    serializer_class = {
+        "message": MessageSerializer,
+        "room": RoomSerializer,
+        "challenge": ChallengeSerializer,
+        "content": ContentSerializer,
+    }[case]
+    field, context = SERIALIZE_CASES[case]
+
+    def run(mode):
+        if mode == "prefetched":
+            prefetch_references(documents, field)
+        return serializer_class(documents, many=True, context=context).data
+
+    return run
+
+
+def validation_payloads(case, size, rng):
+    """Create payloads and the context ``bulk_create`` would build for them"""
+    from chat.models import Challenge, Message, Room
+
+    now = datetime.now(timezone.utc)
+    if case == "message":
+        rooms = [Room(title="room", room_type="daily") for _ in range(2)]
+        Room.objects.insert(rooms)
+        challenges = [
+            Challenge(
+                room=rng.choice(rooms), title="c", expiration_time=now + timedelta(1)
+            )
+            for _ in range(VALIDATION_POOL)
+        ]
+        Challenge.objects.insert(challenges)
+        parents = [
+            Message(challenge=rng.choice(challenges), user_id="u", content="p")
+            for _ in range(VALIDATION_POOL)
+        ]
+        Message.objects.insert(parents)
+        payloads = []
+        for index in range(size):
+            payload = {
+                "challenge": str(rng.choice(challenges).id),
+                "content": "پیام آزمایشی " * rng.randint(1, 12),
+            }
+            if index % 4 == 0:
+                payload.update(
+                    is_reply=True, parent_message=str(rng.choice(parents).id)
+                )
+            payloads.append(payload)
+        context = {
+            "challenges": {challenge.id for challenge in challenges},
+            "parent_messages": {parent.id: False for parent in parents},
+        }
+        return payloads, context
+    if case == "room":
+        return [
+            {
+                "title": f"room {index}",
+                "description": "توضیحات",
+                "room_type": "daily",
+                "max_members": 50,
+            }
+            for index in range(size)
+        ], None
+    if case == "challenge":
+        rooms = [Room(title="room", room_type="daily") for _ in range(VALIDATION_POOL)]
+        Room.objects.insert(rooms)
+        expiration = (now + timedelta(days=1)).isoformat()
+        return [
+            {
+                "room": str(rng.choice(rooms).id),
+                "title": f"challenge {index}",
+                "media_url": "https://example.com/media.mp4",
+                "expiration_time": expiration,
+            }
+            for index in range(size)
+        ], None
+    return [
+        {
+            "title": f"content {index}",
+            "category": rng.choice(CATEGORIES),
+            "mood_tags": rng.sample(MOODS, 2),
+            "media_url": "https://example.com/audio.mp3",
+        }
+        for index in range(size)
+    ], None
+
+
+def validate(case, payloads, context):
+    from chat.serializers import (
+        ChallengeSerializer,
+        ContentSerializer,
+        MessageSerializer,
+        RoomSerializer,
+    )
+
+    serializer_class = {
+        "message": MessageSerializer,
+        "room": RoomSerializer,
+        "challenge": ChallengeSerializer,
+        "content": ContentSerializer,
+    }[case]
+
+    def run(mode):
+        extra = {"context": context} if mode == "bulk-context" else {}
+        valid = 0
+        for payload in payloads:
+            valid += serializer_class(data=payload, **extra).is_valid()
+        if valid != len(payloads):
+            raise RuntimeError(f"{len(payloads) - valid} {case} payloads were invalid")
+
+    return run
+
+
+def measure(prepare, run, mode, size, repeat):
+    """Best wall time and tracemalloc peak per item of ``run(mode)``"""
+    best = None
+    for _ in range(repeat):
+        prepared = prepare()
+        gc.collect()
+        started = time.perf_counter()
+        result = run(prepared, mode)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        del result, prepared
+
+    prepared = prepare()
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = run(prepared, mode)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    del result, prepared
+    return {
+        "seconds": round(best, 6),
+        "us_per_item": round(best / size * 1e6, 3),
+        "peak_bytes_per_item": round(peak / size, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument(
+        "--cases", default=",".join(SERIALIZE_CASES), help="message,room,..."
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--lazy-max",
+        type=int,
+        default=1000,
+        help="skip the lazy mode above this size (one query per item)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="serializer-cost.json")
+    args = parser.parse_args()
+
+    setup()
+    from chat.validation_cache import validation_cache
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    cases = args.cases.split(",")
+    results = []
+
+    def report(row):
+        results.append(row)
+        print(
+            f"{row['case']:<10} {row['path']:<10} {row['mode']:<13} "
+            f"n={row['items']:<7} {row['us_per_item']:>9.1f} us/item "
+            f"{row['peak_bytes_per_item']:>9.0f} B/item"
+        )
+
+    for size in sizes:
+        rng = random.Random(args.seed)
+        dataset = Dataset(size, rng)
+        for case in cases:
+            field, _ = SERIALIZE_CASES[case]
+            modes = ["embedded", "prefetched", "lazy"] if field else ["plain"]
+            for mode in modes:
+                if mode == "lazy" and size > args.lazy_max:
+                    continue
+                row = measure(
+                    lambda: dataset.documents(case, mode),
+                    lambda documents, mode: serialize(case, documents)(mode),
+                    mode,
+                    size,
+                    args.repeat,
+                )
+                report(
+                    {
+                        "case": case,
+                        "path": "serialize",
+                        "mode": mode,
+                        "items": size,
+                        **row,
+                    }
+                )
+        dataset.clear()
+
+        for case in cases:
+            payloads, context = validation_payloads(case, size, rng)
+            modes = ["single", "bulk-context"] if context else ["single"]
+            for mode in modes:
+                validation_cache.clear()
+                row = measure(
+                    lambda: None,
+                    lambda _, mode: validate(case, payloads, context)(mode),
+                    mode,
+                    size,
+                    args.repeat,
+                )
+                report(
+                    {
+                        "case": case,
+                        "path": "validate",
+                        "mode": mode,
+                        "items": size,
+                        **row,
+                    }
+                )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "config": vars(args),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,27 @@
+import logging
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from chat.metrics import MongoCommandListener
+        from django.conf import settings
+        from mongoengine import connect
+        from pymongo import monitoring
+        from pymongo.errors import ConnectionFailure
+
+        # شنونده‌های سراسری فقط به MongoClient هایی که بعداً ساخته می‌شوند وصل می‌شوند
+        monitoring.register(MongoCommandListener())
+        try:
+            connect(**settings.MONGODB)
+            logger.info("✅ اتصال به MongoDB با موفقیت برقرار شد.")
+        except ConnectionFailure as e:
+            logger.error("❌ اتصال به MongoDB شکست خورد: %s", e)
+        except Exception as e:
+            logger.error("❌ خطای غیرمنتظره در اتصال به MongoDB: %s", e)
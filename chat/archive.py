@@ -0,0 +1,198 @@
+# chat/archive.py
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from chat.cache import TTLCache
+from chat.metrics import register_cache
+from chat.models import Challenge, Message, MessageArchiveState
+from django.conf import settings
+from mongoengine.queryset import QuerySet
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, "MESSAGE_ARCHIVE", {})
+ARCHIVE_COLLECTION = _config.get("COLLECTION", "messages_archive")
+
+# وضعیت بایگانی هر چالش؛ پس از تغییر وضعیت، بقیه پروسه‌ها حداکثر تا TTL قدیمی می‌مانند
+archived_challenges = TTLCache(maxsize=10000, ttl=_config.get("STATE_TTL", 30))
+register_cache("archived_challenges", archived_challenges)
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def archive_collection():
+    """The archive collection, with the same indexes as ``messages``"""
+    global _indexes_ready
+    collection = Message._get_db()[ARCHIVE_COLLECTION]
+    if not _indexes_ready:
+        with _indexes_lock:
+            if not _indexes_ready:
+                for spec in Message._meta["index_specs"]:
+                    options = {k: v for k, v in spec.items() if k != "fields"}
+                    collection.create_index(spec["fields"], background=True, **options)
+                _indexes_ready = True
+    return collection
+
+
+def archived_messages():
+    """Message queryset reading from the archive collection"""
+    return QuerySet(Message, archive_collection())
+
+
+def is_challenge_archived(challenge_id):
+    key = str(challenge_id)
+    archived = archived_challenges.get(key)
+    if archived is None:
+        archived = (
+            ObjectId.is_valid(key)
+            and MessageArchiveState.objects(challenge=ObjectId(key), state="archived")
+            .only("id")
+            .first()
+            is not None
+        )
+        archived_challenges.set(key, archived)
+    return archived
+
+
+def prefetch_archive_states(challenge_ids):
+    """Fill ``archived_challenges`` for many challenges with one query"""
+    missing = [pk for pk in challenge_ids if archived_challenges.get(str(pk)) is None]
+    if not missing:
+        return
+    archived = set(
+        MessageArchiveState.objects(challenge__in=missing, state="archived").scalar(
+            "challenge"
+        )
+    )
+    for pk in missing:
+        archived_challenges.set(str(pk), pk in archived)
+
+
+def messages_for_challenge(challenge_id):
+    """Messages of a challenge, from the archive once it has been moved there"""
+    if is_challenge_archived(challenge_id):
+        return archived_messages().filter(challenge=challenge_id)
+    return Message.objects(challenge=challenge_id)
+
+
+def modify_message(message_id, **update):
+    """
+    ``modify(new=True, **update)`` on a message in the hot collection or, once
+    its challenge has been moved there, in the archive. Returns the updated
+    message, or ``None`` if it is in neither.
+    """
+    message = Message.objects(id=message_id).modify(new=True, **update)
+    if message is None:
+        message = archived_messages().filter(id=message_id).modify(new=True, **update)
+    return message
+
+
+class MessageArchiver:
+    """
+    Move the messages of finished challenges out of the hot collection.
+
+    Per challenge: copy every message to the archive, switch reads to the
+    archive, wait ``grace`` seconds for other workers to notice, then copy
+    and delete whatever is left in batches. Every step is idempotent, so an
+    interrupted run simply resumes on the next invocation.
+    """
+
+    def __init__(self, batch_size=500, pause=0.1, grace=None):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.grace = archived_challenges.ttl if grace is None else grace
+        self.hot = Message._get_collection()
+        self.archive = archive_collection()
+
+    def candidates(self, older_than_days):
+        """Challenges with hot messages that are expired, deleted or old"""
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=older_than_days)
+        challenge_ids = [pk for pk in self.hot.distinct("challenge") if pk is not None]
+        live = set(
+            Challenge.objects(
+                id__in=challenge_ids, expiration_time__gt=now, created_at__gt=cutoff
+            ).scalar("id")
+        )
+        return [pk for pk in challenge_ids if pk not in live]
+
+    def copy(self, documents):
+        if not documents:
+            return 0
+        try:
+            return len(self.archive.insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # پیام‌هایی که قبلاً کپی شده‌اند (اجرای قبلی نیمه‌کاره) نادیده گرفته می‌شوند
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            return e.details.get("nInserted", 0)
+
+    def copy_all(self, challenge_id):
+        copied = 0
+        batch = []
+        cursor = self.hot.find({"challenge": challenge_id}).batch_size(self.batch_size)
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                copied += self.copy(batch)
+                batch = []
+                time.sleep(self.pause)
+        copied += self.copy(batch)
+        return copied
+
+    def move_remaining(self, challenge_id):
+        deleted = 0
+        while True:
+            batch = list(
+                self.hot.find({"challenge": challenge_id}).limit(self.batch_size)
+            )
+            if not batch:
+                return deleted
+            # نسخه داغ از کپی قبلی تازه‌تر است (حذف نرم، لایک...) و جایگزین آن می‌شود
+            self.archive.bulk_write(
+                [
+                    ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+                    for document in batch
+                ],
+                ordered=False,
+            )
+            # فقط اسنادی حذف می‌شوند که از زمان خواندن تغییر نکرده‌اند؛ بقیه دوباره کپی می‌شوند
+            result = self.hot.bulk_write(
+                [DeleteOne(document) for document in batch], ordered=False
+            )
+            deleted += result.deleted_count
+            time.sleep(self.pause)
+
+    def archive_challenge(self, challenge_id):
+        state = MessageArchiveState.objects(challenge=challenge_id).modify(
+            upsert=True,
+            new=True,
+            set_on_insert__state="copying",
+            set_on_insert__started_at=datetime.now(timezone.utc),
+        )
+        if state.state == "copying":
+            state.copied = self.copy_all(challenge_id)
+            state.state = "archived"
+            state.archived_at = datetime.now(timezone.utc)
+            state.save()
+            archived_challenges.invalidate(str(challenge_id))
+            logger.info("Challenge %s switched to archive reads", challenge_id)
+            time.sleep(self.grace)
+
+        state.deleted += self.move_remaining(challenge_id)
+        state.completed_at = datetime.now(timezone.utc)
+        state.save()
+        logger.info(
+            "Challenge %s archived: %d copied, %d removed from the hot collection",
+            challenge_id,
+            state.copied,
+            state.deleted,
+        )
+        return state
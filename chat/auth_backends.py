@@ -1,13 +1,21 @@
 # chat/auth_backends.py
 
 import jwt
-from chat.models import User
+from chat.revocation import revocations
+from chat.user_cache import get_user_by_phone, invalidate_user
 from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import BasePermission
 
 
+def is_user_banned(user, claims=None):
+    """Ban status from the revocation registry, or the user document for old tokens"""
+    if claims and "uid" in claims:
+        return revocations.is_banned(claims["uid"])
+    return getattr(user, "is_banned", False)
+
+
 class MongoJWTAuthentication(BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get("Authorization")
@@ -15,17 +23,37 @@ class MongoJWTAuthentication(BaseAuthentication):
             return None
 
         token = auth_header.split(" ")[1]
+        user, claims = self.authenticate_credentials(token)
+        request.mongo_user = user  # attach user to request
+        return (user, claims)
+
+    def authenticate_header(self, request):
+        # توکن نامعتبر یا باطل شده 401 می‌گیرد، نه 403
+        return 'Bearer realm="api"'
+
+    def authenticate_credentials(self, token):
+        """Return the user an access token belongs to and the token's claims"""
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
             phone = payload.get("phone")
             if not phone:
                 raise AuthenticationFailed("Invalid token payload: phone not found")
-
-            user = User.objects(phone=phone).first()
+            if revocations.is_revoked(payload):
+                raise AuthenticationFailed("Token has been revoked")
+
+            # کاربر از کش خوانده می‌شود؛ تغییرات کاربر باید invalidate_user را صدا بزنند
+            user = get_user_by_phone(phone)
+            uid = payload.get("uid")
+            if user is not None and uid and str(user.id) != uid:
+                # شاید کش سند کاربر قبلی همین شماره را نگه داشته باشد
+                invalidate_user(user)
+                user = get_user_by_phone(phone)
             if user is None:
                 raise AuthenticationFailed("User not found")
-            request.mongo_user = user  # attach user to request
-            return (user, None)
+            # توکن کاربر حذف‌شده نباید برای کاربر جدید همان شماره معتبر باشد
+            if uid and str(user.id) != uid:
+                raise AuthenticationFailed("Token user no longer exists")
+            return user, payload
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed("Token has expired")
         except jwt.InvalidTokenError:
@@ -48,7 +76,8 @@ class IsNotBanned(BasePermission):
 
     def has_permission(self, request, view):
         user = getattr(request, "mongo_user", None)
-        return user and not getattr(user, "is_banned", False)
+        # از claim های توکن و فهرست ابطال خوانده می‌شود، بدون کوئری
+        return user and not is_user_banned(user, request.auth)
 
 
 class IsRoomCreator(BasePermission):
@@ -0,0 +1,68 @@
+# chat/conditional.py
+import hashlib
+
+from chat.cache import TTLCache
+from chat.metrics import register_cache
+from chat.models import Content
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+_config = getattr(settings, "CONTENT_CACHE", {})
+content_versions = TTLCache(maxsize=1, ttl=_config.get("VERSION_TTL", 10))
+register_cache("content_versions", content_versions)
+CONTENT_MAX_AGE = _config.get("MAX_AGE", 60)
+
+
+def content_version():
+    """
+    Marker that changes whenever content is added, removed or saved: the
+    document count (collection metadata) and the newest ``updated_at`` (one
+    index entry). Each worker reuses it for ``VERSION_TTL`` seconds.
+    """
+
+    def load():
+        latest = (
+            Content.objects.order_by("-updated_at")
+            .only("updated_at")
+            .as_pymongo()
+            .first()
+        )
+        updated_at = latest.get("updated_at") if latest else None
+        count = Content._get_collection().estimated_document_count()
+        return f"{count}:{updated_at.isoformat() if updated_at else ''}"
+
+    return content_versions.get_or_load("contents", load)
+
+
+def content_etag(*parts):
+    """Strong ETag of a response built from the content collection and ``parts``"""
+    key = ":".join(str(part) for part in (content_version(), *parts))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def if_none_match(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    # If-None-Match با مقایسه ضعیف سنجیده می‌شود
+    return etags == ["*"] or etag in {tag.removeprefix("W/") for tag in etags}
+
+
+def conditional_get(request, etag, build, private=False):
+    """
+    ``304 Not Modified`` when the client's ``If-None-Match`` matches
+    ``etag``, without calling ``build``; otherwise ``build()``. Both carry
+    the ``ETag`` and a ``Cache-Control`` of ``CONTENT_MAX_AGE`` seconds.
+    """
+    if if_none_match(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = build()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        visibility = {"private": True} if private else {"public": True}
+        patch_cache_control(response, max_age=CONTENT_MAX_AGE, **visibility)
+    return response
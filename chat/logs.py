@@ -0,0 +1,100 @@
+# chat/logs.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+# فیلدهای استاندارد LogRecord؛ بقیه (extra=...) در خروجی JSON می‌آیند
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extras"""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the INFO/DEBUG records of noisy loggers, e.g.
+    ``rates={"chat.views.core_views": 0.1}``. With ``functions``, only
+    records logged from functions of those names (the read paths) are
+    sampled. Warnings and errors always pass.
+    """
+
+    def __init__(self, rates=None, functions=None, name=""):
+        super().__init__(name)
+        self.rates = rates or {}
+        self.functions = frozenset(functions) if functions else None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.functions is not None and record.funcName not in self.functions:
+            return True
+        rate = self.rates.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Put records on a bounded in-memory queue and write them as JSON lines
+    from a background thread, to ``filename`` or stderr. The message is
+    formatted by the writer, not the request thread. When the queue is full
+    records are dropped and counted in ``dropped``, never blocking the caller.
+    """
+
+    def __init__(self, filename=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.filename = filename
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self.start()
+        atexit.register(self.stop)
+
+    def start(self):
+        if self.filename:
+            target = WatchedFileHandler(self.filename, encoding="utf-8")
+        else:
+            target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+
+    def prepare(self, record):
+        # برخلاف QueueHandler پیام اینجا ساخته نمی‌شود؛ نویسنده آن را قالب‌بندی می‌کند
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            # worker های fork شده رشته نویسنده پدر را ندارند
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
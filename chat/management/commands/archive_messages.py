@@ -0,0 +1,61 @@
+from chat.archive import MessageArchiver
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages of expired, deleted or old challenges to the archive "
+        "collection in throttled, resumable batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=30,
+            help="Also archive live challenges created before this many days ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds to sleep between batches",
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=None,
+            help="Seconds between switching reads and deleting hot messages "
+            "(defaults to the archive state cache TTL)",
+        )
+        parser.add_argument(
+            "--max-challenges",
+            type=int,
+            default=None,
+            help="Stop after archiving this many challenges",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        archiver = MessageArchiver(
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+            grace=options["grace"],
+        )
+        candidates = archiver.candidates(options["older_than_days"])
+        if options["max_challenges"] is not None:
+            candidates = candidates[: options["max_challenges"]]
+        self.stdout.write(f"{len(candidates)} challenges to archive")
+        if options["dry_run"]:
+            for challenge_id in candidates:
+                self.stdout.write(str(challenge_id))
+            return
+
+        for challenge_id in candidates:
+            state = archiver.archive_challenge(challenge_id)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{challenge_id}: {state.copied} copied, {state.deleted} removed"
+                )
+            )
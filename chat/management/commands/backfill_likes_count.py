@@ -0,0 +1,24 @@
+from chat.models import Message
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Populate Message.likes_count for messages saved before the counter existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute the counter for every message, not only missing ones",
+        )
+
+    def handle(self, *args, **options):
+        query = {} if options["all"] else {"likes_count": {"$exists": False}}
+        # محاسبه در سمت سرور با update pipeline؛ بدون انتقال آرایه likes
+        result = Message._get_collection().update_many(
+            query,
+            [{"$set": {"likes_count": {"$size": {"$ifNull": ["$likes", []]}}}}],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{result.modified_count} messages updated")
+        )
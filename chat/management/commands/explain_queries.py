@@ -0,0 +1,266 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from chat.models import (
+    Challenge,
+    ChallengeResponse,
+    Content,
+    Message,
+    MessageArchiveState,
+    MessageReport,
+    ModerationCase,
+    OTPCode,
+    Room,
+    User,
+    UserMood,
+)
+from chat.pagination import KeysetPagination
+from chat.validation_cache import CHALLENGE_FIELDS
+from chat.views.core_views import MessageViewSet, thread_pipeline
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine import Document
+from mongoengine.queryset import QuerySet
+
+# اندازه صفحه پیش‌فرض KeysetPagination به اضافه یک
+PAGE_LIMIT = 51
+
+
+def keyset_page(queryset, field="created_at"):
+    return queryset.order_by(f"-{field}", "-id").limit(PAGE_LIMIT)
+
+
+def keyset_next_page(queryset, field="created_at"):
+    """The page after the first one, filtered like ``KeysetPagination``"""
+    last = (
+        queryset.order_by(f"-{field}", "-id")
+        .skip(PAGE_LIMIT - 2)
+        .only(field)
+        .as_pymongo()
+        .first()
+    )
+    position = (
+        (last[field], last["_id"]) if last else (datetime.now(timezone.utc), ObjectId())
+    )
+    return keyset_page(KeysetPagination(field).after(queryset, position), field)
+
+
+def explain_aggregate(document_type, pipeline):
+    collection = document_type._get_collection()
+    explain = collection.database.command(
+        "explain",
+        {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="executionStats",
+    )
+    # بدون pushdown کامل، برنامه کوئری در مرحله $cursor اول است
+    stages = explain.get("stages")
+    return stages[0].get("$cursor", {}) if stages else explain
+
+
+def sample_id(document_type):
+    pk = document_type.objects.scalar("id").first()
+    return pk or ObjectId()
+
+
+def iter_stages(plan):
+    """Yield every stage of an explain plan tree (classic and SBE layouts)"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        yield from iter_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from iter_stages(child)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run explain() on the queries issued by chat.views.core_views and flag "
+        "collection scans, in-memory sorts and poor docs-examined ratios"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ensure-indexes",
+            action="store_true",
+            help="Create the indexes declared on the models before explaining",
+        )
+        parser.add_argument(
+            "--max-ratio",
+            type=float,
+            default=2.0,
+            help="Flag queries examining more than this many docs per doc returned",
+        )
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with an error if any query is flagged",
+        )
+
+    def get_queries(self):
+        """
+        (name, query) pairs mirroring the view queries; a query is a queryset
+        or a callable returning the explain output of an aggregation
+        """
+        room_id = sample_id(Room)
+        challenge_id = sample_id(Challenge)
+        message_id = sample_id(Message)
+        user = User.objects.only("id", "phone").first()
+        user_id = user.id if user else ObjectId()
+        phone = user.phone if user else ""
+        mood = UserMood.objects.scalar("mood").first() or "happy"
+
+        return [
+            # auth_backends.MongoJWTAuthentication
+            ("auth:user-by-phone", User.objects(phone=phone).limit(1)),
+            # chat.revocation.RevocationRegistry
+            (
+                "revocations:refresh",
+                User.objects(tokens_revoked_at__gte=datetime.now(timezone.utc)),
+            ),
+            # RoomViewSet
+            ("room-list", keyset_page(Room.objects(is_active=True))),
+            ("room-list:next", keyset_next_page(Room.objects(is_active=True))),
+            ("room-detail", Room.objects(id=room_id).limit(1)),
+            # ChallengeViewSet
+            ("challenge-list", keyset_page(Challenge.objects())),
+            ("challenge-list:room", keyset_page(Challenge.objects(room=room_id))),
+            ("challenge-detail", Challenge.objects(id=challenge_id).limit(1)),
+            # MessageViewSet
+            ("message-list", keyset_page(Message.objects(is_deleted=False))),
+            (
+                "message-list:challenge",
+                keyset_page(Message.objects(challenge=challenge_id, is_deleted=False)),
+            ),
+            (
+                "message-list:challenge-next",
+                keyset_next_page(
+                    Message.objects(challenge=challenge_id, is_deleted=False)
+                ),
+            ),
+            (
+                "message-list:liked-ids",
+                Message.objects(id__in=[message_id], likes=str(user_id)).only("id"),
+            ),
+            ("message-detail", Message.objects(id=message_id).limit(1)),
+            (
+                "message-thread",
+                lambda: explain_aggregate(
+                    Message,
+                    thread_pipeline(
+                        Message._get_collection_name(),
+                        message_id,
+                        MessageViewSet.thread_default_depth,
+                        MessageViewSet.thread_default_size,
+                    ),
+                ),
+            ),
+            # هر سطح $graphLookup پاسخ‌ها را با parent_message پیدا می‌کند؛
+            # explain مرحله $graphLookup ایندکس آن را نشان نمی‌دهد
+            (
+                "message-thread:replies",
+                Message.objects(parent_message__in=[message_id]),
+            ),
+            # bulk_create: وضعیت چالش‌ها، بایگانی و پیام‌های والد با $in
+            (
+                "message-bulk:challenges",
+                Challenge.objects(id__in=[challenge_id]).only(*CHALLENGE_FIELDS),
+            ),
+            (
+                "message-bulk:archive-states",
+                MessageArchiveState.objects(
+                    challenge__in=[challenge_id], state="archived"
+                ).only("challenge"),
+            ),
+            (
+                "message-bulk:parents",
+                Message.objects(id__in=[message_id]).only("is_deleted"),
+            ),
+            ("message-report", MessageReport.objects(message=message_id).limit(1)),
+            # ModerationCaseViewSet
+            (
+                "moderation-queue",
+                keyset_page(ModerationCase.objects(resolved=False), "last_reported_at"),
+            ),
+            (
+                "moderation-queue:next",
+                keyset_next_page(
+                    ModerationCase.objects(resolved=False), "last_reported_at"
+                ),
+            ),
+            # ChallengeResponseViewSet
+            (
+                "response-list",
+                keyset_page(
+                    ChallengeResponse.objects(user_id=str(user_id)), "answered_at"
+                ),
+            ),
+            # MoodSuggestionsAPIView / PopularContentAPIView
+            (
+                "mood-last",
+                UserMood.objects(user=user_id).order_by("-created_at").limit(1),
+            ),
+            (
+                "mood-suggestions",
+                Content.objects(mood_tags=mood).order_by("-created_at").limit(20),
+            ),
+            (
+                "popular-content",
+                Content.objects(is_popular=True).order_by("-created_at").limit(10),
+            ),
+            # SearchAPIView
+            (
+                "search:messages",
+                Message.objects(is_deleted=False)
+                .search_text("سلام", language="none")
+                .order_by("$text_score")
+                .limit(21),
+            ),
+            (
+                "search:content",
+                Content.objects.search_text("سلام", language="none")
+                .order_by("$text_score")
+                .limit(21),
+            ),
+            # auth_views
+            ("otp-by-phone", OTPCode.objects(phone=phone).limit(1)),
+        ]
+
+    def analyze(self, explain):
+        planner = explain.get("queryPlanner", {})
+        stats = explain.get("executionStats", {})
+        stages = [stage["stage"] for stage in iter_stages(planner.get("winningPlan"))]
+        issues = []
+        if "COLLSCAN" in stages:
+            issues.append("COLLSCAN")
+        if "SORT" in stages:
+            issues.append("in-memory SORT")
+        examined = stats.get("totalDocsExamined", 0)
+        returned = stats.get("nReturned", 0)
+        return stages, examined, stats.get("totalKeysExamined", 0), returned, issues
+
+    def handle(self, *args, **options):
+        if options["ensure_indexes"]:
+            for document_type in Document.__subclasses__():
+                if document_type.__module__ == "chat.models":
+                    document_type.ensure_indexes()
+            self.stdout.write("Indexes ensured")
+
+        flagged = 0
+        for name, query in self.get_queries():
+            explain = query.explain() if isinstance(query, QuerySet) else query()
+            stages, examined, keys, returned, issues = self.analyze(explain)
+            if examined > options["max_ratio"] * max(returned, 1):
+                issues.append(f"examined {examined} docs for {returned}")
+            line = (
+                f"{name:<26} {' <- '.join(stages):<40} "
+                f"keys={keys} docs={examined} returned={returned}"
+            )
+            if issues:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f"{line}  [{', '.join(issues)}]"))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if flagged and options["fail"]:
+            raise CommandError(f"{flagged} queries need attention")
@@ -0,0 +1,55 @@
+from chat.models import Content, Message
+from chat.search import normalize_persian
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+
+class Command(BaseCommand):
+    help = "Recompute the normalized search fields of messages and contents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only process documents that have never been normalized",
+        )
+
+    def rebuild(self, document_type, sources, batch_size, missing_only):
+        """``sources`` maps each search field to the field it is computed from"""
+        query = {}
+        if missing_only:
+            query = {next(iter(sources)): {"$exists": False}}
+        collection = document_type._get_collection()
+        cursor = collection.find(query, {source: 1 for source in sources.values()})
+
+        updated = 0
+        batch = []
+        for document in cursor.batch_size(batch_size):
+            values = {
+                target: normalize_persian(document.get(source))
+                for target, source in sources.items()
+            }
+            batch.append(UpdateOne({"_id": document["_id"]}, {"$set": values}))
+            if len(batch) >= batch_size:
+                updated += collection.bulk_write(batch, ordered=False).modified_count
+                batch = []
+        if batch:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+        return updated
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        missing_only = options["missing_only"]
+        messages = self.rebuild(
+            Message, {"search_text": "content"}, batch_size, missing_only
+        )
+        contents = self.rebuild(
+            Content,
+            {"search_title": "title", "search_description": "description"},
+            batch_size,
+            missing_only,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{messages} messages and {contents} contents updated")
+        )
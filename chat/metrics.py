@@ -0,0 +1,312 @@
+# chat/metrics.py
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram",
+        "Request latency by resolved URL name",
+        LATENCY_BUCKETS,
+    ),
+    "http_request_mongo_commands": (
+        "histogram",
+        "Mongo commands issued while serving one request",
+        COUNT_BUCKETS,
+    ),
+    "mongo_commands_total": (
+        "counter",
+        "Mongo commands by view, collection and operation",
+        None,
+    ),
+    "mongo_command_duration_seconds": (
+        "histogram",
+        "Mongo command latency by collection and operation",
+        COMMAND_BUCKETS,
+    ),
+    "mongo_command_failures_total": (
+        "counter",
+        "Failed Mongo commands by collection and operation",
+        None,
+    ),
+    "cache_hits_total": ("counter", "In-process cache hits by cache", None),
+    "cache_misses_total": ("counter", "In-process cache misses by cache", None),
+    "cache_evictions_total": (
+        "counter",
+        "In-process cache entries dropped to stay within maxsize",
+        None,
+    ),
+}
+
+# کش‌های درون پروسه (chat.cache.TTLCache) که آمارشان در /metrics می‌آید
+CACHES = {}
+
+
+def register_cache(name, cache):
+    """Report the hits, misses and evictions of ``cache`` as ``cache=name``"""
+    CACHES[name] = cache
+
+
+# شمارش دستورات Mongo درخواست جاری (middleware مقداردهی می‌کند)
+_current_request = ContextVar("metrics_request", default=None)
+
+
+class RequestStats:
+    __slots__ = ("view", "commands")
+
+    def __init__(self):
+        self.view = None
+        self.commands = 0
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of one worker process. Every ``flush_interval``
+    seconds the totals are written to a diskcache directory under a key
+    unique to the process; ``/metrics`` adds up the snapshots of all workers.
+    Totals only grow, so summing them is safe.
+    """
+
+    def __init__(self, directory=None, flush_interval=5, retention=86400):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._cache = None
+        self._key = None
+        self._next_flush = 0
+        # worker های fork شده (gunicorn --preload) با شمارنده‌های خالی شروع می‌کنند
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._cache = None
+        self._key = None
+        self._next_flush = 0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def snapshot(self):
+        counters = {}
+        for name, cache in CACHES.items():
+            stats = cache.stats()
+            for field in ("hits", "misses", "evictions"):
+                counters[(f"cache_{field}_total", (("cache", name),))] = stats[field]
+        with self._lock:
+            return {
+                "counters": {**self._counters, **counters},
+                "histograms": {
+                    key: (list(counts), total)
+                    for key, (counts, total) in self._histograms.items()
+                },
+            }
+
+    def get_cache(self):
+        if self._cache is None:
+            from diskcache import Cache
+
+            self._cache = Cache(self.directory)
+            self._key = f"metrics:{os.getpid()}:{time.time()}"
+        return self._cache
+
+    def flush(self, force=False):
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_flush:
+            return
+        self._next_flush = now + self.flush_interval
+        try:
+            cache = self.get_cache()
+            cache.set(self._key, self.snapshot(), expire=self.retention)
+        except Exception as e:
+            logger.error("Could not flush metrics: %s", e)
+
+    def collect(self):
+        """Totals of every worker (or only this process without a directory)"""
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush(force=True)
+        cache = self.get_cache()
+        snapshots = []
+        for key in list(cache.iterkeys()):
+            if isinstance(key, str) and key.startswith("metrics:"):
+                snapshot = cache.get(key)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        counters, histograms = {}, {}
+        for snapshot in self.collect():
+            for key, value in snapshot["counters"].items():
+                counters[key] = counters.get(key, 0) + value
+            for key, (counts, total) in snapshot["histograms"].items():
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(
+                        f"{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry; built lazily because settings import this module"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = getattr(settings, "METRICS", {})
+                _registry = MetricsRegistry(
+                    directory=config.get("DIRECTORY"),
+                    flush_interval=config.get("FLUSH_INTERVAL", 5),
+                )
+    return _registry
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Time every Mongo command and charge it to the request being served"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        value = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            value = event.command.get("collection")
+        collection = value if isinstance(value, str) else ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, failed):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        labels = (("collection", collection), ("command", event.command_name))
+        registry = get_registry()
+        registry.observe(
+            "mongo_command_duration_seconds", labels, event.duration_micros / 1e6
+        )
+        if failed:
+            registry.inc("mongo_command_failures_total", labels)
+        stats = _current_request.get()
+        view = stats.view if stats else None
+        if stats is not None:
+            stats.commands += 1
+        registry.inc("mongo_commands_total", (("view", view or ""),) + labels)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+class MetricsMiddleware:
+    """Latency and Mongo command count per resolved URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name if match else None) or "unmatched"
+        labels = (
+            ("view", view),
+            ("method", request.method),
+            ("status", str(response.status_code)),
+        )
+        registry = get_registry()
+        registry.observe("http_request_duration_seconds", labels, duration)
+        registry.observe(
+            "http_request_mongo_commands", (("view", view),), stats.commands
+        )
+        registry.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # از اینجا دستورات Mongo به نام این view نسبت داده می‌شوند
+        stats = _current_request.get()
+        if stats is not None and request.resolver_match:
+            stats.view = request.resolver_match.url_name
+        return None
+
+
+def metrics_view(request):
+    """Prometheus text exposition of every worker's metrics"""
+    token = getattr(settings, "METRICS", {}).get("TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(
+        get_registry().render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
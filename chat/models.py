@@ -1,9 +1,9 @@
 from datetime import datetime, timezone
 
 from mongoengine import BooleanField, DateTimeField, Document, StringField, fields
-from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .passwords import hash_password, verify_and_update
+from .search import normalize_persian
 
 
 class User(Document):
@@ -13,17 +13,35 @@ class User(Document):
     email = fields.EmailField()
     is_banned = fields.BooleanField(default=False)
     is_admin = BooleanField(default=False)
+    # با هر ابطال افزایش می‌یابد؛ توکن‌های با نسخه کمتر پذیرفته نمی‌شوند
+    token_version = fields.IntField(default=0)
+    tokens_revoked_at = fields.DateTimeField()
     created_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {"collection": "users", "indexes": ["phone"]}
+    meta = {
+        "collection": "users",
+        "indexes": [
+            "phone",
+            {"fields": ["tokens_revoked_at"], "sparse": True},
+            {
+                "fields": ["is_banned"],
+                "partialFilterExpression": {"is_banned": True},
+            },
+        ],
+    }
 
     def set_password(self, raw_password):
-        self.password = pwd_context.hash(raw_password)
+        self.password = hash_password(raw_password)
 
     def check_password(self, raw_password):
         if not self.password:
             return False
-        return pwd_context.verify(raw_password, self.password)
+        valid, new_hash = verify_and_update(raw_password, self.password)
+        if valid and new_hash:
+            # هزینه bcrypt تغییر کرده؛ هش با هزینه جدید جایگزین می‌شود
+            self.password = new_hash
+            User.objects(id=self.id).update_one(set__password=new_hash)
+        return valid
 
 
 class Room(Document):
@@ -47,7 +65,8 @@ class Room(Document):
         "indexes": [
             "room_type",
             "creator",
-            {"fields": ["-created_at"], "sparse": True},
+            # لیست اتاق‌های فعال: فیلتر و مرتب‌سازی (created_at, _id) با یک ایندکس
+            ("is_active", "-created_at", "-id"),
         ],
     }
 
@@ -62,7 +81,11 @@ class Challenge(Document):
 
     meta = {
         "collection": "challenges",
-        "indexes": ["room", {"fields": ["expiration_time"], "expireAfterSeconds": 0}],
+        "indexes": [
+            ("room", "-created_at", "-id"),
+            ("-created_at", "-id"),
+            {"fields": ["expiration_time"], "expireAfterSeconds": 0},
+        ],
     }
 
 
@@ -81,17 +104,87 @@ class Message(Document):
     is_reported = fields.BooleanField(default=False)
     is_deleted = fields.BooleanField(default=False)
     likes = fields.ListField(fields.StringField())  # شناسه کاربران لایک‌کننده
+    likes_count = fields.IntField(default=0)  # همگام با likes در لایک/آنلایک اتمیک
+    search_text = fields.StringField()  # متن نرمال‌شده برای جستجو
 
     meta = {
         "collection": "messages",
         "indexes": [
-            "challenge",
+            # پیام‌های یک چالش؛ پیشوند challenge برای حذف آبشاری هم کافی است
+            ("challenge", "is_deleted", "-created_at", "-id"),
+            {
+                "fields": ["-created_at", "-id"],
+                "partialFilterExpression": {"is_deleted": False},
+            },
             "user_id",
-            {"fields": ["-created_at"], "sparse": True},
+            # پیمایش رشته پاسخ‌ها با $graphLookup
+            "parent_message",
+            {"fields": ["$search_text"], "default_language": "none"},
+        ],
+    }
+
+    def clean(self):
+        self.search_text = normalize_persian(self.content)
+
+
+class MessageReport(Document):
+    """One user's report of a message; reporting again updates the reason"""
+
+    message = fields.ReferenceField(Message, required=True)
+    reporter_id = fields.StringField(required=True)
+    reason = fields.StringField(max_length=500)
+    created_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
+
+    meta = {
+        "collection": "message_reports",
+        "indexes": [
+            {"fields": ["message", "reporter_id"], "unique": True},
+            ("message", "-created_at", "-id"),
         ],
     }
 
 
+class ModerationCase(Document):
+    """Per-message aggregate of reports, worked through by moderators"""
+
+    message = fields.ReferenceField(Message, required=True, unique=True)
+    report_count = fields.IntField(default=0)
+    last_reason = fields.StringField()
+    first_reported_at = fields.DateTimeField()
+    last_reported_at = fields.DateTimeField()
+    resolved = fields.BooleanField(default=False)
+    resolution = fields.StringField(choices=["dismissed", "deleted"])
+    resolved_by = fields.StringField()
+    resolved_at = fields.DateTimeField()
+
+    meta = {
+        "collection": "moderation_cases",
+        "indexes": [
+            # صف بررسی فقط موارد حل‌نشده را نگه می‌دارد
+            {
+                "fields": ["-last_reported_at", "-id"],
+                "partialFilterExpression": {"resolved": False},
+            },
+        ],
+    }
+
+
+class MessageArchiveState(Document):
+    """Progress of moving one challenge's messages to the archive collection"""
+
+    challenge = fields.ObjectIdField(required=True, unique=True)
+    # copying: کپی به آرشیو در جریان است و خواندن هنوز از messages است
+    # archived: خواندن از آرشیو؛ پیام‌های باقی‌مانده از messages حذف می‌شوند
+    state = fields.StringField(choices=["copying", "archived"], default="copying")
+    copied = fields.IntField(default=0)
+    deleted = fields.IntField(default=0)
+    started_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
+    archived_at = fields.DateTimeField()
+    completed_at = fields.DateTimeField()
+
+    meta = {"collection": "message_archive_states"}
+
+
 class ChallengeResponse(Document):
     user_id = fields.StringField(required=True)
     challenge = fields.ReferenceField(Challenge)
@@ -99,7 +192,10 @@ class ChallengeResponse(Document):
 
     meta = {
         "collection": "challenge_responses",
-        "indexes": [{"fields": ["user_id", "challenge"], "unique": True}],
+        "indexes": [
+            {"fields": ["user_id", "challenge"], "unique": True},
+            ("user_id", "-answered_at", "-id"),
+        ],
     }
 
 
@@ -107,10 +203,15 @@ class OTPCode(Document):
     phone = StringField(required=True)
     code = StringField(required=True)
     expires_at = DateTimeField(required=True)
+    attempts = fields.IntField(default=0)
 
     meta = {
         "collection": "otp_codes",
-        "indexes": [{"fields": ["expires_at"], "expireAfterSeconds": 0}, "phone"],
+        # یک کد برای هر شماره؛ چند سند با شمارنده‌های جدا قفل تلاش‌ها را دور می‌زنند
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+            {"fields": ["phone"], "unique": True},
+        ],
     }
 
 
@@ -122,7 +223,7 @@ class UserMood(Document):
     )
     created_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {"collection": "user_moods", "indexes": ["user", "-created_at"]}
+    meta = {"collection": "user_moods", "indexes": [("user", "-created_at")]}
 
 
 class Content(Document):
@@ -135,8 +236,28 @@ class Content(Document):
     media_url = fields.URLField()
     is_popular = fields.BooleanField(default=False)
     created_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
+    # نشانگر نسخه برای ETag ها (chat.conditional)؛ با هر save به‌روز می‌شود
+    updated_at = fields.DateTimeField(default=lambda: datetime.now(timezone.utc))
+    search_title = fields.StringField()
+    search_description = fields.StringField()
 
     meta = {
         "collection": "contents",
-        "indexes": ["category", "mood_tags", "-created_at"],
+        "indexes": [
+            "category",
+            ("mood_tags", "-created_at"),
+            ("is_popular", "-created_at"),
+            "-created_at",
+            "-updated_at",
+            {
+                "fields": ["$search_title", "$search_description"],
+                "default_language": "none",
+                "weights": {"search_title": 5, "search_description": 1},
+            },
+        ],
     }
+
+    def clean(self):
+        self.search_title = normalize_persian(self.title)
+        self.search_description = normalize_persian(self.description)
+        self.updated_at = datetime.now(timezone.utc)
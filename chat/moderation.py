@@ -0,0 +1,75 @@
+# chat/moderation.py
+from datetime import datetime, timezone
+
+from chat.archive import modify_message
+from chat.models import MessageReport, ModerationCase
+from mongoengine.errors import NotUniqueError
+from pymongo.errors import DuplicateKeyError
+
+
+def upsert(queryset, **update):
+    """
+    ``queryset.modify(upsert=True, ...)``. When a concurrent upsert inserted
+    the document first, the unique index rejects ours and the retry updates
+    that document instead.
+    """
+    try:
+        return queryset.modify(upsert=True, **update)
+    except (NotUniqueError, DuplicateKeyError):
+        return queryset.modify(upsert=True, **update)
+
+
+def record_report(message_id, reporter_id, reason=None):
+    """
+    Store a report and fold it into the message's moderation case.
+
+    Each user counts once per message: reporting again only refreshes the
+    reason. A new report on a resolved case puts it back in the queue.
+    Returns ``None`` if the message does not exist.
+    """
+    if modify_message(message_id, set__is_reported=True) is None:
+        return None
+
+    now = datetime.now(timezone.utc)
+    previous = upsert(
+        MessageReport.objects(message=message_id, reporter_id=reporter_id),
+        new=False,
+        set__reason=reason,
+        set__created_at=now,
+    )
+    if previous is not None:
+        # گزارش تکراری همین کاربر؛ شمارش تغییر نمی‌کند. درخواست همزمانی که
+        # گزارش را ثبت کرد شاید هنوز پرونده را نساخته باشد
+        return upsert(
+            ModerationCase.objects(message=message_id),
+            new=True,
+            set_on_insert__report_count=0,
+            set_on_insert__resolved=False,
+            set_on_insert__first_reported_at=now,
+            set_on_insert__last_reported_at=now,
+        )
+
+    updates = {"set__last_reason": reason} if reason else {}
+    return upsert(
+        ModerationCase.objects(message=message_id),
+        new=True,
+        inc__report_count=1,
+        set__last_reported_at=now,
+        set__resolved=False,
+        unset__resolution=True,
+        unset__resolved_by=True,
+        unset__resolved_at=True,
+        set_on_insert__first_reported_at=now,
+        **updates,
+    )
+
+
+def resolve_case(case_id, resolution, resolved_by):
+    """Close an open case; returns ``None`` if it is missing or already resolved"""
+    return ModerationCase.objects(id=case_id, resolved=False).modify(
+        new=True,
+        set__resolved=True,
+        set__resolution=resolution,
+        set__resolved_by=resolved_by,
+        set__resolved_at=datetime.now(timezone.utc),
+    )
@@ -0,0 +1,154 @@
+# chat/otp.py
+import hmac
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from chat.models import OTPCode
+from django.conf import settings
+from django.utils.module_loading import import_string
+from mongoengine.errors import NotUniqueError
+from pymongo import ReturnDocument
+
+# نتیجه مصرف کد
+OTP_VALID = "valid"
+OTP_INVALID = "invalid"  # اشتباه، منقضی یا ناموجود
+OTP_LOCKED = "locked"  # تعداد تلاش‌ها تمام شده؛ کد باطل شد
+
+
+class OTPStore:
+    """
+    One pending code per phone. ``set`` replaces any previous code and
+    ``consume`` checks, deletes and counts failed attempts in one atomic step.
+    After ``max_attempts`` wrong guesses the code is dropped.
+    """
+
+    def __init__(self, max_attempts=5):
+        self.max_attempts = max_attempts
+
+    def set(self, phone, code, ttl):
+        raise NotImplementedError
+
+    def consume(self, phone, code):
+        raise NotImplementedError
+
+
+class MemoryOTPStore(OTPStore):
+    """Per-process store; only for development or a single worker"""
+
+    def __init__(self, max_attempts=5):
+        super().__init__(max_attempts)
+        self._codes = {}  # phone -> [code, expires_at, attempts]
+        self._lock = threading.Lock()
+
+    def set(self, phone, code, ttl):
+        with self._lock:
+            self._codes[phone] = [code, time.monotonic() + ttl, 0]
+
+    def consume(self, phone, code):
+        with self._lock:
+            entry = self._codes.get(phone)
+            if entry is None or entry[1] <= time.monotonic():
+                self._codes.pop(phone, None)
+                return OTP_INVALID
+            if hmac.compare_digest(entry[0].encode(), code.encode()):
+                del self._codes[phone]
+                return OTP_VALID
+            entry[2] += 1
+            if entry[2] >= self.max_attempts:
+                del self._codes[phone]
+                return OTP_LOCKED
+            return OTP_INVALID
+
+
+class DiskCacheOTPStore(OTPStore):
+    """Shared by every worker process on the host through a diskcache directory"""
+
+    def __init__(self, directory, max_attempts=5):
+        from diskcache import Cache
+
+        super().__init__(max_attempts)
+        self.cache = Cache(directory)
+
+    def key(self, phone):
+        return f"otp:{phone}"
+
+    def set(self, phone, code, ttl):
+        self.cache.set(self.key(phone), (code, time.time() + ttl, 0), expire=ttl)
+
+    def consume(self, phone, code):
+        key = self.key(phone)
+        with self.cache.transact():
+            entry = self.cache.get(key)
+            if entry is None:
+                return OTP_INVALID
+            expected, expires_at, attempts = entry
+            if hmac.compare_digest(expected.encode(), code.encode()):
+                self.cache.delete(key)
+                return OTP_VALID
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.cache.delete(key)
+                return OTP_LOCKED
+            remaining = expires_at - time.time()
+            if remaining > 0:
+                self.cache.set(key, (expected, expires_at, attempts), expire=remaining)
+            return OTP_INVALID
+
+
+class MongoOTPStore(OTPStore):
+    """
+    ``otp_codes`` with one write per operation: an upsert to set, and a
+    ``find_one_and_delete`` to consume (plus one ``$inc`` on a wrong code).
+    Expired documents are still removed by the TTL index.
+    """
+
+    def set(self, phone, code, ttl):
+        update = {
+            "set__code": code,
+            "set__expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl),
+            "set__attempts": 0,
+        }
+        try:
+            OTPCode.objects(phone=phone).update_one(upsert=True, **update)
+        except NotUniqueError:
+            # upsert همزمان دیگری سند را ساخت؛ این بار همان سند به‌روز می‌شود
+            OTPCode.objects(phone=phone).update_one(upsert=True, **update)
+
+    def consume(self, phone, code):
+        collection = OTPCode._get_collection()
+        pending = {"phone": phone, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        if collection.find_one_and_delete(
+            {**pending, "code": code, "attempts": {"$lt": self.max_attempts}},
+            projection={"_id": 1},
+        ):
+            return OTP_VALID
+
+        document = collection.find_one_and_update(
+            pending,
+            {"$inc": {"attempts": 1}},
+            projection={"attempts": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            return OTP_INVALID
+        if document["attempts"] >= self.max_attempts:
+            collection.delete_one({"_id": document["_id"]})
+            return OTP_LOCKED
+        return OTP_INVALID
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """Process-wide store configured by ``settings.OTP_STORE``"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, "OTP_STORE", {})
+                backend = config.get("BACKEND", "chat.otp.MongoOTPStore")
+                _store = import_string(backend)(**config.get("OPTIONS", {}))
+    return _store
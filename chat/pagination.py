@@ -0,0 +1,174 @@
+# chat/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_int_param(request, name, default, maximum):
+    """Positive integer query parameter, clamped to ``maximum``"""
+    try:
+        value = int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+    if value <= 0:
+        return default
+    return min(value, maximum)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(ordering_field, _id)``, newest first.
+
+    Each page is a range scan starting right after the last item of the
+    previous page, so its cost does not grow with how deep the client has
+    scrolled (unlike skip/offset).
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    default_limit = 50
+    max_limit = 200
+    invalid_cursor_message = "نشانگر صفحه نامعتبر است."
+
+    def __init__(self, ordering_field="created_at"):
+        self.ordering_field = ordering_field
+        self.next_position = None
+        self.request = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+        position = self.decode_cursor(request)
+
+        if position is not None:
+            queryset = self.after(queryset, position)
+
+        # یک آیتم اضافه می‌خوانیم تا بفهمیم صفحه بعدی وجود دارد یا نه
+        page = list(
+            queryset.order_by(f"-{self.ordering_field}", "-id").limit(limit + 1)
+        )
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_position = self.get_position(page[-1])
+        else:
+            self.next_position = None
+        return page
+
+    def after(self, queryset, position):
+        """Items of ``queryset`` that come after ``(value, pk)`` in page order"""
+        value, pk = position
+        return queryset.filter(
+            __raw__={
+                "$or": [
+                    {self.ordering_field: {"$lt": value}},
+                    {self.ordering_field: value, "_id": {"$lt": pk}},
+                ]
+            }
+        )
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return item[self.ordering_field], item["_id"]
+        return getattr(item, self.ordering_field), item.pk
+
+    def get_limit(self, request):
+        return get_int_param(
+            request, self.limit_query_param, self.default_limit, self.max_limit
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            return datetime.fromisoformat(data["v"]), ObjectId(data["id"])
+        except (
+            binascii.Error,
+            UnicodeError,
+            ValueError,
+            KeyError,
+            TypeError,
+            InvalidId,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        value, pk = position
+        data = json.dumps(
+            {"v": value.isoformat(), "id": str(pk)}, separators=(",", ":")
+        )
+        return (
+            base64.urlsafe_b64encode(data.encode("ascii")).decode("ascii").rstrip("=")
+        )
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+
+class RankedPagination(BasePagination):
+    """
+    Offset pagination for relevance-ranked results (e.g. text search).
+
+    A score cannot be used as a keyset, so depth is capped at ``max_offset``
+    instead; nobody pages past the first few hundred search hits.
+    """
+
+    offset_query_param = "offset"
+    limit_query_param = "limit"
+    default_limit = 20
+    max_limit = 100
+    max_offset = 500
+
+    def __init__(self):
+        self.request = None
+        self.offset = 0
+        self.limit = self.default_limit
+        self.has_next = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = get_int_param(
+            request, self.limit_query_param, self.default_limit, self.max_limit
+        )
+        try:
+            self.offset = max(int(request.query_params[self.offset_query_param]), 0)
+        except (KeyError, ValueError):
+            self.offset = 0
+        if self.offset > self.max_offset:
+            self.has_next = False
+            return []
+
+        page = list(queryset.skip(self.offset).limit(self.limit + 1))
+        self.has_next = (
+            len(page) > self.limit and self.offset + self.limit <= self.max_offset
+        )
+        return page[: self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
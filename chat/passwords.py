@@ -0,0 +1,146 @@
+# chat/passwords.py
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from django.conf import settings
+from passlib.context import CryptContext
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool is saturated or did not answer within the timeout"""
+
+
+@lru_cache(maxsize=None)
+def get_context(rounds):
+    # هش‌هایی با هزینه‌ای غیر از rounds هنگام ورود دوباره ساخته می‌شوند
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def _hash(password, rounds):
+    return get_context(rounds).hash(password)
+
+
+def _verify_and_update(password, hashed, rounds):
+    return get_context(rounds).verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Run bcrypt in a small process pool so a burst of logins does not hold
+    the request threads (and the GIL) for hundreds of milliseconds each.
+
+    At most ``max_pending`` jobs are queued or running; callers wait up to
+    ``timeout`` seconds in total for a slot and the result, then get
+    ``PasswordHasherBusy``. A pool broken by a dead worker is replaced and
+    the job retried once. With ``workers=0`` hashing runs inline.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=8, timeout=5.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        # استخر پس از fork شدن worker های gunicorn و در اولین استفاده ساخته می‌شود
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, function, *args):
+        if not self.workers:
+            return function(*args, self.rounds)
+        # یک مهلت مشترک برای گرفتن جای صف و رسیدن نتیجه
+        deadline = time.monotonic() + self.timeout
+        for attempt in range(2):
+            executor = self.get_executor()
+            try:
+                return self._submit(executor, function, args, deadline)
+            except BrokenProcessPool:
+                # worker ای کشته شده (مثلاً OOM)؛ استخر تازه می‌سازیم و یک بار دوباره می‌فرستیم
+                self.reset_executor(executor)
+                if attempt:
+                    raise PasswordHasherBusy("password hashing pool is broken")
+
+    def _submit(self, executor, function, args, deadline):
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise PasswordHasherBusy("password hashing queue is full")
+        try:
+            future = executor.submit(function, *args, self.rounds)
+        except BaseException:
+            self._slots.release()
+            raise
+        # جای صف تا پایان واقعی کار آزاد نمی‌شود، حتی اگر انتظار ما تمام شده باشد
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy("password hashing timed out")
+
+    def hash(self, password):
+        return self.run(_hash, password)
+
+    def verify_and_update(self, password, hashed):
+        """``(valid, new_hash)``; ``new_hash`` is set when the cost changed"""
+        return self.run(_verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = getattr(settings, "PASSWORD_HASHING", {})
+                _hasher = PasswordHasher(
+                    rounds=config.get("ROUNDS", 12),
+                    workers=config.get("WORKERS", 2),
+                    max_pending=config.get("MAX_PENDING", 8),
+                    timeout=config.get("TIMEOUT", 5.0),
+                )
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_and_update(password, hashed):
+    return get_hasher().verify_and_update(password, hashed)
+
+
+def verify_password(password, hashed):
+    return verify_and_update(password, hashed)[0]
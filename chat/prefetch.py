@@ -0,0 +1,88 @@
+# chat/prefetch.py
+from collections import defaultdict
+
+from bson import DBRef, ObjectId
+from mongoengine import Document
+from mongoengine.fields import ReferenceField
+
+
+def reference_id(document, field_name):
+    """Return the id stored in a ReferenceField without dereferencing it."""
+    value = document._data.get(field_name)
+    if isinstance(value, Document):
+        return value.pk
+    if isinstance(value, DBRef):
+        return value.id
+    return value
+
+
+class IdentityMap:
+    """
+    Documents loaded during one serialization pass, keyed by class and id.
+
+    Every referenced collection is loaded with a single ``$in`` query and a
+    document referenced many times is only fetched (and built) once.
+    """
+
+    def __init__(self):
+        self._documents = defaultdict(dict)
+
+    def get(self, document_type, pk):
+        return self._documents[document_type].get(pk)
+
+    def load(self, document_type, ids):
+        cache = self._documents[document_type]
+        missing = [pk for pk in ids if pk not in cache]
+        if missing:
+            for document in document_type.objects(id__in=missing):
+                cache[document.pk] = document
+            # ارجاع‌های شکسته (سند حذف شده) را هم علامت می‌زنیم تا دوباره کوئری نشوند
+            for pk in missing:
+                cache.setdefault(pk, None)
+        return cache
+
+    def resolve(self, documents, field_name):
+        """Attach the referenced documents of ``field_name`` and return them."""
+        pending = defaultdict(list)
+        for document in documents:
+            field = document._fields.get(field_name)
+            if not isinstance(field, ReferenceField):
+                raise ValueError(
+                    f"{type(document).__name__}.{field_name} is not a ReferenceField"
+                )
+            value = document._data.get(field_name)
+            if isinstance(value, Document):
+                continue
+            pk = value.id if isinstance(value, DBRef) else value
+            if isinstance(pk, ObjectId):
+                pending[field.document_type].append((document, pk))
+
+        for document_type, items in pending.items():
+            cache = self.load(document_type, {pk for _, pk in items})
+            for document, pk in items:
+                document._data[field_name] = cache[pk]
+
+        resolved = {}
+        for document in documents:
+            value = document._data.get(field_name)
+            if isinstance(value, Document):
+                resolved[id(value)] = value
+        return list(resolved.values())
+
+
+def prefetch_references(documents, *paths, identity_map=None):
+    """
+    Resolve ReferenceFields of ``documents`` in bulk before serialization.
+
+    ``paths`` are field names, optionally dotted to follow references of
+    references (e.g. ``"challenge.room"``). Returns the identity map used.
+    """
+    identity_map = identity_map or IdentityMap()
+    documents = list(documents)
+    for path in paths:
+        current = documents
+        for field_name in path.split("."):
+            if not current:
+                break
+            current = identity_map.resolve(current, field_name)
+    return identity_map
@@ -0,0 +1,198 @@
+# chat/projections.py
+import copy
+from functools import lru_cache
+
+from bson import DBRef
+from rest_framework import serializers
+
+from .serializers import ReferenceIdField
+
+
+def _reference_id(value):
+    return value.id if isinstance(value, DBRef) else value
+
+
+def _converter(field):
+    """Function giving ``field.to_representation(value)`` for a non-None BSON value"""
+    if isinstance(field, ReferenceIdField):
+        return lambda value: str(_reference_id(value))
+    kind = type(field)
+    if kind in (serializers.CharField, serializers.EmailField):
+        return str
+    if kind is serializers.IntegerField:
+        return int
+    if kind is serializers.BooleanField:
+        to_representation = field.to_representation
+        return lambda value: (
+            value if value is True or value is False else to_representation(value)
+        )
+    if kind is serializers.ListField:
+        child = _converter(field.child)
+        return lambda value: [None if item is None else child(item) for item in value]
+    # تاریخ‌ها و بقیه فیلدها همان تبدیل DRF را می‌گیرند تا خروجی یکسان بماند
+    return field.to_representation
+
+
+@lru_cache(maxsize=None)
+def _field_sources(serializer_class):
+    """``{name: source}`` of the serializer's fields, in declaration order"""
+    return {name: field.source for name, field in serializer_class().fields.items()}
+
+
+def _split(value):
+    return {name.strip() for name in value.split(",")} if value else set()
+
+
+def requested_fields(request, serializer_class):
+    """
+    Names of the ``serializer_class`` fields picked with ``?fields=a,b``
+    and/or ``?exclude=c``, in declaration order, or ``None`` when the client
+    asked for all of them. Unknown names are ignored.
+    """
+    fields = request.query_params.get("fields")
+    exclude = request.query_params.get("exclude")
+    if not fields and not exclude:
+        return None
+    sources = _field_sources(serializer_class)
+    selected = _split(fields) if fields else set(sources)
+    selected -= _split(exclude)
+    return tuple(name for name in sources if name in selected)
+
+
+def only_requested(queryset, serializer_class, names, *extra):
+    """
+    ``queryset`` loading just the document fields behind ``names`` (from
+    ``requested_fields``) plus ``extra``, e.g. the pagination key.
+    """
+    if names is None:
+        return queryset
+    sources = _field_sources(serializer_class)
+    document_fields = queryset._document._fields
+    only = [sources[name] for name in names if sources[name] in document_fields]
+    return queryset.only("id", *only, *extra)
+
+
+def _value_getter(key, default, convert):
+    # مثل mongoengine: مقدار None یا غایب، مقدار پیش‌فرض فیلد را می‌گیرد
+    if callable(default):
+
+        def get(document):
+            value = document.get(key)
+            if value is None:
+                value = default()
+            return None if value is None else convert(value)
+
+    else:
+
+        def get(document):
+            value = document.get(key)
+            if value is None:
+                value = default
+            return None if value is None else convert(value)
+
+    return get
+
+
+class Projection:
+    """
+    Precompiled conversion of raw documents (``as_pymongo()``) to exactly
+    what ``serializer_class(many=True).data`` gives for the same documents,
+    without building mongoengine documents or walking DRF fields per item.
+
+    ``only`` holds the field names to query with. Nested serializers are
+    loaded with one ``$in`` query per field through the projections in
+    ``nested``; ``SerializerMethodField`` values come from the ``methods``
+    passed to ``serialize``. For read-only list endpoints only.
+    """
+
+    def __init__(self, serializer_class, document_type, exclude=(), nested=None):
+        self.serializer_class = serializer_class
+        self.document_type = document_type
+        self.nested = nested or {}
+        self.steps = []  # (name, kind, getter or key)
+        only = []
+        for name, field in serializer_class().fields.items():
+            if name in exclude:
+                continue
+            if name in self.nested:
+                model_field = document_type._fields[field.source]
+                self.steps.append((name, "nested", model_field.db_field))
+                only.append(field.source)
+            elif isinstance(field, serializers.SerializerMethodField):
+                self.steps.append((name, "method", None))
+            elif field.source == "id":
+                self.steps.append(
+                    (name, "value", lambda document: str(document["_id"]))
+                )
+            else:
+                model_field = document_type._fields[field.source]
+                getter = _value_getter(
+                    model_field.db_field, model_field.default, _converter(field)
+                )
+                self.steps.append((name, "value", getter))
+                only.append(field.source)
+        self.only = tuple(only)
+
+    @property
+    def names(self):
+        return tuple(name for name, _, _ in self.steps)
+
+    def restrict(self, names):
+        """This projection limited to the fields in ``names`` (``None`` keeps all)"""
+        if names is None:
+            return self
+        sources = _field_sources(self.serializer_class)
+        wanted = {sources[name] for name in names}
+        projection = copy.copy(self)
+        projection.steps = [step for step in self.steps if step[0] in names]
+        projection.only = tuple(source for source in self.only if source in wanted)
+        return projection
+
+    def queryset(self, queryset, *extra):
+        """``queryset`` reading only the projected fields and ``extra``, as raw dicts"""
+        return queryset.only("id", *self.only, *extra).as_pymongo()
+
+    def load_related(self, documents):
+        """``{field name: {id: nested data}}`` for every nested field"""
+        related = {}
+        for name, kind, key in self.steps:
+            if kind != "nested":
+                continue
+            projection = self.nested[name]
+            ids = {
+                _reference_id(document.get(key))
+                for document in documents
+                if document.get(key) is not None
+            }
+            rows = []
+            if ids:
+                rows = list(
+                    projection.queryset(
+                        projection.document_type.objects(id__in=list(ids))
+                    )
+                )
+            # ارجاع شکسته (سند حذف شده) مثل prefetch_references مقدار None می‌گیرد
+            related[name] = dict(
+                zip((row["_id"] for row in rows), projection.serialize(rows))
+            )
+        return related
+
+    def bind(self, related, methods):
+        getters = []
+        for name, kind, getter in self.steps:
+            if kind == "nested":
+                values = related[name]
+                getter = lambda document, key=getter, values=values: values.get(
+                    _reference_id(document.get(key))
+                )
+            elif kind == "method":
+                getter = methods[name]
+            getters.append((name, getter))
+        return getters
+
+    def serialize(self, documents, methods=None):
+        """Response data for the raw ``documents``, in the serializer's field order"""
+        getters = self.bind(self.load_related(documents), methods or {})
+        return [
+            {name: get(document) for name, get in getters} for document in documents
+        ]
@@ -0,0 +1,226 @@
+# chat/realtime.py
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from chat.prefetch import reference_id
+from chat.validation_cache import get_challenge_state
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def challenge_channel(challenge_id):
+    return f"challenge:{challenge_id}"
+
+
+def room_channel(room_id):
+    return f"room:{room_id}"
+
+
+class Subscription:
+    """Queue of events for one subscriber, consumed from its event loop."""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def deliver(self, event):
+        # روی event loop مشترک اجرا می‌شود؛ مشترک کند رویداد را از دست می‌دهد
+        # تا انتشار دهنده هرگز منتظر نماند
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Dropping %s event for a slow subscriber", event["type"])
+
+    async def get(self, timeout=None):
+        """Next event, or ``None`` if nothing arrived within ``timeout``."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class Broker(ABC):
+    """Pub/sub interface used by the views to push message events."""
+
+    @abstractmethod
+    def publish(self, channel, event):
+        pass
+
+    @abstractmethod
+    def subscribe(self, *channels):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        pass
+
+
+class InProcessBroker(Broker):
+    """
+    Fan-out to subscribers of the current process.
+
+    ``publish`` may be called from any thread (sync views run in worker
+    threads); delivery is scheduled on each subscriber's event loop.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        subscription = Subscription(self, channels, self.queue_size)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        self.fan_out(channel, event)
+
+    def fan_out(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # event loop مشترک بسته شده است
+                subscription.close()
+
+
+class DiskCacheBroker(InProcessBroker):
+    """
+    Share events between worker processes on one host through diskcache.
+
+    Events are appended to a shared log under an increasing sequence number;
+    every process polls the log and fans new events out to its own
+    subscribers. A process only delivers events published after its poller
+    started, and at most ``max_backlog`` events per poll. A local stand-in
+    for a network broker such as Redis.
+    """
+
+    def __init__(
+        self, directory, poll_interval=0.1, retention=60, max_backlog=1000, **kwargs
+    ):
+        from diskcache import Cache
+
+        super().__init__(**kwargs)
+        self.cache = Cache(directory)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_backlog = max_backlog
+        self._last_seq = None
+        self._poller = None
+        self._stopped = threading.Event()
+
+    def publish(self, channel, event):
+        with self.cache.transact():
+            seq = self.cache.incr("seq")
+            self.cache.set(("event", seq), (channel, event), expire=self.retention)
+
+    def subscribe(self, *channels):
+        # مشترک فقط رویدادهای پس از اشتراک را می‌گیرد، نه کل پنجره نگهداری
+        self._ensure_poller()
+        return super().subscribe(*channels)
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is None:
+                self._last_seq = self.cache.get("seq", 0)
+                self._poller = threading.Thread(
+                    target=self._poll, name="realtime-poller", daemon=True
+                )
+                self._poller.start()
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self._read_new_events()
+            except Exception as e:
+                logger.error("Realtime poller error: %s", e, exc_info=True)
+
+    def _read_new_events(self):
+        latest = self.cache.get("seq", 0)
+        first, self._last_seq = self._last_seq + 1, latest
+        with self._lock:
+            if not self._subscribers:
+                # بدون مشترک محلی فقط شماره آخرین رویداد جلو می‌رود
+                return
+        if latest - first >= self.max_backlog:
+            skipped = latest - first + 1 - self.max_backlog
+            logger.warning("Realtime poller skipped %d events", skipped)
+            first = latest - self.max_backlog + 1
+        for seq in range(first, latest + 1):
+            item = self.cache.get(("event", seq))
+            if item is not None:
+                self.fan_out(*item)
+
+    def close(self):
+        """Stop the poller and close the cache"""
+        self._stopped.set()
+        if self._poller is not None:
+            self._poller.join()
+        self.cache.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Process-wide broker configured by ``settings.REALTIME_BROKER``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, "REALTIME_BROKER", {})
+                backend = config.get("BACKEND", "chat.realtime.InProcessBroker")
+                _broker = import_string(backend)(**config.get("OPTIONS", {}))
+    return _broker
+
+
+def publish_message_event(event_type, message, data):
+    """Broadcast a message event to its challenge and room channels."""
+    challenge_id = reference_id(message, "challenge")
+    if not challenge_id:
+        return
+    event = {"type": event_type, "message": data}
+    try:
+        broker = get_broker()
+        broker.publish(challenge_channel(challenge_id), event)
+        challenge = get_challenge_state(challenge_id)
+        if challenge and challenge["room"]:
+            broker.publish(room_channel(challenge["room"]), event)
+    except Exception as e:
+        # خطای انتشار نباید درخواست اصلی را خراب کند
+        logger.error("Failed to publish %s: %s", event_type, e, exc_info=True)
@@ -0,0 +1,108 @@
+# chat/revocation.py
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from chat.models import User
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+REVOCATION_FIELDS = ("id", "token_version", "is_banned")
+
+
+class RevocationRegistry:
+    """
+    Per-process view of the users whose tokens were revoked or who are banned.
+
+    Only users that were ever banned or revoked are held, as
+    ``user id -> (token_version, is_banned)``. Tokens carry ``uid`` and ``ver``
+    claims, so checking one is a dict lookup. The map is refreshed from Mongo
+    at most every ``refresh_interval`` seconds by reading only the users
+    changed since the previous refresh.
+    """
+
+    def __init__(self, refresh_interval=5, overlap=5):
+        self.refresh_interval = refresh_interval
+        # همپوشانی بازه‌ها برای جبران اختلاف ساعت بین سرورها
+        self.overlap = timedelta(seconds=overlap)
+        self._entries = {}
+        self._synced_at = None
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def record(self, user_id, token_version, is_banned):
+        self._entries[str(user_id)] = (token_version or 0, bool(is_banned))
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() < self._next_refresh:
+            return
+        # فقط بارگذاری اول منتظر می‌ماند؛ بقیه با داده فعلی ادامه می‌دهند
+        if not self._lock.acquire(blocking=self._synced_at is None):
+            return
+        try:
+            if not force and time.monotonic() < self._next_refresh:
+                return
+            started = datetime.now(timezone.utc)
+            if self._synced_at is None:
+                users = User.objects(
+                    Q(is_banned=True) | Q(tokens_revoked_at__exists=True)
+                )
+            else:
+                users = User.objects(
+                    tokens_revoked_at__gte=self._synced_at - self.overlap
+                )
+            for data in users.only(*REVOCATION_FIELDS).as_pymongo():
+                self.record(
+                    data["_id"], data.get("token_version"), data.get("is_banned")
+                )
+            self._synced_at = started
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, claims):
+        """Whether a token was issued before its user's tokens were revoked"""
+        if "uid" not in claims:
+            return False
+        self.refresh()
+        entry = self._entries.get(claims["uid"])
+        return entry is not None and claims.get("ver", 0) < entry[0]
+
+    def is_banned(self, user_id):
+        self.refresh()
+        entry = self._entries.get(str(user_id))
+        return entry is not None and entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._synced_at = None
+            self._next_refresh = 0
+
+
+_config = getattr(settings, "TOKEN_REVOCATION", {})
+revocations = RevocationRegistry(
+    refresh_interval=_config.get("REFRESH_INTERVAL", 5),
+    overlap=_config.get("OVERLAP", 5),
+)
+
+
+def _update(user, **updates):
+    user = User.objects(id=user.id).modify(
+        new=True, set__tokens_revoked_at=datetime.now(timezone.utc), **updates
+    )
+    if user is not None:
+        revocations.record(user.id, user.token_version, user.is_banned)
+    return user
+
+
+def revoke_tokens(user):
+    """Invalidate every token issued to ``user`` so far"""
+    return _update(user, inc__token_version=1)
+
+
+def set_banned(user, banned):
+    """Ban or unban ``user``; banning also revokes their existing tokens"""
+    if banned:
+        return _update(user, set__is_banned=True, inc__token_version=1)
+    return _update(user, set__is_banned=False)
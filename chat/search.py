@@ -0,0 +1,40 @@
+# chat/search.py
+import re
+
+# یکسان‌سازی نویسه‌های عربی با معادل فارسی و ارقام با ارقام لاتین
+_CHAR_MAP = {
+    "ي": "ی",
+    "ى": "ی",
+    "ئ": "ی",
+    "ك": "ک",
+    "ة": "ه",
+    "ۀ": "ه",
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ؤ": "و",
+}
+_CHAR_MAP.update({chr(0x06F0 + digit): str(digit) for digit in range(10)})  # ۰-۹
+_CHAR_MAP.update({chr(0x0660 + digit): str(digit) for digit in range(10)})  # ٠-٩
+
+# اعراب، تنوین، الف مقصوره بالا و کشیده (ـ) حذف می‌شوند
+_REMOVED = "".join(chr(c) for c in range(0x064B, 0x0660)) + "\u0670\u0640"
+# نیم‌فاصله و نویسه‌های بی‌عرض: «می‌خواهم» و «میخواهم» یکی می‌شوند
+_REMOVED += "\u200c\u200b\u200d\u200e\u200f\ufeff"
+
+_TRANSLATION = str.maketrans({**_CHAR_MAP, **{c: None for c in _REMOVED}})
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_persian(text):
+    """
+    Canonical form of ``text`` used both when indexing and when querying:
+    Arabic yeh/kaf and letter variants mapped to Persian, diacritics,
+    tatweel and ZWNJ removed, Persian/Arabic digits converted to ASCII,
+    punctuation collapsed to single spaces and Latin text lowercased.
+    """
+    if not text:
+        return ""
+    text = text.translate(_TRANSLATION).lower()
+    return _NON_WORD.sub(" ", text).strip()
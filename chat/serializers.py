@@ -1,8 +1,32 @@
 from datetime import datetime, timezone
 
+from bson import ObjectId
+from mongoengine import Document
 from rest_framework import serializers
 
-from .models import Challenge, ChallengeResponse, Content, Message, Room, User
+from .archive import is_challenge_archived
+from .models import Room
+from .prefetch import reference_id
+from .validation_cache import get_challenge_state, get_message_state, get_room_state
+
+
+class ReferenceIdField(serializers.CharField):
+    """CharField that renders a ReferenceField as its id without dereferencing"""
+
+    def get_attribute(self, instance):
+        if not isinstance(instance, Document):
+            return super().get_attribute(instance)
+        return reference_id(instance, self.source)
+
+
+class SparseFieldsMixin:
+    """Serializer taking ``fields``: the names of the fields to keep (``?fields=``)"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.Serializer):
@@ -25,7 +49,7 @@ class UserSerializer(serializers.Serializer):
         return value
 
 
-class RoomSerializer(serializers.Serializer):
+class RoomSerializer(SparseFieldsMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     title = serializers.CharField(max_length=100)
     description = serializers.CharField(
@@ -60,14 +84,14 @@ class RoomSerializer(serializers.Serializer):
     def to_representation(self, instance):
         """Custom representation for Room objects"""
         data = super().to_representation(instance)
-        if hasattr(instance, "creator") and instance.creator:
+        if "creator" in data and instance.creator:
             data["creator"] = UserSerializer(instance.creator).data
         return data
 
 
-class ChallengeSerializer(serializers.Serializer):
+class ChallengeSerializer(SparseFieldsMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
-    room = serializers.CharField()
+    room = ReferenceIdField()
     title = serializers.CharField(max_length=100)
     description = serializers.CharField(
         required=False, allow_null=True, allow_blank=True
@@ -78,15 +102,14 @@ class ChallengeSerializer(serializers.Serializer):
 
     def validate_room(self, value):
         """Validate room exists"""
-        try:
-            room = Room.objects(id=value).first()
-            if not room:
-                raise serializers.ValidationError("اتاق وجود ندارد.")
-            if not room.is_active:
-                raise serializers.ValidationError("این اتاق غیرفعال است.")
-            return value
-        except Exception:
+        if not ObjectId.is_valid(value):
             raise serializers.ValidationError("شناسه اتاق نامعتبر است.")
+        room = get_room_state(value)
+        if not room:
+            raise serializers.ValidationError("اتاق وجود ندارد.")
+        if not room["is_active"]:
+            raise serializers.ValidationError("این اتاق غیرفعال است.")
+        return value
 
     def validate_title(self, value):
         if not value or not value.strip():
@@ -103,7 +126,7 @@ class ChallengeSerializer(serializers.Serializer):
     def to_representation(self, instance):
         """Custom representation for Challenge objects"""
         data = super().to_representation(instance)
-        if hasattr(instance, "room") and instance.room:
+        if "room" in data and instance.room:
             data["room"] = {
                 "id": str(instance.room.id),
                 "title": instance.room.title,
@@ -114,23 +137,34 @@ class ChallengeSerializer(serializers.Serializer):
 
 class MessageSerializer(serializers.Serializer):
     id = serializers.CharField(read_only=True)
-    challenge = serializers.CharField(required=False, allow_null=True)
+    challenge = ReferenceIdField(required=False, allow_null=True)
     user_id = serializers.CharField(read_only=True)
     content = serializers.CharField(max_length=1000)
     is_reply = serializers.BooleanField(default=False)
-    parent_message = serializers.CharField(allow_null=True, required=False)
+    parent_message = ReferenceIdField(allow_null=True, required=False)
     is_rebuke = serializers.BooleanField(default=False)
     is_back = serializers.BooleanField(default=False)
     is_edited = serializers.BooleanField(read_only=True)
     is_reported = serializers.BooleanField(read_only=True)
     is_deleted = serializers.BooleanField(read_only=True)
     likes = serializers.ListField(child=serializers.CharField(), read_only=True)
-    likes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    liked_by_me = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
 
-    def get_likes_count(self, obj):
-        """Return count of likes"""
-        return len(obj.likes) if obj.likes else 0
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # در لیست‌ها آرایه likes از دیتابیس خوانده نمی‌شود
+        if self.context.get("liked_ids") is not None:
+            self.fields.pop("likes")
+
+    def get_liked_by_me(self, obj):
+        """Whether the requesting user has liked this message"""
+        liked_ids = self.context.get("liked_ids")
+        if liked_ids is not None:
+            return obj.pk in liked_ids
+        user_id = self.context.get("user_id")
+        return bool(user_id) and user_id in (obj.likes or [])
 
     def validate_content(self, value):
         if not value or not value.strip():
@@ -145,29 +179,35 @@ class MessageSerializer(serializers.Serializer):
     def validate_challenge(self, value):
         """Validate challenge exists if provided"""
         if value:
-            try:
-                challenge = Challenge.objects(id=value).first()
-                if not challenge:
-                    raise serializers.ValidationError("چالش وجود ندارد.")
-                return value
-            except Exception:
+            if not ObjectId.is_valid(value):
                 raise serializers.ValidationError("شناسه چالش نامعتبر است.")
+            # در ایجاد گروهی، شناسه‌ها از قبل یکجا خوانده شده‌اند
+            challenges = self.context.get("challenges")
+            if challenges is not None:
+                exists = ObjectId(value) in challenges
+            else:
+                exists = get_challenge_state(value) is not None
+            if not exists:
+                raise serializers.ValidationError("چالش وجود ندارد.")
+            if is_challenge_archived(value):
+                raise serializers.ValidationError("این چالش بایگانی شده است.")
         return value
 
     def validate_parent_message(self, value):
         """Validate parent message exists if this is a reply"""
         if value:
-            try:
-                parent = Message.objects(id=value).first()
-                if not parent:
-                    raise serializers.ValidationError("پیام والد یافت نشد.")
-                if parent.is_deleted:
-                    raise serializers.ValidationError(
-                        "نمی‌توان به پیام حذف شده پاسخ داد."
-                    )
-                return value
-            except Exception:
+            if not ObjectId.is_valid(value):
                 raise serializers.ValidationError("شناسه پیام والد نامعتبر است.")
+            parents = self.context.get("parent_messages")
+            if parents is not None:
+                is_deleted = parents.get(ObjectId(value))
+            else:
+                parent = get_message_state(value)
+                is_deleted = parent["is_deleted"] if parent else None
+            if is_deleted is None:
+                raise serializers.ValidationError("پیام والد یافت نشد.")
+            if is_deleted:
+                raise serializers.ValidationError("نمی‌توان به پیام حذف شده پاسخ داد.")
         return value
 
     def validate(self, attrs):
@@ -181,38 +221,60 @@ class MessageSerializer(serializers.Serializer):
         return attrs
 
 
-class ChallengeResponseSerializer(serializers.Serializer):
+class MessageReportSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    message = ReferenceIdField(read_only=True)
+    reporter_id = serializers.CharField(read_only=True)
+    reason = serializers.CharField(
+        max_length=500, required=False, allow_null=True, allow_blank=True
+    )
+    created_at = serializers.DateTimeField(read_only=True)
+
+
+class ModerationCaseSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    message = MessageSerializer(read_only=True)
+    report_count = serializers.IntegerField(read_only=True)
+    last_reason = serializers.CharField(read_only=True)
+    first_reported_at = serializers.DateTimeField(read_only=True)
+    last_reported_at = serializers.DateTimeField(read_only=True)
+    resolved = serializers.BooleanField(read_only=True)
+    resolution = serializers.ChoiceField(choices=["dismissed", "deleted"])
+    resolved_by = serializers.CharField(read_only=True)
+    resolved_at = serializers.DateTimeField(read_only=True)
+
+
+class ChallengeResponseSerializer(SparseFieldsMixin, serializers.Serializer):
     id = serializers.CharField(read_only=True)
     user_id = serializers.CharField(read_only=True)
-    challenge = serializers.CharField()
+    challenge = ReferenceIdField()
     answered_at = serializers.DateTimeField(read_only=True)
 
     def validate_challenge(self, value):
         """Validate challenge exists and is not expired"""
-        try:
-            challenge = Challenge.objects(id=value).first()
-            if not challenge:
-                raise serializers.ValidationError("چالش وجود ندارد.")
+        if not ObjectId.is_valid(value):
+            raise serializers.ValidationError("شناسه چالش نامعتبر است.")
+        challenge = get_challenge_state(value)
+        if not challenge:
+            raise serializers.ValidationError("چالش وجود ندارد.")
 
-            # بررسی انقضا
-            now = datetime.now(timezone.utc)
-            if challenge.expiration_time <= now:
-                raise serializers.ValidationError("این چالش منقضی شده است.")
+        # بررسی انقضا
+        now = datetime.now(timezone.utc)
+        if challenge["expiration_time"] <= now:
+            raise serializers.ValidationError("این چالش منقضی شده است.")
 
-            return value
-        except Exception:
-            raise serializers.ValidationError("شناسه چالش نامعتبر است.")
+        return value
 
     def to_representation(self, instance):
         """Custom representation for ChallengeResponse objects"""
         data = super().to_representation(instance)
-        if hasattr(instance, "challenge") and instance.challenge:
+        if "challenge" in data and instance.challenge:
+            # فقط شناسه اتاق لازم است؛ نیازی به خواندن سند اتاق نیست
+            room_id = reference_id(instance.challenge, "room")
             data["challenge"] = {
                 "id": str(instance.challenge.id),
                 "title": instance.challenge.title,
-                "room": (
-                    str(instance.challenge.room.id) if instance.challenge.room else None
-                ),
+                "room": str(room_id) if room_id else None,
             }
         return data
 
@@ -1,3 +1,1738 @@
-from django.test import TestCase
+"""
+Query budgets: every route in ``chat/urls.py`` is served against an in-memory
+Mongo (mongomock) seeded with realistic list sizes, and the number of Mongo
+commands it issues must stay within its entry in ``QUERY_BUDGETS``. The same
+fixture checks that the raw list fast path matches the DRF serializers and
+that the streamed message list matches the paginated one, and that sparse
+fieldsets (``?fields=`` / ``?exclude=``) trim both the output and the query.
+The content endpoints are also checked for conditional GETs.
 
-# Create your tests here.
+Run with ``python manage.py test chat`` (needs ``requirements-dev.txt``).
+"""
+
+import inspect
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from chat import otp, passwords, throttling
+from chat.archive import MessageArchiver, archive_collection, archived_challenges
+from chat.conditional import content_versions
+from chat.logs import SamplingFilter
+from chat.models import (
+    Challenge,
+    ChallengeResponse,
+    Content,
+    Message,
+    MessageReport,
+    ModerationCase,
+    OTPCode,
+    Room,
+    User,
+    UserMood,
+)
+from chat.prefetch import prefetch_references
+from chat.projections import Projection, only_requested
+from chat.realtime import Broker, DiskCacheBroker
+from chat.renderers import FastJSONRenderer
+from chat.revocation import revocations, revoke_tokens, set_banned
+from chat.search import normalize_persian
+from chat.serializers import (
+    ChallengeSerializer,
+    ContentSerializer,
+    MessageSerializer,
+    RoomSerializer,
+)
+from chat.user_cache import invalidate_user, user_cache
+from chat.utils import generate_tokens
+from chat.validation_cache import (
+    get_challenge_state,
+    get_message_state,
+    get_room_state,
+    validation_cache,
+)
+from chat.views.core_views import (
+    CONTENT_LIST,
+    MESSAGE_LIST,
+    ROOM_LIST,
+    MessageViewSet,
+)
+from django.conf import settings
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from mongoengine import Document, QuerySet, connect, disconnect
+from mongoengine.errors import NotUniqueError
+from pymongo.errors import DuplicateKeyError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+try:
+    import mongomock
+except ImportError:  # pragma: no cover
+    mongomock = None
+
+
+def accept_bulk_sort(builder):
+    """
+    pymongo 4.9+ passes ``sort`` to every ReplaceOne/UpdateOne added to a
+    bulk write; mongomock 4.3 does not know the argument yet.
+    """
+
+    def drop_sort(method):
+        def add(self, *args, sort=None, **kwargs):
+            return method(self, *args, **kwargs)
+
+        return add
+
+    for name in ("add_replace", "add_update"):
+        method = getattr(builder, name)
+        if "sort" not in inspect.signature(method).parameters:
+            setattr(builder, name, drop_sort(method))
+
+
+if mongomock is not None:
+    accept_bulk_sort(mongomock.collection.BulkOperationBuilder)
+
+# (url name, method) -> حداکثر تعداد دستورات Mongo برای یک درخواست
+# صفحه‌ها با اندازه پیش‌فرض (۵۰) و کش‌های سرد اندازه‌گیری می‌شوند؛
+# در مسیرهای احراز هویت شده یکی از آن‌ها خواندن کاربر توکن است
+QUERY_BUDGETS = {
+    ("home", "GET"): 0,
+    ("api-root", "GET"): 1,
+    ("room-list", "GET"): 3,
+    ("room-list", "POST"): 2,
+    ("room-detail", "GET"): 3,
+    ("room-detail", "PUT"): 4,
+    ("room-detail", "DELETE"): 6,
+    ("challenge-list", "GET"): 3,
+    ("challenge-list", "POST"): 4,
+    ("challenge-detail", "GET"): 3,
+    ("message-list", "GET"): 4,
+    ("message-list", "POST"): 5,
+    ("message-bulk-create", "POST"): 4,
+    ("message-detail", "DELETE"): 4,
+    ("message-like", "POST"): 3,
+    ("message-unlike", "DELETE"): 3,
+    ("message-report", "POST"): 4,
+    ("message-thread", "GET"): 2,
+    ("response-list", "GET"): 3,
+    ("response-list", "POST"): 4,
+    ("moderation-case-list", "GET"): 3,
+    ("moderation-case-detail", "GET"): 3,
+    ("moderation-case-reports", "GET"): 3,
+    ("moderation-case-resolve", "POST"): 5,
+    ("request_code", "POST"): 2,
+    ("verify_otp_login", "POST"): 2,
+    ("token_refresh", "POST"): 1,
+    ("admin_login", "GET"): 0,
+    ("admin_login", "POST"): 1,
+    ("admin_logout", "GET"): 0,
+    ("user_admin_panel", "GET"): 2,
+    ("toggle_ban_user", "POST"): 2,
+    ("delete_user", "POST"): 3,
+    ("submit_mood", "POST"): 2,
+    # با کش سرد، نسخه محتوا برای ETag دو دستور اضافه دارد (chat.conditional)
+    ("mood_suggestions", "GET"): 5,
+    ("popular_content", "GET"): 4,
+    ("category_list", "GET"): 4,
+    ("metrics", "GET"): 0,
+    ("schema_json", "GET"): 0,
+    ("schema_swagger_ui", "GET"): 0,
+    ("schema_redoc", "GET"): 0,
+}
+
+# مسیرهایی که بودجه ندارند، با دلیل
+EXEMPT_ROUTES = {
+    "challenge_events": "SSE stream never ends; its token check is the auth path",
+    "room_events": "SSE stream never ends; its token check is the auth path",
+    "search": "$text is not supported by mongomock; see manage.py explain_queries",
+}
+
+PAGE_SIZE = 50
+ROOMS = 60
+CHALLENGES = 60
+MESSAGES = 120
+REPLIES = 20
+RESPONSES = 60
+CONTENTS = 40
+CASES = 60
+
+_COLLECTION_COMMANDS = (
+    "find_one",
+    "insert_one",
+    "insert_many",
+    "update_one",
+    "update_many",
+    "replace_one",
+    "delete_one",
+    "delete_many",
+    "find_one_and_update",
+    "find_one_and_replace",
+    "find_one_and_delete",
+    "aggregate",
+    "count_documents",
+    "estimated_document_count",
+    "distinct",
+    "bulk_write",
+    "create_index",
+    "drop",
+)
+_CURSOR_COMMANDS = ("distinct",)
+
+
+@contextmanager
+def count_mongo_commands():
+    """
+    Record ``(collection, command)`` for every command mongomock would have
+    sent to a server. A cursor counts once, when it is first read; calls
+    mongomock makes internally (``find_one`` reading a cursor, ``$graphLookup``
+    scanning a collection) are not counted.
+    """
+    commands = []
+    state = threading.local()
+
+    def record(collection, command):
+        if not getattr(state, "depth", 0):
+            commands.append((collection, command))
+
+    def wrap(cls, name, get_collection):
+        original = getattr(cls, name)
+
+        def wrapper(self, *args, **kwargs):
+            record(get_collection(self), name)
+            state.depth = getattr(state, "depth", 0) + 1
+            try:
+                return original(self, *args, **kwargs)
+            finally:
+                state.depth -= 1
+
+        return original, wrapper
+
+    def cursor_results(original):
+        def wrapper(self, *args, **kwargs):
+            if not getattr(self, "_budget_counted", False):
+                self._budget_counted = True
+                record(self.collection.name, "find")
+            return original(self, *args, **kwargs)
+
+        return wrapper
+
+    Collection = mongomock.collection.Collection
+    Cursor = mongomock.collection.Cursor
+    patches = [
+        (Collection, name, *wrap(Collection, name, lambda c: c.name))
+        for name in _COLLECTION_COMMANDS
+    ]
+    patches += [
+        (Cursor, name, *wrap(Cursor, name, lambda c: c.collection.name))
+        for name in _CURSOR_COMMANDS
+    ]
+    results = Cursor._compute_results
+    patches.append((Cursor, "_compute_results", results, cursor_results(results)))
+    for cls, name, _, wrapper in patches:
+        setattr(cls, name, wrapper)
+    try:
+        yield commands
+    finally:
+        for cls, name, original, _ in patches:
+            setattr(cls, name, original)
+
+
+def iter_routes(patterns=None):
+    """``(url name, methods)`` of every named route; methods is None for functions"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            callback = pattern.callback
+            actions = getattr(callback, "actions", None)
+            view_class = getattr(callback, "cls", None) or getattr(
+                callback, "view_class", None
+            )
+            if actions:
+                methods = {method.upper() for method in actions} - {"HEAD"}
+            elif view_class is not None and pattern.name != "api-root":
+                methods = {
+                    method.upper()
+                    for method in ("get", "post", "put", "patch", "delete")
+                    if hasattr(view_class, method)
+                }
+            else:
+                methods = None
+            yield pattern.name, methods
+
+
+@skipUnless(mongomock, "mongomock is required (pip install -r requirements-dev.txt)")
+@override_settings(
+    RATE_LIMIT={"DIRECTORY": tempfile.gettempdir(), "RATES": {}},
+    METRICS={"DIRECTORY": None},
+)
+class QueryBudgetTestCase(TestCase):
+    """Seeded in-memory Mongo and helpers to serve a route within its budget"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        disconnect(alias="default")
+        connect(
+            "chat_tests",
+            host="mongodb://localhost",
+            alias="default",
+            mongo_client_class=mongomock.MongoClient,
+        )
+        cls._hasher = passwords._hasher
+        passwords._hasher = passwords.PasswordHasher(rounds=4, workers=0)
+        cls._refresh_interval = revocations.refresh_interval
+        revocations.refresh_interval = 3600
+
+    @classmethod
+    def tearDownClass(cls):
+        passwords._hasher = cls._hasher
+        revocations.refresh_interval = cls._refresh_interval
+        disconnect(alias="default")
+        super().tearDownClass()
+
+    def setUp(self):
+        database = Message._get_db()
+        for name in database.list_collection_names():
+            database.drop_collection(name)
+        for document_type in Document.__subclasses__():
+            if document_type.__module__ == "chat.models":
+                document_type._collection = None
+                document_type._get_collection()
+        self.seed()
+        revocations.clear()
+        revocations.refresh(force=True)
+
+    def clear_caches(self):
+        """Budgets are for a worker whose in-process caches are cold"""
+        validation_cache.clear()
+        user_cache.clear()
+        archived_challenges.clear()
+        content_versions.clear()
+
+    def seed(self):
+        now = datetime.now(timezone.utc)
+        self.user = User(username="user", phone="09120000001")
+        self.user.set_password("secret")
+        self.user.save()
+        self.admin = User(username="admin", phone="09120000002", is_admin=True)
+        self.admin.set_password("secret")
+        self.admin.save()
+        for index in range(8):
+            User(username=f"user{index}", phone=f"0913000000{index}").save()
+
+        self.rooms = [
+            Room(
+                title=f"room {index}",
+                room_type="daily",
+                creator=self.user,
+                created_at=now - timedelta(minutes=index),
+            )
+            for index in range(ROOMS)
+        ]
+        Room.objects.insert(self.rooms)
+        self.room = self.rooms[0]
+
+        self.challenges = [
+            Challenge(
+                room=self.room,
+                title=f"challenge {index}",
+                expiration_time=now + timedelta(days=1),
+                created_at=now - timedelta(minutes=index),
+            )
+            for index in range(CHALLENGES)
+        ]
+        Challenge.objects.insert(self.challenges)
+        self.challenge = self.challenges[0]
+
+        self.messages = [
+            Message(
+                challenge=self.challenge,
+                user_id=str(self.user.id),
+                content=f"message {index}",
+                likes=[str(self.user.id)] if index % 3 == 0 else [],
+                likes_count=1 if index % 3 == 0 else 0,
+                created_at=now - timedelta(seconds=index),
+            )
+            for index in range(MESSAGES)
+        ]
+        Message.objects.insert(self.messages)
+        self.message = self.messages[0]
+        Message.objects.insert(
+            [
+                Message(
+                    challenge=self.challenge,
+                    user_id=str(self.user.id),
+                    content=f"reply {index}",
+                    is_reply=True,
+                    parent_message=self.message,
+                    created_at=now + timedelta(seconds=index),
+                )
+                for index in range(REPLIES)
+            ]
+        )
+
+        ChallengeResponse.objects.insert(
+            [
+                ChallengeResponse(
+                    user_id=str(self.user.id),
+                    challenge=challenge,
+                    answered_at=now - timedelta(seconds=index),
+                )
+                for index, challenge in enumerate(self.challenges[1 : RESPONSES + 1])
+            ]
+        )
+
+        Content.objects.insert(
+            [
+                Content(
+                    title=f"content {index}",
+                    category=["meditation", "music", "story", "chatbot"][index % 4],
+                    mood_tags=["happy", "relaxed"],
+                    is_popular=index % 2 == 0,
+                    created_at=now - timedelta(minutes=index),
+                )
+                for index in range(CONTENTS)
+            ]
+        )
+        UserMood(user=self.user, mood="happy").save()
+
+        self.cases = [
+            ModerationCase(
+                message=message,
+                report_count=1,
+                first_reported_at=now - timedelta(seconds=index),
+                last_reported_at=now - timedelta(seconds=index),
+            )
+            for index, message in enumerate(self.messages[:CASES])
+        ]
+        ModerationCase.objects.insert(self.cases)
+        MessageReport(message=self.message, reporter_id=str(self.admin.id)).save()
+
+    def api_client(self, user=None):
+        client = APIClient()
+        access, _ = generate_tokens(user or self.user)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        return client
+
+    def admin_session_client(self):
+        client = Client()
+        session = client.session
+        session["admin_user_id"] = str(self.admin.id)
+        session.save()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        return client
+
+    def assertWithinBudget(self, name, method, path, data=None, client=None, **extra):
+        """Serve ``path`` and check the Mongo commands against the budget"""
+        budget = QUERY_BUDGETS[(name, method)]
+        client = client or self.api_client()
+        if isinstance(client, APIClient):
+            extra.setdefault("format", "json")
+        self.clear_caches()
+        with count_mongo_commands() as commands:
+            response = getattr(client, method.lower())(path, data, **extra)
+        self.assertLess(
+            response.status_code,
+            400,
+            f"{method} {path} returned {response.status_code}: "
+            f"{getattr(response, 'data', '')}",
+        )
+        self.assertLessEqual(
+            len(commands),
+            budget,
+            f"{method} {name} issued {len(commands)} Mongo commands "
+            f"(budget {budget}): {commands}",
+        )
+        return response
+
+
+class RouteCoverageTests(TestCase):
+    def test_every_route_has_a_budget(self):
+        budgeted = {name for name, _ in QUERY_BUDGETS}
+        missing = []
+        for name, methods in iter_routes():
+            if name in EXEMPT_ROUTES:
+                continue
+            if methods is None:
+                if name not in budgeted:
+                    missing.append(name)
+                continue
+            missing += [
+                f"{method} {name}"
+                for method in sorted(methods)
+                if (name, method) not in QUERY_BUDGETS
+            ]
+        self.assertEqual(missing, [], "routes without a query budget")
+
+    def test_no_stale_budgets(self):
+        names = {name for name, _ in iter_routes()}
+        stale = sorted({name for name, _ in QUERY_BUDGETS} - names)
+        self.assertEqual(stale, [])
+
+
+class RoomQueryBudgetTests(QueryBudgetTestCase):
+    def test_room_list(self):
+        response = self.assertWithinBudget("room-list", "GET", reverse("room-list"))
+        self.assertEqual(len(response.data["results"]), PAGE_SIZE)
+
+    def test_room_create(self):
+        self.assertWithinBudget(
+            "room-list",
+            "POST",
+            reverse("room-list"),
+            {"title": "new room", "room_type": "daily"},
+        )
+
+    def test_room_retrieve(self):
+        path = reverse("room-detail", args=[self.room.id])
+        self.assertWithinBudget("room-detail", "GET", path)
+
+    def test_room_update(self):
+        path = reverse("room-detail", args=[self.room.id])
+        self.assertWithinBudget("room-detail", "PUT", path, {"title": "renamed"})
+
+    def test_room_destroy(self):
+        path = reverse("room-detail", args=[self.rooms[-1].id])
+        self.assertWithinBudget("room-detail", "DELETE", path)
+
+
+class ChallengeQueryBudgetTests(QueryBudgetTestCase):
+    def test_challenge_list(self):
+        path = reverse("challenge-list")
+        response = self.assertWithinBudget("challenge-list", "GET", path)
+        self.assertEqual(len(response.data["results"]), PAGE_SIZE)
+        self.assertWithinBudget(
+            "challenge-list", "GET", f"{path}?room_id={self.room.id}"
+        )
+
+    def test_challenge_create(self):
+        self.assertWithinBudget(
+            "challenge-list",
+            "POST",
+            reverse("challenge-list"),
+            {
+                "room": str(self.room.id),
+                "title": "new challenge",
+                "expiration_time": (
+                    datetime.now(timezone.utc) + timedelta(days=1)
+                ).isoformat(),
+            },
+        )
+
+    def test_challenge_retrieve(self):
+        path = reverse("challenge-detail", args=[self.challenge.id])
+        self.assertWithinBudget("challenge-detail", "GET", path)
+
+
+class MessageQueryBudgetTests(QueryBudgetTestCase):
+    def test_message_list(self):
+        path = reverse("message-list")
+        response = self.assertWithinBudget(
+            "message-list", "GET", f"{path}?challenge_id={self.challenge.id}"
+        )
+        self.assertEqual(len(response.data["results"]), PAGE_SIZE)
+        self.assertWithinBudget("message-list", "GET", response.data["next"])
+
+    def test_message_create(self):
+        self.assertWithinBudget(
+            "message-list",
+            "POST",
+            reverse("message-list"),
+            {
+                "challenge": str(self.challenge.id),
+                "content": "hello",
+                "is_reply": True,
+                "parent_message": str(self.message.id),
+            },
+        )
+
+    def test_message_bulk_create(self):
+        items = [
+            {"challenge": str(challenge.id), "content": f"bulk {index}"}
+            for index, challenge in enumerate(self.challenges[:10] * 10)
+        ]
+        response = self.assertWithinBudget(
+            "message-bulk-create", "POST", reverse("message-bulk-create"), items
+        )
+        self.assertEqual(len(response.data["created"]), len(items))
+
+    def test_message_destroy(self):
+        path = reverse("message-detail", args=[self.messages[-1].id])
+        self.assertWithinBudget("message-detail", "DELETE", path)
+
+    def test_message_like_and_unlike(self):
+        message = self.messages[1]
+        path = reverse("message-like", args=[message.id])
+        self.assertWithinBudget("message-like", "POST", path)
+        path = reverse("message-unlike", args=[message.id])
+        self.assertWithinBudget("message-unlike", "DELETE", path)
+
+    def test_message_report(self):
+        path = reverse("message-report", args=[self.messages[-1].id])
+        self.assertWithinBudget("message-report", "POST", path, {"reason": "spam"})
+
+    def test_message_thread(self):
+        path = reverse("message-thread", args=[self.message.id])
+        response = self.assertWithinBudget("message-thread", "GET", path)
+        self.assertEqual(len(response.data["replies"]), REPLIES)
+
+
+class LikeTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clear_caches()
+        # پیام بدون لایک (پیام‌های با اندیس مضرب 3 از قبل لایک شده‌اند)
+        self.message = self.messages[1]
+
+    def like(self, user=None):
+        path = reverse("message-like", args=[self.message.id])
+        return self.api_client(user).post(path)
+
+    def unlike(self, user=None):
+        path = reverse("message-unlike", args=[self.message.id])
+        return self.api_client(user).delete(path)
+
+    def stored(self):
+        return Message.objects(id=self.message.id).only("likes", "likes_count").get()
+
+    def test_liking_twice_counts_once(self):
+        for _ in range(2):
+            response = self.like()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["likes_count"], 1)
+            self.assertTrue(response.data["liked_by_me"])
+        self.assertEqual(self.stored().likes, [str(self.user.id)])
+
+        response = self.like(self.admin)
+        self.assertEqual(response.data["likes_count"], 2)
+
+    def test_unlike_decrements(self):
+        self.like()
+        self.like(self.admin)
+        response = self.unlike()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["likes_count"], 1)
+        self.assertFalse(response.data["liked_by_me"])
+        self.assertEqual(self.stored().likes, [str(self.admin.id)])
+
+    def test_unlike_without_like_keeps_count(self):
+        for _ in range(2):
+            response = self.unlike()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["likes_count"], 0)
+        self.like(self.admin)
+        self.unlike()
+        self.assertEqual(self.stored().likes_count, 1)
+
+    def test_unknown_message(self):
+        self.message = Message(id=ObjectId())
+        self.assertEqual(self.like().status_code, 404)
+        self.assertEqual(self.unlike().status_code, 404)
+
+
+class ResponseQueryBudgetTests(QueryBudgetTestCase):
+    def test_response_list(self):
+        response = self.assertWithinBudget(
+            "response-list", "GET", reverse("response-list")
+        )
+        self.assertEqual(len(response.data["results"]), PAGE_SIZE)
+
+    def test_response_create(self):
+        self.assertWithinBudget(
+            "response-list",
+            "POST",
+            reverse("response-list"),
+            {"challenge": str(self.challenge.id)},
+        )
+
+
+class ModerationQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.api_client(self.admin)
+
+    def test_case_list(self):
+        response = self.assertWithinBudget(
+            "moderation-case-list",
+            "GET",
+            reverse("moderation-case-list"),
+            client=self.client,
+        )
+        self.assertEqual(len(response.data["results"]), PAGE_SIZE)
+
+    def test_case_detail_and_reports(self):
+        case = self.cases[0]
+        for name in ("moderation-case-detail", "moderation-case-reports"):
+            self.assertWithinBudget(
+                name, "GET", reverse(name, args=[case.id]), client=self.client
+            )
+
+    def test_case_resolve(self):
+        path = reverse("moderation-case-resolve", args=[self.cases[0].id])
+        self.assertWithinBudget(
+            "moderation-case-resolve",
+            "POST",
+            path,
+            {"resolution": "deleted"},
+            client=self.client,
+        )
+
+
+class AuthQueryBudgetTests(QueryBudgetTestCase):
+    def test_request_code_and_login(self):
+        client = APIClient()
+        credentials = {"phone": self.user.phone, "password": "secret"}
+        self.assertWithinBudget(
+            "request_code", "POST", reverse("request_code"), credentials, client
+        )
+        code = OTPCode.objects(phone=self.user.phone).scalar("code").first()
+        response = self.assertWithinBudget(
+            "verify_otp_login",
+            "POST",
+            reverse("verify_otp_login"),
+            {**credentials, "code": code},
+            client,
+        )
+        self.assertIn("access", response.data)
+
+    def test_refresh(self):
+        _, refresh = generate_tokens(self.user)
+        self.assertWithinBudget(
+            "token_refresh",
+            "POST",
+            reverse("token_refresh"),
+            {"refresh": refresh},
+            APIClient(),
+        )
+
+
+class AdminPanelQueryBudgetTests(QueryBudgetTestCase):
+    def test_login_page_and_login(self):
+        client = Client()
+        self.assertWithinBudget(
+            "admin_login", "GET", reverse("admin_login"), client=client
+        )
+        response = self.assertWithinBudget(
+            "admin_login",
+            "POST",
+            reverse("admin_login"),
+            {"phone": self.admin.phone, "password": "secret"},
+            client,
+        )
+        self.assertEqual(response.url, reverse("user_admin_panel"))
+
+    def test_logout(self):
+        self.assertWithinBudget(
+            "admin_logout",
+            "GET",
+            reverse("admin_logout"),
+            client=self.admin_session_client(),
+        )
+
+    def test_user_list(self):
+        self.assertWithinBudget(
+            "user_admin_panel",
+            "GET",
+            reverse("user_admin_panel"),
+            client=self.admin_session_client(),
+        )
+
+    def test_toggle_ban_and_delete(self):
+        client = self.admin_session_client()
+        target = User.objects(phone="09130000000").first()
+        self.assertWithinBudget(
+            "toggle_ban_user",
+            "POST",
+            reverse("toggle_ban_user", args=[target.id]),
+            client=client,
+        )
+        self.assertTrue(User.objects(id=target.id).scalar("is_banned").first())
+        self.assertWithinBudget(
+            "delete_user",
+            "POST",
+            reverse("delete_user", args=[target.id]),
+            client=client,
+        )
+        self.assertIsNone(User.objects(id=target.id).first())
+
+
+class MoodAndContentQueryBudgetTests(QueryBudgetTestCase):
+    def test_submit_mood(self):
+        self.assertWithinBudget(
+            "submit_mood", "POST", reverse("submit_mood"), {"mood": "relaxed"}
+        )
+
+    def test_mood_suggestions(self):
+        response = self.assertWithinBudget(
+            "mood_suggestions", "GET", reverse("mood_suggestions")
+        )
+        self.assertEqual(len(response.data["suggestions"]), 20)
+
+    def test_popular_content_and_categories(self):
+        self.assertWithinBudget("popular_content", "GET", reverse("popular_content"))
+        self.assertWithinBudget("category_list", "GET", reverse("category_list"))
+
+
+class StaticRouteQueryBudgetTests(QueryBudgetTestCase):
+    def test_routes_without_mongo(self):
+        for name, path in (
+            ("home", reverse("home")),
+            ("api-root", reverse("api-root")),
+            ("metrics", reverse("metrics")),
+            ("schema_json", reverse("schema_json", kwargs={"format": ".json"})),
+            ("schema_swagger_ui", reverse("schema_swagger_ui")),
+            ("schema_redoc", reverse("schema_redoc")),
+        ):
+            with self.subTest(name=name):
+                self.assertWithinBudget(name, "GET", path)
+
+
+class ProjectionTests(QueryBudgetTestCase):
+    """The raw fast path must render the same bytes as the DRF serializers"""
+
+    def setUp(self):
+        super().setUp()
+        now = datetime.now(timezone.utc)
+        # اسناد ناقص: فیلدهای غایب یا None باید مقدار پیش‌فرض mongoengine را بگیرند
+        Message._get_collection().insert_many(
+            [
+                {
+                    "challenge": self.challenge.id,
+                    "user_id": "legacy",
+                    "content": 'quote " slash \\ line\u2028sep 😀 سلام',
+                    "created_at": now.replace(tzinfo=None),
+                },
+                {
+                    "challenge": self.challenge.id,
+                    "user_id": "legacy",
+                    "content": "nulls",
+                    "is_reply": None,
+                    "likes_count": None,
+                    "parent_message": None,
+                    "created_at": now - timedelta(microseconds=1),
+                },
+            ]
+        )
+        Room._get_collection().insert_many(
+            [
+                {"title": "no creator", "is_active": True, "created_at": now},
+                {
+                    "title": "deleted creator",
+                    "room_type": "teens",
+                    "creator": ObjectId(),
+                    "is_active": True,
+                    "created_at": now,
+                },
+            ]
+        )
+        Content._get_collection().insert_one(
+            {
+                "title": "bare",
+                "category": "music",
+                "is_popular": True,
+                "created_at": now,
+            }
+        )
+
+    def assertSameBytes(self, fast, slow):
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(slow))
+
+    def test_message_list(self):
+        liked_ids = {self.messages[0].id, self.messages[3].id}
+        queryset = Message.objects(challenge=self.challenge).order_by("-created_at")
+        documents = list(queryset.exclude("likes"))
+        raw = list(MESSAGE_LIST.queryset(queryset))
+        fast = MESSAGE_LIST.serialize(
+            raw, methods={"liked_by_me": lambda message: message["_id"] in liked_ids}
+        )
+        slow = MessageSerializer(
+            documents, many=True, context={"liked_ids": liked_ids}
+        ).data
+        self.assertEqual(len(fast), MESSAGES + REPLIES + 2)
+        self.assertSameBytes(fast, slow)
+
+    def test_room_list(self):
+        queryset = Room.objects(is_active=True).order_by("-created_at")
+        documents = list(queryset)
+        prefetch_references(documents, "creator")
+        fast = ROOM_LIST.serialize(list(ROOM_LIST.queryset(queryset)))
+        self.assertSameBytes(fast, RoomSerializer(documents, many=True).data)
+
+    def test_content_list(self):
+        queryset = Content.objects.order_by("-created_at")
+        fast = CONTENT_LIST.serialize(list(CONTENT_LIST.queryset(queryset)))
+        self.assertSameBytes(fast, ContentSerializer(queryset, many=True).data)
+
+    def test_views_use_fast_renderer(self):
+        response = self.api_client().get(reverse("popular_content"))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_renderer_falls_back_for_indent(self):
+        data = {"a": [1, " "], "b": None}
+        context = {"indent": 2}
+        self.assertEqual(
+            FastJSONRenderer().render(data, renderer_context=context),
+            JSONRenderer().render(data, renderer_context=context),
+        )
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class MessageStreamTests(QueryBudgetTestCase):
+    """``?stream=1`` writes the whole message list as one JSON array"""
+
+    def stream(self, **params):
+        self.clear_caches()
+        path = reverse("message-list")
+        return self.api_client().get(path, {"stream": "1", **params})
+
+    def test_stream_matches_serializer(self):
+        liked_ids = {message.id for message in self.messages[::3]}
+        raw = MESSAGE_LIST.queryset(
+            Message.objects(challenge=self.challenge, is_deleted=False)
+        ).order_by("-created_at", "-id")
+        expected = MESSAGE_LIST.serialize(
+            list(raw),
+            methods={"liked_by_me": lambda message: message["_id"] in liked_ids},
+        )
+        with mock.patch.object(MessageViewSet, "stream_batch_size", 7):
+            response = self.stream(challenge_id=str(self.challenge.id))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+
+        # یک تکه برای هر دسته و یکی برای بستن آرایه
+        self.assertEqual(len(chunks), -(-(MESSAGES + REPLIES) // 7) + 1)
+        self.assertEqual(b"".join(chunks), JSONRenderer().render(expected))
+
+    async def test_stream_under_asgi_sends_each_batch(self):
+        access, _ = await sync_to_async(generate_tokens)(self.user)
+        headers = {"Authorization": f"Bearer {access}"}
+        serialize_page = MessageViewSet.serialize_page
+        batches = []
+
+        def count_batches(view, *args):
+            batches.append(args[1])
+            return serialize_page(view, *args)
+
+        path = reverse("message-list")
+        params = {"stream": "1", "challenge_id": str(self.challenge.id)}
+        with mock.patch.object(MessageViewSet, "stream_batch_size", 7):
+            with mock.patch.object(MessageViewSet, "serialize_page", count_batches):
+                response = await AsyncClient().get(path, params, headers=headers)
+                self.assertTrue(response.is_async)
+                # هر تکه پیش از خواندن دسته بعد از Mongo فرستاده می‌شود
+                seen = []
+                async for chunk in response.streaming_content:
+                    seen.append(len(batches))
+
+        count = -(-(MESSAGES + REPLIES) // 7)
+        self.assertEqual(seen, [*range(1, count + 1), count])
+        self.assertEqual(sum(len(batch) for batch in batches), MESSAGES + REPLIES)
+
+    def test_stream_empty_challenge(self):
+        response = self.stream(challenge_id=str(self.challenges[-1].id))
+        self.assertEqual(b"".join(response.streaming_content), b"[]")
+
+    def test_stream_requires_challenge(self):
+        response = self.stream()
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(QueryBudgetTestCase):
+    """``?fields=`` and ``?exclude=`` on the viewsets in ``core_views``"""
+
+    def get(self, name, *args, **params):
+        self.clear_caches()
+        with count_mongo_commands() as commands:
+            response = self.api_client().get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200, getattr(response, "data", ""))
+        return response.data, len(commands)
+
+    def test_message_list_fields(self):
+        fields = "id,content,likes_count,created_at"
+        data, commands = self.get(
+            "message-list", challenge_id=str(self.challenge.id), fields=fields
+        )
+        self.assertEqual(list(data["results"][0]), fields.split(","))
+        # liked_by_me نخواسته شده، پس پرس‌وجوی لایک‌ها هم اجرا نمی‌شود
+        self.assertEqual(commands, QUERY_BUDGETS[("message-list", "GET")] - 1)
+
+    def test_room_list_exclude_follows_cursor(self):
+        data, commands = self.get("room-list", exclude="creator,description", limit=7)
+        self.assertNotIn("creator", data["results"][0])
+        self.assertNotIn("description", data["results"][0])
+        self.assertEqual(commands, QUERY_BUDGETS[("room-list", "GET")] - 1)
+
+        # فیلد مرتب‌سازی برای ساختن نشانگر صفحه بعد همچنان خوانده می‌شود
+        cursor = data["next"].split("cursor=")[1].split("&")[0]
+        following, _ = self.get("room-list", exclude="creator", cursor=cursor)
+        self.assertEqual(following["results"][0]["id"], str(self.rooms[7].id))
+
+    def test_challenge_list_and_detail(self):
+        data, commands = self.get("challenge-list", fields="id,title")
+        self.assertEqual(list(data["results"][0]), ["id", "title"])
+        self.assertEqual(commands, QUERY_BUDGETS[("challenge-list", "GET")] - 1)
+
+        data, _ = self.get("challenge-detail", self.challenge.id, exclude="room")
+        self.assertNotIn("room", data)
+        self.assertEqual(data["title"], self.challenge.title)
+
+    def test_room_detail_and_responses(self):
+        data, _ = self.get("room-detail", self.room.id, fields="title,unknown")
+        self.assertEqual(data, {"title": self.room.title})
+
+        data, commands = self.get("response-list", exclude="challenge")
+        self.assertEqual(list(data["results"][0]), ["id", "user_id", "answered_at"])
+        self.assertEqual(commands, QUERY_BUDGETS[("response-list", "GET")] - 1)
+
+    def test_query_reads_only_requested_fields(self):
+        queryset = only_requested(
+            Challenge.objects, ChallengeSerializer, ("title",), "created_at"
+        )
+        document = queryset.as_pymongo().first()
+        self.assertEqual(set(document), {"_id", "title", "created_at"})
+
+
+class ConditionalGetTests(QueryBudgetTestCase):
+    """ETag / If-None-Match on the content and category endpoints"""
+
+    def setUp(self):
+        super().setUp()
+        self.clear_caches()
+
+    def get(self, name, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        with count_mongo_commands() as commands:
+            response = self.api_client().get(reverse(name), **headers)
+        return response, len(commands)
+
+    def test_not_modified_skips_query_and_serializer(self):
+        for name in ("popular_content", "category_list", "mood_suggestions"):
+            self.clear_caches()
+            response, _ = self.get(name)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+            self.assertTrue(etag.startswith('"'))
+
+            with mock.patch.object(
+                Projection, "serialize", side_effect=AssertionError
+            ) as serialize:
+                response, commands = self.get(name, etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertIn("max-age=", response["Cache-Control"])
+            serialize.assert_not_called()
+            # کاربر و نسخه محتوا در کش‌اند؛ پیشنهادها فقط آخرین حال کاربر را می‌خوانند
+            self.assertEqual(commands, 1 if name == "mood_suggestions" else 0)
+
+    def test_weak_and_wildcard_match(self):
+        response, _ = self.get("category_list")
+        etag = response["ETag"]
+        self.assertEqual(self.get("category_list", f"W/{etag}")[0].status_code, 304)
+        self.assertEqual(self.get("category_list", "*")[0].status_code, 304)
+        self.assertEqual(self.get("category_list", '"stale"')[0].status_code, 200)
+
+    def test_etag_changes_with_content(self):
+        response, _ = self.get("popular_content")
+        self.assertIn("public", response["Cache-Control"])
+        etag = response["ETag"]
+
+        content = Content.objects.first()
+        content.title = "edited"
+        content.save()
+        content_versions.clear()
+        response, _ = self.get("popular_content", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        Content.objects(id=content.id).delete()
+        content_versions.clear()
+        self.assertEqual(
+            self.get("popular_content", response["ETag"])[0].status_code, 200
+        )
+
+    def test_suggestions_etag_follows_last_mood(self):
+        response, _ = self.get("mood_suggestions")
+        self.assertIn("private", response["Cache-Control"])
+        etag = response["ETag"]
+
+        UserMood(user=self.user, mood="sad").save()
+        response, _ = self.get("mood_suggestions", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"suggestions": []})
+
+
+class EventStreamTests(TestCase):
+    def test_event_streams_refuse_wsgi(self):
+        # Client آزمون WSGI است؛ جریان بی‌پایان نباید worker را قفل کند
+        pk = str(ObjectId())
+        for name in ("challenge_events", "room_events"):
+            response = Client().get(reverse(name, args=[pk]))
+            self.assertEqual(response.status_code, 501)
+
+
+class DiskCacheBrokerTests(TestCase):
+    """The poller is driven by hand; its own loop waits an hour between polls"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.broker = DiskCacheBroker(directory.name, poll_interval=3600)
+        self.addCleanup(self.broker.close)
+
+    def event(self, number):
+        return {"type": "message.created", "message": {"id": number}}
+
+    async def received(self, subscription):
+        events = []
+        while (event := await subscription.get(timeout=0.05)) is not None:
+            events.append(event["message"]["id"])
+        return events
+
+    async def test_late_subscriber_gets_only_new_events(self):
+        self.broker.publish("room:1", self.event(1))
+        subscription = self.broker.subscribe("room:1")
+        self.broker.publish("room:1", self.event(2))
+        self.broker._read_new_events()
+        self.assertEqual(await self.received(subscription), [2])
+        subscription.close()
+
+    async def test_poller_reads_at_most_max_backlog_events(self):
+        self.broker.max_backlog = 2
+        subscription = self.broker.subscribe("room:1")
+        for number in range(5):
+            self.broker.publish("room:1", self.event(number))
+        self.broker._read_new_events()
+        self.assertEqual(await self.received(subscription), [3, 4])
+        subscription.close()
+
+        # بدون مشترک رویدادها خوانده نمی‌شوند و مشترک بعدی آن‌ها را نمی‌بیند
+        self.broker.publish("room:1", self.event(5))
+        self.broker._read_new_events()
+        subscription = self.broker.subscribe("room:1")
+        self.broker._read_new_events()
+        self.assertEqual(await self.received(subscription), [])
+        subscription.close()
+
+    def test_broker_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Broker()
+
+
+class PersianSearchTests(QueryBudgetTestCase):
+    def test_arabic_letters_fold_to_persian(self):
+        self.assertEqual(normalize_persian("كتاب علي"), "کتاب علی")
+        self.assertEqual(normalize_persian("مدرسة أحمد"), "مدرسه احمد")
+
+    def test_zwnj_joins_words(self):
+        self.assertEqual(normalize_persian("می\u200cخواهم"), "میخواهم")
+        self.assertEqual(
+            normalize_persian("می\u200cخواهم"), normalize_persian("میخواهم")
+        )
+
+    def test_diacritics_and_tatweel_are_removed(self):
+        self.assertEqual(normalize_persian("سَلامٌ"), "سلام")
+        self.assertEqual(normalize_persian("ســلام"), "سلام")
+
+    def test_digits_fold_to_ascii(self):
+        self.assertEqual(normalize_persian("۱۲۳ ٤٥٦"), "123 456")
+
+    def test_punctuation_and_case(self):
+        self.assertEqual(normalize_persian("  Hello،  دنیا!! "), "hello دنیا")
+        self.assertEqual(normalize_persian(None), "")
+
+    def test_documents_store_normalized_search_text(self):
+        message = Message(
+            challenge=self.challenge, user_id=str(self.user.id), content="كتابِ ۱"
+        ).save()
+        self.assertEqual(
+            Message.objects(id=message.id).scalar("search_text").first(), "کتاب 1"
+        )
+        content = Content(
+            title="موسيقي", description="آرامش\u200cبخش", category="music"
+        ).save()
+        stored = Content.objects(id=content.id).as_pymongo().first()
+        self.assertEqual(stored["search_title"], "موسیقی")
+        self.assertEqual(stored["search_description"], "ارامشبخش")
+
+    def test_invalid_challenge_id_is_rejected(self):
+        response = self.api_client().get(
+            reverse("search"), {"q": "سلام", "challenge_id": "not-an-id"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class SamplingFilterTests(TestCase):
+    def record(self, function, level=logging.INFO, name="chat.views.core_views"):
+        return logging.makeLogRecord(
+            {"name": name, "levelno": level, "funcName": function}
+        )
+
+    def test_only_read_paths_are_sampled(self):
+        sampling = SamplingFilter(
+            rates={"chat.views.core_views": 0}, functions=["list", "retrieve"]
+        )
+        self.assertFalse(sampling.filter(self.record("list")))
+        self.assertFalse(sampling.filter(self.record("retrieve")))
+        # ایجاد، حذف و گزارش برای ممیزی کامل نگه داشته می‌شوند
+        for function in ("create", "destroy", "report"):
+            self.assertTrue(sampling.filter(self.record(function)))
+        self.assertTrue(sampling.filter(self.record("list", logging.WARNING)))
+        self.assertTrue(
+            sampling.filter(self.record("list", name="chat.views.moderation_views"))
+        )
+
+    def test_settings_exempt_write_paths(self):
+        config = settings.LOGGING["filters"]["sampling"]
+        self.assertEqual(list(config["rates"]), ["chat.views.core_views"])
+        self.assertNotIn("create", config["functions"])
+        self.assertIn("list", config["functions"])
+
+
+class MessageArchiverTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.archiver = MessageArchiver(pause=0, grace=0)
+        self.hot = Message._get_collection()
+
+    def archived(self, message):
+        return archive_collection().find_one({"_id": message.id})
+
+    def test_writes_during_grace_window_survive(self):
+        self.archiver.copy_all(self.challenge.id)
+        # حذف نرم بعد از کپی اول و پیش از جابه‌جایی نهایی
+        self.hot.update_one({"_id": self.message.id}, {"$set": {"is_deleted": True}})
+
+        self.archiver.move_remaining(self.challenge.id)
+        self.assertTrue(self.archived(self.message)["is_deleted"])
+        self.assertEqual(self.hot.count_documents({"challenge": self.challenge.id}), 0)
+
+    def test_document_changed_while_moving_is_not_deleted_stale(self):
+        changed = self.messages[1]
+        bulk_write = self.archiver.archive.bulk_write
+        writes = []
+
+        def write_then_like(requests, **kwargs):
+            result = bulk_write(requests, **kwargs)
+            if not writes:
+                self.hot.update_one({"_id": changed.id}, {"$set": {"likes_count": 99}})
+            writes.append(len(requests))
+            return result
+
+        with mock.patch.object(
+            self.archiver.archive, "bulk_write", side_effect=write_then_like
+        ):
+            self.archiver.move_remaining(self.challenge.id)
+        # سند تغییر کرده در دور بعد دوباره کپی و سپس حذف می‌شود
+        self.assertGreater(len(writes), 1)
+        self.assertEqual(self.archived(changed)["likes_count"], 99)
+        self.assertEqual(self.hot.count_documents({"challenge": self.challenge.id}), 0)
+
+
+class ReRegisteredPhoneTests(QueryBudgetTestCase):
+    def test_deleted_users_tokens_do_not_carry_over(self):
+        old_client = self.api_client()
+        _, refresh = generate_tokens(self.user)
+        self.assertEqual(old_client.get(reverse("room-list")).status_code, 200)
+
+        # کاربر حذف می‌شود و کس دیگری با همان شماره ثبت‌نام می‌کند
+        self.user.delete()
+        newcomer = User(username="newcomer", phone=self.user.phone).save()
+
+        # کش هنوز سند کاربر قبلی را دارد، ولی توکن کاربر جدید پذیرفته می‌شود
+        response = self.api_client(newcomer).get(reverse("room-list"))
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(old_client.get(reverse("room-list")).status_code, 401)
+        response = APIClient().post(
+            reverse("token_refresh"), {"refresh": refresh}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class RevokedTokenTests(QueryBudgetTestCase):
+    def get_rooms(self, client):
+        return client.get(reverse("room-list")).status_code
+
+    def refresh(self, refresh):
+        return APIClient().post(
+            reverse("token_refresh"), {"refresh": refresh}, format="json"
+        )
+
+    def test_revoked_tokens_get_401(self):
+        client = self.api_client()
+        _, refresh = generate_tokens(self.user)
+        self.assertEqual(self.get_rooms(client), 200)
+
+        user = revoke_tokens(self.user)
+        self.assertEqual(self.get_rooms(client), 401)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+        # توکن صادرشده پس از ابطال معتبر است
+        self.assertEqual(self.get_rooms(self.api_client(user)), 200)
+
+    def test_ban_revokes_tokens_and_blocks_new_ones(self):
+        client = self.api_client()
+        user = set_banned(self.user, True)
+        self.assertEqual(self.get_rooms(client), 401)
+        # با توکن تازه احراز هویت موفق است ولی کاربر بن شده اجازه ندارد
+        self.assertEqual(self.get_rooms(self.api_client(user)), 403)
+
+        user = set_banned(user, False)
+        self.assertEqual(self.get_rooms(self.api_client(user)), 200)
+
+
+class ValidationCacheInvalidationTests(QueryBudgetTestCase):
+    """Writes evict the states they change, so validators never see stale ones"""
+
+    def setUp(self):
+        super().setUp()
+        self.clear_caches()
+        self.client = self.api_client()
+
+    def cached(self, kind, pk):
+        return validation_cache.get((kind, str(pk)))
+
+    def create_challenge(self):
+        expiration_time = datetime.now(timezone.utc) + timedelta(days=1)
+        return self.client.post(
+            reverse("challenge-list"),
+            {
+                "room": str(self.room.id),
+                "title": "new challenge",
+                "expiration_time": expiration_time.isoformat(),
+            },
+            format="json",
+        )
+
+    def post_message(self, **data):
+        data = {"challenge": str(self.challenge.id), "content": "hello", **data}
+        return self.client.post(reverse("message-list"), data, format="json")
+
+    def test_room_update_evicts_room(self):
+        self.assertEqual(get_room_state(self.room.id), {"is_active": True})
+        response = self.client.put(
+            reverse("room-detail", args=[self.room.id]),
+            {"is_active": False},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.cached("rooms", self.room.id))
+
+        response = self.create_challenge()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("room", response.data)
+
+    def test_room_destroy_evicts_room_and_challenges(self):
+        get_room_state(self.room.id)
+        get_challenge_state(self.challenge.id)
+        response = self.client.delete(reverse("room-detail", args=[self.room.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached("rooms", self.room.id))
+        self.assertIsNone(self.cached("challenges", self.challenge.id))
+
+        self.assertEqual(self.create_challenge().status_code, 400)
+        response = self.post_message()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("challenge", response.data)
+
+    def test_message_soft_delete_evicts_message(self):
+        self.assertEqual(get_message_state(self.message.id), {"is_deleted": False})
+        response = self.client.delete(reverse("message-detail", args=[self.message.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached("messages", self.message.id))
+
+        response = self.post_message(is_reply=True, parent_message=str(self.message.id))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parent_message", response.data)
+
+
+class AdminUserCacheTests(QueryBudgetTestCase):
+    """The admin panel evicts the users it bans or deletes from ``user_cache``"""
+
+    def setUp(self):
+        super().setUp()
+        self.clear_caches()
+        self.client = self.api_client()
+        # درخواست اول کاربر را در کش این worker قرار می‌دهد
+        self.assertEqual(self.client.get(reverse("room-list")).status_code, 200)
+        self.assertIsNotNone(user_cache.get(("phone", self.user.phone)))
+
+    def admin_post(self, name):
+        path = reverse(name, args=[self.user.id])
+        with mock.patch(
+            "chat.views.admin_panel.invalidate_user", wraps=invalidate_user
+        ) as invalidate:
+            self.admin_session_client().post(path)
+        invalidate.assert_called_once()
+        self.assertEqual(invalidate.call_args.args[0].id, self.user.id)
+
+    def test_ban_evicts_user(self):
+        self.admin_post("toggle_ban_user")
+        self.assertIsNone(user_cache.get(("phone", self.user.phone)))
+        self.assertEqual(self.client.get(reverse("room-list")).status_code, 401)
+
+    def test_delete_evicts_user(self):
+        self.admin_post("delete_user")
+        self.assertIsNone(user_cache.get(("phone", self.user.phone)))
+        self.assertEqual(self.client.get(reverse("room-list")).status_code, 401)
+
+
+class CacheMetricsTests(QueryBudgetTestCase):
+    def metric(self, name, cache):
+        body = Client().get(reverse("metrics")).content.decode()
+        prefix = f'{name}{{cache="{cache}"}} '
+        for line in body.splitlines():
+            if line.startswith(prefix):
+                return int(line[len(prefix) :])
+        self.fail(f"{prefix.strip()} missing from /metrics")
+
+    def test_user_cache_stats_are_exported(self):
+        self.clear_caches()
+        hits = self.metric("cache_hits_total", "user")
+        misses = self.metric("cache_misses_total", "user")
+        client = self.api_client()
+        for _ in range(3):
+            client.get(reverse("room-list"))
+        self.assertEqual(self.metric("cache_misses_total", "user"), misses + 1)
+        self.assertEqual(self.metric("cache_hits_total", "user"), hits + 2)
+        self.assertGreaterEqual(self.metric("cache_evictions_total", "user"), 0)
+
+
+def reset_limiter():
+    if throttling._limiter is not None:
+        throttling._limiter.cache.close()
+    throttling._limiter = None
+
+
+class ThrottleTestCase(QueryBudgetTestCase):
+    """Token buckets in a fresh directory, with the ``rates`` of the test class"""
+
+    rates = {}
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(
+            RATE_LIMIT={"DIRECTORY": directory.name, "RATES": self.rates}
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_limiter()
+        self.addCleanup(reset_limiter)
+
+
+class TokenBucketTests(ThrottleTestCase):
+    rates = {"otp_request": {"phone": "2/min", "ip": "20/min"}}
+
+    def test_bucket_refills_over_time(self):
+        limiter = throttling.get_limiter()
+        with mock.patch("chat.throttling.time.time", return_value=1000.0) as clock:
+            self.assertEqual(limiter.consume("k", 2, 60), (True, 0))
+            self.assertEqual(limiter.consume("k", 2, 60), (True, 0))
+            allowed, wait = limiter.consume("k", 2, 60)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(wait, 30)
+
+            # هر 30 ثانیه یک توکن برمی‌گردد و سطل از ظرفیت بیشتر پر نمی‌شود
+            clock.return_value = 1030.0
+            self.assertTrue(limiter.consume("k", 2, 60)[0])
+            self.assertFalse(limiter.consume("k", 2, 60)[0])
+            clock.return_value = 2000.0
+            self.assertTrue(limiter.consume("k", 2, 60)[0])
+            self.assertTrue(limiter.consume("k", 2, 60)[0])
+            self.assertFalse(limiter.consume("k", 2, 60)[0])
+
+    def test_exhausted_bucket_returns_retry_after(self):
+        client = APIClient()
+        credentials = {"phone": self.user.phone, "password": "secret"}
+        for _ in range(2):
+            response = client.post(reverse("request_code"), credentials, format="json")
+            self.assertEqual(response.status_code, 200)
+        response = client.post(reverse("request_code"), credentials, format="json")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response["Retry-After"]) <= 30)
+
+        # سطل هر شماره جداست
+        other = {"phone": "09129999999", "password": "secret"}
+        response = client.post(reverse("request_code"), other, format="json")
+        self.assertEqual(response.status_code, 200)
+
+
+class MessageThrottleTests(ThrottleTestCase):
+    rates = {"message_create": {"user": "3/min"}, "message_bulk": {"user": "10/h"}}
+
+    def bulk(self, client, count):
+        items = [
+            {"challenge": str(self.challenge.id), "content": f"bulk {index}"}
+            for index in range(count)
+        ]
+        return client.post(reverse("message-bulk-create"), items, format="json")
+
+    def test_bulk_spends_one_token_per_message(self):
+        client = self.api_client()
+        self.assertEqual(self.bulk(client, 6).status_code, 201)
+        self.assertEqual(self.bulk(client, 6).status_code, 429)
+        self.assertEqual(self.bulk(client, 4).status_code, 201)
+
+        # بزرگ‌تر از ظرفیت سطل: هرگز پذیرفته نمی‌شود، پس Retry-After ندارد
+        response = self.bulk(client, 11)
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn("Retry-After", response)
+
+        # ارسال تکی سطل جداگانه خودش را دارد
+        response = client.post(
+            reverse("message-list"),
+            {"challenge": str(self.challenge.id), "content": "single"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+
+class OTPTests(ThrottleTestCase):
+    """Every store locks a code after ``max_attempts`` wrong guesses"""
+
+    def stores(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        disk = otp.DiskCacheOTPStore(directory.name, max_attempts=3)
+        self.addCleanup(disk.cache.close)
+        return [
+            otp.MemoryOTPStore(max_attempts=3),
+            disk,
+            otp.MongoOTPStore(max_attempts=3),
+        ]
+
+    def test_wrong_codes_lock_the_code(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.set("0912", "123456", 60)
+                self.assertEqual(store.consume("0912", "000000"), otp.OTP_INVALID)
+                self.assertEqual(store.consume("0912", "000000"), otp.OTP_INVALID)
+                self.assertEqual(store.consume("0912", "000000"), otp.OTP_LOCKED)
+                # کد قفل‌شده حذف شده و کد درست هم دیگر پذیرفته نمی‌شود
+                self.assertEqual(store.consume("0912", "123456"), otp.OTP_INVALID)
+
+    def test_code_is_consumed_once(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.set("0912", "123456", 60)
+                self.assertEqual(store.consume("0912", "000000"), otp.OTP_INVALID)
+                self.assertEqual(store.consume("0912", "123456"), otp.OTP_VALID)
+                self.assertEqual(store.consume("0912", "123456"), otp.OTP_INVALID)
+
+    def test_expired_code_is_invalid(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.set("0912", "123456", -1)
+                self.assertEqual(store.consume("0912", "123456"), otp.OTP_INVALID)
+
+    def test_one_code_document_per_phone(self):
+        collection = OTPCode._get_collection()
+        collection.insert_one({"phone": "0912", "code": "1", "attempts": 0})
+        with self.assertRaises(DuplicateKeyError):
+            collection.insert_one({"phone": "0912", "code": "2", "attempts": 0})
+
+    def test_concurrent_upsert_is_retried(self):
+        store = otp.MongoOTPStore(max_attempts=3)
+        update_one = QuerySet.update_one
+        calls = []
+
+        def lose_race(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                # درخواست دیگری همین لحظه سند این شماره را ساخته است
+                update_one(queryset, **kwargs)
+                raise NotUniqueError("duplicate phone")
+            return update_one(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update_one", lose_race):
+            store.set("0912", "123456", 60)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(OTPCode.objects(phone="0912").count(), 1)
+        self.assertEqual(store.consume("0912", "123456"), otp.OTP_VALID)
+
+    def test_login_is_locked_after_too_many_wrong_codes(self):
+        client = APIClient()
+        credentials = {"phone": self.user.phone, "password": "secret"}
+        response = client.post(reverse("request_code"), credentials, format="json")
+        code = response.data["otp"]
+        wrong = "000000" if code != "000000" else "111111"
+
+        attempts = settings.OTP_STORE["OPTIONS"]["max_attempts"]
+        for _ in range(attempts - 1):
+            response = client.post(
+                reverse("verify_otp_login"),
+                {**credentials, "code": wrong},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 401)
+        response = client.post(
+            reverse("verify_otp_login"), {**credentials, "code": wrong}, format="json"
+        )
+        self.assertEqual(response.status_code, 429)
+
+        response = client.post(
+            reverse("verify_otp_login"), {**credentials, "code": code}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ReportTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.message = self.messages[-1]
+        self.path = reverse("message-report", args=[self.message.id])
+
+    def report(self, user=None, reason="spam"):
+        return self.api_client(user).post(self.path, {"reason": reason}, format="json")
+
+    def case(self):
+        return ModerationCase.objects.get(message=self.message.id)
+
+    def test_repeat_report_counts_once(self):
+        self.assertLess(self.report().status_code, 300)
+        self.assertLess(self.report(reason="abuse").status_code, 300)
+        self.assertEqual(self.case().report_count, 1)
+        self.assertEqual(
+            MessageReport.objects(message=self.message.id).scalar("reason").get(),
+            "abuse",
+        )
+
+        self.assertLess(self.report(self.admin).status_code, 300)
+        self.assertEqual(self.case().report_count, 2)
+
+    @contextmanager
+    def concurrent_upsert(self, document_type):
+        """The first upsert on ``document_type`` loses to an identical one"""
+        modify = QuerySet.modify
+        raced = []
+
+        def lose_first_upsert(queryset, **kwargs):
+            if kwargs.get("upsert") and queryset._document is document_type:
+                if not raced:
+                    raced.append(modify(queryset, **kwargs))
+                    raise NotUniqueError("duplicate key")
+            return modify(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "modify", lose_first_upsert):
+            yield raced
+        self.assertEqual(len(raced), 1)
+
+    def test_case_upsert_race_is_retried(self):
+        # گزارش کاربر دیگری همزمان پرونده را ساخت
+        with self.concurrent_upsert(ModerationCase):
+            response = self.report()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["report_count"], 2)
+        self.assertEqual(ModerationCase.objects(message=self.message.id).count(), 1)
+
+    def test_same_user_report_race_counts_once(self):
+        # درخواست همزمان همین کاربر گزارش را ثبت کرد و خودش شمارش را بالا می‌برد
+        with self.concurrent_upsert(MessageReport):
+            response = self.report()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["report_count"], 0)
+        self.assertEqual(MessageReport.objects(message=self.message.id).count(), 1)
+        self.assertFalse(self.case().resolved)
+
+
+class ArchivedModerationTests(QueryBudgetTestCase):
+    """Reports and moderation deletes reach messages that were archived"""
+
+    def setUp(self):
+        super().setUp()
+        MessageArchiver(pause=0, grace=0).archive_challenge(self.challenge.id)
+        self.clear_caches()
+        self.archive = archive_collection()
+
+    def resolve(self, case):
+        path = reverse("moderation-case-resolve", args=[case.id])
+        return self.api_client(self.admin).post(
+            path, {"resolution": "deleted"}, format="json"
+        )
+
+    def test_report_archived_message(self):
+        message = self.messages[-1]
+        path = reverse("message-report", args=[message.id])
+        response = self.api_client().post(path, {"reason": "spam"}, format="json")
+        self.assertLess(response.status_code, 300)
+        self.assertTrue(self.archive.find_one({"_id": message.id})["is_reported"])
+
+    def test_delete_archived_message(self):
+        self.assertEqual(self.resolve(self.cases[0]).status_code, 200)
+        self.assertTrue(
+            self.archive.find_one({"_id": self.messages[0].id})["is_deleted"]
+        )
+
+        response = self.api_client().get(
+            reverse("message-list"), {"challenge_id": str(self.challenge.id)}
+        )
+        ids = {item["id"] for item in response.data["results"]}
+        self.assertNotIn(str(self.messages[0].id), ids)
+
+    def test_missing_message_leaves_case_open(self):
+        self.archive.delete_one({"_id": self.messages[0].id})
+        self.assertEqual(self.resolve(self.cases[0]).status_code, 404)
+        self.assertFalse(ModerationCase.objects.get(id=self.cases[0].id).resolved)
+
+
+def sleep_then_hash(password, rounds):
+    time.sleep(0.2)
+    return password
+
+
+class PasswordHasherTests(TestCase):
+    """Pool failures and timeouts; a thread pool stands in for the processes"""
+
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def broken_pool(self):
+        pool = mock.Mock()
+        pool.submit.side_effect = BrokenProcessPool("worker died")
+        return pool
+
+    def test_broken_pool_is_replaced_once(self):
+        hasher = passwords.PasswordHasher(rounds=4, workers=1)
+        broken = self.broken_pool()
+        hasher._executor = broken
+        with mock.patch.object(hasher, "get_executor", side_effect=[broken, self.pool]):
+            hashed = hasher.hash("secret")
+        self.assertTrue(passwords.get_context(4).verify("secret", hashed))
+        broken.shutdown.assert_called_once()
+        self.assertIsNone(hasher._executor)
+
+    def test_pool_broken_twice_is_busy(self):
+        hasher = passwords.PasswordHasher(rounds=4, workers=1)
+        pools = [self.broken_pool(), self.broken_pool()]
+        with mock.patch.object(hasher, "get_executor", side_effect=pools):
+            with self.assertRaises(passwords.PasswordHasherBusy):
+                hasher.hash("secret")
+
+    def test_slot_and_result_share_one_timeout(self):
+        hasher = passwords.PasswordHasher(
+            rounds=4, workers=1, max_pending=1, timeout=0.3
+        )
+        hasher._executor = self.pool
+        # جای صف 0.2 ثانیه گرفته است و کار هم 0.2 ثانیه طول می‌کشد
+        hasher._slots.acquire()
+        threading.Timer(0.2, hasher._slots.release).start()
+        started = time.monotonic()
+        with self.assertRaises(passwords.PasswordHasherBusy):
+            hasher.run(sleep_then_hash, "secret")
+        self.assertLess(time.monotonic() - started, 0.4)
@@ -1,3 +1,4 @@
+from chat.metrics import metrics_view
 from chat.views.admin_panel import (
     admin_login_view,
     admin_logout_view,
@@ -18,9 +19,12 @@ from chat.views.core_views import (
     MoodSuggestionsAPIView,
     PopularContentAPIView,
     RoomViewSet,
+    SearchAPIView,
     SubmitMoodAPIView,
 )
 from chat.views.home import home
+from chat.views.moderation_views import ModerationCaseViewSet
+from chat.views.realtime_views import challenge_events, room_events
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path, re_path
@@ -50,12 +54,20 @@ router.register(r"rooms", RoomViewSet, basename="room")
 router.register(r"challenges", ChallengeViewSet, basename="challenge")
 router.register(r"messages", MessageViewSet, basename="message")
 router.register(r"responses", ChallengeResponseViewSet, basename="response")
+router.register(r"moderation/cases", ModerationCaseViewSet, basename="moderation-case")
 
 urlpatterns = [
     # صفحه اصلی
     path("", home, name="home"),
     # API Endpoints
     path("api/", include(router.urls)),
+    # رویدادهای بلادرنگ (SSE، فقط روی سرور ASGI)
+    path(
+        "api/stream/challenges/<str:challenge_id>/",
+        challenge_events,
+        name="challenge_events",
+    ),
+    path("api/stream/rooms/<str:room_id>/", room_events, name="room_events"),
     # احراز هویت
     path(
         "auth/request-code/", RequestOTPWithPasswordView.as_view(), name="request_code"
@@ -67,9 +79,9 @@ urlpatterns = [
     path("admin/logout/", admin_logout_view, name="admin_logout"),
     path("admin/users/", user_admin_panel, name="user_admin_panel"),
     path(
-        "admin/users/<int:user_id>/toggle-ban/", toggle_ban_user, name="toggle_ban_user"
+        "admin/users/<str:user_id>/toggle-ban/", toggle_ban_user, name="toggle_ban_user"
     ),
-    path("admin/users/<int:user_id>/delete/", delete_user, name="delete_user"),
+    path("admin/users/<str:user_id>/delete/", delete_user, name="delete_user"),
     # API های مود و محتوا
     path("api/mood/submit/", SubmitMoodAPIView.as_view(), name="submit_mood"),
     path(
@@ -83,6 +95,10 @@ urlpatterns = [
     path(
         "api/content/categories/", CategoryListAPIView.as_view(), name="category_list"
     ),
+    # جستجو در پیام‌ها و محتوا
+    path("api/search/", SearchAPIView.as_view(), name="search"),
+    # متریک‌های Prometheus
+    path("metrics", metrics_view, name="metrics"),
     # مستندات API
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
@@ -0,0 +1,30 @@
+# chat/user_cache.py
+from chat.cache import TTLCache
+from chat.metrics import register_cache
+from chat.models import User
+from django.conf import settings
+
+_config = getattr(settings, "USER_CACHE", {})
+user_cache = TTLCache(maxsize=_config.get("MAXSIZE", 10000), ttl=_config.get("TTL", 30))
+register_cache("user", user_cache)
+
+
+def get_user_by_phone(phone):
+    """
+    The user a token belongs to, or ``None``. The raw document is cached and
+    a fresh ``User`` is built from it on every call, so views can modify
+    ``request.mongo_user`` without affecting other requests.
+    """
+    data = user_cache.get_or_load(
+        ("phone", phone),
+        # هش رمز در کش نگه داشته نمی‌شود
+        lambda: User.objects(phone=phone).exclude("password").as_pymongo().first(),
+    )
+    if data is None:
+        return None
+    return User._from_son(dict(data))
+
+
+def invalidate_user(user):
+    """Call after banning, deleting or changing the password of ``user``"""
+    user_cache.invalidate(("phone", user.phone))
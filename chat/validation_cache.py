@@ -0,0 +1,94 @@
+# chat/validation_cache.py
+from datetime import timezone
+
+from bson import ObjectId
+from chat.cache import TTLCache
+from chat.metrics import register_cache
+from chat.models import Challenge, Message, Room
+from django.conf import settings
+
+# فقط فیلدهایی که اعتبارسنج‌ها لازم دارند نگه داشته می‌شوند، نه کل سند
+ROOM_FIELDS = ("is_active",)
+CHALLENGE_FIELDS = ("room", "expiration_time")
+MESSAGE_FIELDS = ("is_deleted",)
+
+_config = getattr(settings, "VALIDATION_CACHE", {})
+validation_cache = TTLCache(
+    maxsize=_config.get("MAXSIZE", 10000), ttl=_config.get("TTL", 30)
+)
+register_cache("validation", validation_cache)
+
+
+def _to_state(document_type, data, field_names):
+    state = {}
+    for name in field_names:
+        field = document_type._fields[name]
+        state[name] = data.get(field.db_field, field.default)
+    return state
+
+
+def _load_state(document_type, pk, field_names):
+    data = document_type.objects(id=pk).only(*field_names).as_pymongo().first()
+    if data is None:
+        return None
+    return _to_state(document_type, data, field_names)
+
+
+def _aware_challenge_state(state):
+    if state and state["expiration_time"].tzinfo is None:
+        state["expiration_time"] = state["expiration_time"].replace(tzinfo=timezone.utc)
+    return state
+
+
+def get_room_state(pk):
+    """``{"is_active"}`` of a room, or ``None`` if it does not exist"""
+    return validation_cache.get_or_load(
+        ("rooms", str(pk)), lambda: _load_state(Room, pk, ROOM_FIELDS)
+    )
+
+
+def get_challenge_state(pk):
+    """``{"room", "expiration_time"}`` of a challenge, or ``None``"""
+
+    def load():
+        return _aware_challenge_state(_load_state(Challenge, pk, CHALLENGE_FIELDS))
+
+    return validation_cache.get_or_load(("challenges", str(pk)), load)
+
+
+def get_challenge_states(pks):
+    """``{ObjectId: state}`` of the challenges in ``pks`` that exist, one query for misses"""
+    states = {}
+    missing = []
+    for pk in pks:
+        state = validation_cache.get(("challenges", str(pk)))
+        if state is None:
+            missing.append(pk)
+        else:
+            states[ObjectId(str(pk))] = state
+    if missing:
+        queryset = Challenge.objects(id__in=missing).only(*CHALLENGE_FIELDS)
+        for data in queryset.as_pymongo():
+            state = _aware_challenge_state(_to_state(Challenge, data, CHALLENGE_FIELDS))
+            validation_cache.set(("challenges", str(data["_id"])), state)
+            states[data["_id"]] = state
+    return states
+
+
+def get_message_state(pk):
+    """``{"is_deleted"}`` of a message, or ``None``"""
+    return validation_cache.get_or_load(
+        ("messages", str(pk)), lambda: _load_state(Message, pk, MESSAGE_FIELDS)
+    )
+
+
+def invalidate_room(pk):
+    validation_cache.invalidate(("rooms", str(pk)))
+
+
+def invalidate_challenge(pk):
+    validation_cache.invalidate(("challenges", str(pk)))
+
+
+def invalidate_message(pk):
+    validation_cache.invalidate(("messages", str(pk)))
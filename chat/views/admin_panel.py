@@ -1,6 +1,8 @@
-import bcrypt
 from bson import ObjectId
 from chat.models import User
+from chat.passwords import PasswordHasherBusy
+from chat.revocation import revoke_tokens, set_banned
+from chat.user_cache import invalidate_user
 from django.contrib import messages
 from django.shortcuts import redirect, render
 
@@ -12,7 +14,12 @@ def admin_login_view(request):
         password = request.POST.get("password")
 
         user = User.objects(phone=phone, is_admin=True).first()
-        if user and bcrypt.checkpw(password.encode(), user.password.encode()):
+        try:
+            valid = bool(user and password and user.check_password(password))
+        except PasswordHasherBusy:
+            messages.error(request, "سرور مشغول است، لطفاً دوباره تلاش کنید.")
+            return render(request, "admin_login.html")
+        if valid:
             request.session["admin_user_id"] = str(user.id)
             return redirect("user_admin_panel")
         else:
@@ -59,10 +66,11 @@ def toggle_ban_user(request, user_id):
     if not admin_id:
         return redirect("admin_login")
 
-    user = User.objects(id=user_id).first()
+    user = User.objects(id=user_id).first() if ObjectId.is_valid(user_id) else None
     if user:
-        user.is_banned = not user.is_banned
-        user.save()
+        # توکن‌های کاربر بن‌شده در چند ثانیه در همه worker ها باطل می‌شوند
+        set_banned(user, not user.is_banned)
+        invalidate_user(user)
     return redirect("user_admin_panel")
 
 
@@ -72,7 +80,9 @@ def delete_user(request, user_id):
     if not admin_id:
         return redirect("admin_login")
 
-    user = User.objects(id=user_id).first()
+    user = User.objects(id=user_id).first() if ObjectId.is_valid(user_id) else None
     if user:
+        revoke_tokens(user)
         user.delete()
+        invalidate_user(user)
     return redirect("user_admin_panel")
@@ -1,26 +1,28 @@
 import logging
-from datetime import datetime, timedelta, timezone
 from random import randint
 
 import jwt
-from chat.models import OTPCode, User
+from chat.models import User
+from chat.otp import OTP_LOCKED, OTP_VALID, get_otp_store
+from chat.passwords import PasswordHasherBusy
+from chat.throttling import TokenBucketThrottle
 from chat.utils import generate_tokens
 from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-# تنظیمات لاگ‌گیری
+# لاگ‌ها از طریق صف LOGGING (chat.logs) نوشته می‌شوند؛ کد OTP هرگز لاگ نمی‌شود
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler("auth.log")
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+# مدت اعتبار کد OTP (ثانیه)
+OTP_TTL = 120
 
 
 class RequestOTPWithPasswordView(APIView):
     permission_classes = []
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "otp_request"
 
     def post(self, request):
         try:
@@ -36,37 +38,35 @@ class RequestOTPWithPasswordView(APIView):
             if user:
                 # کاربر قبلاً ثبت‌نام کرده، باید رمز صحیح بده
                 if not user.check_password(password):
-                    logger.warning(f"این شماره قبلا وجود داره: {phone}")
+                    logger.warning("این شماره قبلا وجود داره: %s", phone)
                     return Response({"error": "این شماره قبلا وجود داره."}, status=401)
-                logger.info(f"کاربر موجود، رمز صحیح است: {phone}")
+                logger.info("کاربر موجود، رمز صحیح است: %s", phone)
             else:
-                logger.info(f"کاربر جدید: {phone}")
+                logger.info("کاربر جدید: %s", phone)
 
-            logger.info(f"در حال تولید کد OTP برای: {phone}")
+            logger.info("در حال تولید کد OTP برای: %s", phone)
             code = str(randint(100000, 999999))
-            expires_at = datetime.now(timezone.utc) + timedelta(minutes=2)
-
-            # حذف کدهای قبلی
-            deleted_count = OTPCode.objects(phone=phone).delete()
-            logger.info(f"{deleted_count} کد قبلی حذف شد")
-
-            # ذخیره کد جدید
-            OTPCode(phone=phone, code=code, expires_at=expires_at).save()
-            logger.info(f"کد OTP جدید برای {phone} ذخیره شد (انقضا: {expires_at})")
-            logger.info(f"کد OTP برای {phone}: {code}")
 
-            if settings.DEBUG:
-                logger.debug(f"کد در حالت DEBUG: {code}")
+            # کد جدید جایگزین کد قبلی می‌شود (یک عملیات)
+            get_otp_store().set(phone, code, OTP_TTL)
+            logger.info(
+                "کد OTP جدید برای %s ذخیره شد (اعتبار: %s ثانیه)", phone, OTP_TTL
+            )
 
             return Response({"message": "کد تأیید ارسال شد.", "otp": code}, status=200)
 
+        except PasswordHasherBusy as e:
+            logger.warning("صف هش رمز پر است: %s", e)
+            return Response({"error": "سرور مشغول است، دوباره تلاش کنید."}, status=503)
         except Exception as e:
-            logger.error(f"خطا در تولید OTP: {str(e)}", exc_info=True)
+            logger.error("خطا در تولید OTP: %s", e, exc_info=True)
             return Response({"error": "خطای سرور رخ داده است."}, status=500)
 
 
 class VerifyOTPAndLoginView(APIView):
     permission_classes = []
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "otp_verify"
 
     def post(self, request):
         try:
@@ -79,45 +79,41 @@ class VerifyOTPAndLoginView(APIView):
                 logger.warning("فیلدهای ضروری ارائه نشده")
                 return Response({"error": "همه فیلدها الزامی هستند."}, status=400)
 
-            logger.info(f"جستجوی کد OTP برای {phone}")
-            otp = OTPCode.objects(phone=phone, code=code).first()
-
-            if not otp:
-                logger.warning(f"کد OTP نامعتبر برای {phone}")
+            # بررسی، حذف و شمارش تلاش‌های ناموفق در یک عملیات اتمیک
+            result = get_otp_store().consume(phone, str(code))
+            if result == OTP_LOCKED:
+                logger.warning("تعداد تلاش‌های ناموفق OTP برای %s تمام شد", phone)
+                return Response(
+                    {"error": "تعداد تلاش‌ها بیش از حد مجاز است. کد جدید بگیرید."},
+                    status=429,
+                )
+            if result != OTP_VALID:
+                logger.warning("کد OTP نامعتبر برای %s", phone)
                 return Response({"error": "کد اشتباه یا منقضی شده."}, status=401)
-
-            expires_at = (
-                otp.expires_at.replace(tzinfo=timezone.utc)
-                if otp.expires_at.tzinfo is None
-                else otp.expires_at
-            )
-
-            if expires_at < datetime.now(timezone.utc):
-                logger.warning(f"کد منقضی شده برای {phone} (تاریخ انقضا: {expires_at})")
-                return Response({"error": "کد اشتباه یا منقضی شده."}, status=401)
-
-            otp.delete()
-            logger.info(f"کد OTP برای {phone} مصرف شد")
+            logger.info("کد OTP برای %s مصرف شد", phone)
 
             user = User.objects(phone=phone).first()
 
             if not user:
-                logger.info(f"کاربر جدید با شماره {phone} در حال ایجاد است")
+                logger.info("کاربر جدید با شماره %s در حال ایجاد است", phone)
                 user = User(username=phone, phone=phone)
                 user.set_password(password)
                 user.save()
-                logger.info(f"کاربر جدید ایجاد شد: {user.id}")
+                logger.info("کاربر جدید ایجاد شد: %s", user.id)
             else:
                 if not user.check_password(password):
-                    logger.warning(f"رمز عبور نادرست برای کاربر {phone}")
+                    logger.warning("رمز عبور نادرست برای کاربر %s", phone)
                     return Response({"error": "رمز اشتباه است."}, status=401)
 
             access, refresh = generate_tokens(user)
-            logger.info(f"ورود موفق برای کاربر {phone}")
+            logger.info("ورود موفق برای کاربر %s", phone)
             return Response({"access": access, "refresh": refresh})
 
+        except PasswordHasherBusy as e:
+            logger.warning("صف هش رمز پر است: %s", e)
+            return Response({"error": "سرور مشغول است، دوباره تلاش کنید."}, status=503)
         except Exception as e:
-            logger.error(f"خطا در تأیید OTP: {str(e)}", exc_info=True)
+            logger.error("خطا در تأیید OTP: %s", e, exc_info=True)
             return Response({"error": "خطای سرور رخ داده است."}, status=500)
 
 
@@ -145,19 +141,26 @@ class RefreshTokenView(APIView):
             user = User.objects(phone=user_phone).first()
 
             if not user:
-                logger.warning(f"کاربر با شماره {user_phone} یافت نشد")
+                logger.warning("کاربر با شماره %s یافت نشد", user_phone)
                 return Response({"error": "کاربر یافت نشد."}, status=404)
 
+            uid = payload.get("uid")
+            if payload.get("ver", 0) < user.token_version or (
+                uid and str(user.id) != uid
+            ):
+                logger.warning("توکن رفرش باطل شده برای کاربر %s", user_phone)
+                return Response({"error": "توکن باطل شده است."}, status=401)
+
             access_token, _ = generate_tokens(user)
-            logger.info(f"توکن جدید برای کاربر {user_phone} ایجاد شد")
+            logger.info("توکن جدید برای کاربر %s ایجاد شد", user_phone)
             return Response({"access": access_token})
 
         except jwt.ExpiredSignatureError:
             logger.warning("توکن رفرش منقضی شده")
             return Response({"error": "توکن رفرش منقضی شده است."}, status=401)
         except jwt.InvalidTokenError as e:
-            logger.error(f"توکن نامعتبر: {str(e)}")
+            logger.error("توکن نامعتبر: %s", e)
             return Response({"error": "توکن نامعتبر است."}, status=400)
         except Exception as e:
-            logger.error(f"خطای ناشناخته در تمدید توکن: {str(e)}", exc_info=True)
+            logger.error("خطای ناشناخته در تمدید توکن: %s", e, exc_info=True)
             return Response({"error": "خطای سرور رخ داده است."}, status=500)
@@ -1,54 +1,162 @@
 import logging
 from datetime import datetime, timezone
-
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from chat.archive import (
+    archived_messages,
+    messages_for_challenge,
+    prefetch_archive_states,
+)
 from chat.auth_backends import IsAuthenticatedMongo, IsNotBanned, IsRoomCreator
-from chat.models import Challenge, ChallengeResponse, Content, Message, Room, UserMood
+from chat.conditional import conditional_get, content_etag
+from chat.models import (
+    Challenge,
+    ChallengeResponse,
+    Content,
+    Message,
+    Room,
+    User,
+    UserMood,
+)
+from chat.moderation import record_report
+from chat.pagination import KeysetPagination, RankedPagination, get_int_param
+from chat.prefetch import prefetch_references, reference_id
+from chat.projections import Projection, only_requested, requested_fields
+from chat.realtime import publish_message_event
+from chat.renderers import FastJSONRenderer
+from chat.search import normalize_persian
 from chat.serializers import (
     ChallengeResponseSerializer,
     ChallengeSerializer,
     ContentSerializer,
+    MessageReportSerializer,
     MessageSerializer,
     RoomSerializer,
     UserMoodSerializer,
+    UserSerializer,
 )
+from chat.throttling import TokenBucketThrottle
+from chat.validation_cache import (
+    get_challenge_states,
+    invalidate_challenge,
+    invalidate_message,
+    invalidate_room,
+)
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from mongoengine.errors import NotUniqueError, ValidationError
+from pymongo.errors import BulkWriteError
 from rest_framework import status, views, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-# تنظیمات پایه برای لاگ‌گیری
+# لاگ‌ها از طریق صف LOGGING (chat.logs) نوشته می‌شوند
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-# ایجاد handler برای ذخیره لاگ‌ها در فایل
-file_handler = logging.FileHandler("chat_views.log")
-file_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+def publish_likes_event(message):
+    publish_message_event(
+        "message.likes",
+        message,
+        {"id": str(message.id), "likes_count": message.likes_count},
+    )
+
+
+async def iterate_in_thread(iterator):
+    """
+    Async iterator over a blocking ``iterator``; each item is produced by
+    ``sync_to_async`` so the event loop is free while Mongo is read.
+    """
+    next_item = sync_to_async(next)
+    done = object()
+    while True:
+        item = await next_item(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def thread_pipeline(collection_name, pk, max_depth, limit):
+    """Root message ``pk`` and up to ``limit + 1`` replies, breadth first"""
+    return [
+        {"$match": {"_id": ObjectId(pk), "is_deleted": False}},
+        {
+            "$facet": {
+                "root": [],
+                "replies": [
+                    {
+                        "$graphLookup": {
+                            "from": collection_name,
+                            "startWith": "$_id",
+                            "connectFromField": "_id",
+                            "connectToField": "parent_message",
+                            "as": "replies",
+                            "maxDepth": max_depth - 1,
+                            "depthField": "depth",
+                        }
+                    },
+                    {"$unwind": "$replies"},
+                    {"$replaceRoot": {"newRoot": "$replies"}},
+                    # پاسخ‌های حذف‌شده نمایش داده نمی‌شوند ولی زیرشاخه‌شان پیمایش می‌شود
+                    {"$match": {"is_deleted": False}},
+                    {"$sort": {"depth": 1, "created_at": 1, "_id": 1}},
+                    {"$limit": limit + 1},
+                ],
+            }
+        },
+    ]
+
+
+def get_liked_ids(request, messages):
+    """Ids of ``messages`` (documents or raw dicts) liked by the current user"""
+    if not messages:
+        return set()
+    ids = [
+        message["_id"] if isinstance(message, dict) else message.pk
+        for message in messages
+    ]
+    return set(
+        Message.objects(id__in=ids, likes=str(request.mongo_user.id)).scalar("id")
+    )
+
+
+# فهرست‌های فقط‌خواندنی مستقیماً از BSON ساخته می‌شوند، بدون Document و فیلدهای DRF
+MESSAGE_LIST = Projection(MessageSerializer, Message, exclude=("likes",))
+ROOM_LIST = Projection(
+    RoomSerializer, Room, nested={"creator": Projection(UserSerializer, User)}
+)
+CONTENT_LIST = Projection(ContentSerializer, Content)
 
 
 class RoomViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticatedMongo, IsNotBanned]
+    renderer_classes = [FastJSONRenderer]
 
     def list(self, request):
         logger.info("Listing all active rooms")
-        rooms = Room.objects(is_active=True).order_by("-created_at")
-        serializer = RoomSerializer(rooms, many=True)
-        return Response(serializer.data)
+        projection = ROOM_LIST.restrict(requested_fields(request, RoomSerializer))
+        paginator = KeysetPagination()
+        rooms = projection.queryset(
+            Room.objects(is_active=True), paginator.ordering_field
+        )
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        return paginator.get_paginated_response(projection.serialize(page))
 
     def retrieve(self, request, pk=None):
-        logger.info(f"Retrieving room with id: {pk}")
+        logger.info("Retrieving room with id: %s", pk)
+        fields = requested_fields(request, RoomSerializer)
         try:
-            room = Room.objects(id=pk).first()
+            room = only_requested(Room.objects(id=pk), RoomSerializer, fields).first()
             if not room:
-                logger.warning(f"Room not found with id: {pk}")
+                logger.warning("Room not found with id: %s", pk)
                 return Response(
                     {"detail": "اتاق پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
                 )
-            return Response(RoomSerializer(room).data)
+            return Response(RoomSerializer(room, fields=fields).data)
         except ValidationError:
-            logger.error(f"Invalid room ID format: {pk}")
+            logger.error("Invalid room ID format: %s", pk)
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
             )
@@ -61,29 +169,29 @@ class RoomViewSet(viewsets.ViewSet):
                 room = Room(**serializer.validated_data)
                 room.creator = request.mongo_user
                 room.save()
-                logger.info(f"Room created successfully with id: {room.id}")
+                logger.info("Room created successfully with id: %s", room.id)
                 return Response(
                     RoomSerializer(room).data, status=status.HTTP_201_CREATED
                 )
             except ValidationError as e:
-                logger.error(f"Room validation error: {str(e)}")
+                logger.error("Room validation error: %s", e)
                 return Response(
                     {"error": "خطا در اعتبارسنجی داده‌ها"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        logger.error(f"Room creation failed with errors: {serializer.errors}")
+        logger.error("Room creation failed with errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def update(self, request, pk=None):
-        logger.info(f"Updating room with id: {pk}")
+        logger.info("Updating room with id: %s", pk)
         try:
             room = Room.objects(id=pk).first()
             if not room:
-                logger.warning(f"Room not found for update with id: {pk}")
+                logger.warning("Room not found for update with id: %s", pk)
                 return Response(status=status.HTTP_404_NOT_FOUND)
 
             # بررسی مالکیت
-            if room.creator != request.mongo_user:
+            if reference_id(room, "creator") != request.mongo_user.id:
                 return Response(
                     {"detail": "شما مجاز به ویرایش این اتاق نیستید."},
                     status=status.HTTP_403_FORBIDDEN,
@@ -94,7 +202,8 @@ class RoomViewSet(viewsets.ViewSet):
                 for key, value in serializer.validated_data.items():
                     setattr(room, key, value)
                 room.save()
-                logger.info(f"Room updated successfully with id: {pk}")
+                invalidate_room(room.id)
+                logger.info("Room updated successfully with id: %s", pk)
                 return Response(RoomSerializer(room).data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except ValidationError:
@@ -103,22 +212,27 @@ class RoomViewSet(viewsets.ViewSet):
             )
 
     def destroy(self, request, pk=None):
-        logger.info(f"Attempting to delete room with id: {pk}")
+        logger.info("Attempting to delete room with id: %s", pk)
         try:
             room = Room.objects(id=pk).first()
             if not room:
-                logger.warning(f"Room not found for deletion with id: {pk}")
+                logger.warning("Room not found for deletion with id: %s", pk)
                 return Response(status=status.HTTP_404_NOT_FOUND)
 
             # بررسی مالکیت
-            if room.creator != request.mongo_user:
+            if reference_id(room, "creator") != request.mongo_user.id:
                 return Response(
                     {"detail": "شما مجاز به حذف این اتاق نیستید."},
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
+            # چالش‌های اتاق به صورت آبشاری حذف می‌شوند
+            challenge_ids = list(Challenge.objects(room=room).scalar("id"))
             room.delete()
-            logger.info(f"Room deleted successfully with id: {pk}")
+            invalidate_room(room.id)
+            for challenge_id in challenge_ids:
+                invalidate_challenge(challenge_id)
+            logger.info("Room deleted successfully with id: %s", pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except ValidationError:
             return Response(
@@ -138,21 +252,32 @@ class ChallengeViewSet(viewsets.ViewSet):
         logger.info("Listing all challenges")
         room_id = request.query_params.get("room_id")
         if room_id:
-            challenges = Challenge.objects(room=room_id).order_by("-created_at")
+            challenges = Challenge.objects(room=room_id)
         else:
-            challenges = Challenge.objects().order_by("-created_at")
-        serializer = ChallengeSerializer(challenges, many=True)
-        return Response(serializer.data)
+            challenges = Challenge.objects()
+        fields = requested_fields(request, ChallengeSerializer)
+        paginator = KeysetPagination()
+        challenges = only_requested(
+            challenges, ChallengeSerializer, fields, paginator.ordering_field
+        )
+        page = paginator.paginate_queryset(challenges, request, view=self)
+        if fields is None or "room" in fields:
+            prefetch_references(page, "room")
+        serializer = ChallengeSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk=None):
-        logger.info(f"Retrieving challenge with id: {pk}")
+        logger.info("Retrieving challenge with id: %s", pk)
+        fields = requested_fields(request, ChallengeSerializer)
         try:
-            challenge = Challenge.objects(id=pk).first()
+            challenge = only_requested(
+                Challenge.objects(id=pk), ChallengeSerializer, fields
+            ).first()
             if not challenge:
                 return Response(
                     {"detail": "چالش پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
                 )
-            return Response(ChallengeSerializer(challenge).data)
+            return Response(ChallengeSerializer(challenge, fields=fields).data)
         except ValidationError:
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
@@ -165,34 +290,116 @@ class ChallengeViewSet(viewsets.ViewSet):
             try:
                 challenge = Challenge(**serializer.validated_data)
                 challenge.save()
-                logger.info(f"Challenge created successfully with id: {challenge.id}")
+                logger.info("Challenge created successfully with id: %s", challenge.id)
                 return Response(
                     ChallengeSerializer(challenge).data, status=status.HTTP_201_CREATED
                 )
             except ValidationError as e:
-                logger.error(f"Challenge validation error: {str(e)}")
+                logger.error("Challenge validation error: %s", e)
                 return Response(
                     {"error": "خطا در اعتبارسنجی داده‌ها"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        logger.error(f"Challenge creation failed with errors: {serializer.errors}")
+        logger.error("Challenge creation failed with errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class MessageViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticatedMongo, IsNotBanned]
+    renderer_classes = [FastJSONRenderer]
+    bulk_max_size = 1000
+    thread_default_depth = 10
+    thread_max_depth = 50
+    thread_default_size = 200
+    thread_max_size = 1000
+    stream_batch_size = 500
+
+    def get_throttles(self):
+        # فقط نوشتن پیام محدود می‌شود
+        if self.action in ("create", "bulk_create"):
+            return [TokenBucketThrottle()]
+        return []
+
+    @property
+    def throttle_scope(self):
+        # ارسال گروهی سطل خودش را دارد و هر پیام آن یک توکن مصرف می‌کند
+        if self.action == "bulk_create":
+            return "message_bulk"
+        return "message_create"
+
+    def get_throttle_cost(self, request):
+        if self.action == "bulk_create" and isinstance(request.data, list):
+            return max(1, len(request.data))
+        return 1
 
     def list(self, request):
         logger.info("Listing messages")
         challenge_id = request.query_params.get("challenge_id")
         if challenge_id:
-            messages = Message.objects(
-                challenge=challenge_id, is_deleted=False
-            ).order_by("-created_at")
+            messages = messages_for_challenge(challenge_id).filter(is_deleted=False)
         else:
-            messages = Message.objects(is_deleted=False).order_by("-created_at")
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+            messages = Message.objects(is_deleted=False)
+        projection = MESSAGE_LIST.restrict(requested_fields(request, MessageSerializer))
+        if request.query_params.get("stream") in ("1", "true"):
+            if not challenge_id:
+                return Response(
+                    {"detail": "برای دریافت جریانی، challenge_id الزامی است."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            logger.info("Streaming messages of challenge %s", challenge_id)
+            response = StreamingHttpResponse(
+                self.stream_messages(request, messages, projection),
+                content_type="application/json",
+            )
+            response["X-Accel-Buffering"] = "no"
+            return response
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(
+            projection.queryset(messages, paginator.ordering_field), request, view=self
+        )
+        return paginator.get_paginated_response(
+            self.serialize_page(request, page, projection)
+        )
+
+    def serialize_page(self, request, page, projection):
+        if "liked_by_me" not in projection.names:
+            return projection.serialize(page)
+        liked_ids = get_liked_ids(request, page)
+        return projection.serialize(
+            page, methods={"liked_by_me": lambda message: message["_id"] in liked_ids}
+        )
+
+    def stream_messages(self, request, messages, projection):
+        """
+        Every message of ``messages`` as one JSON array, newest first, read
+        and encoded ``stream_batch_size`` at a time so memory does not grow
+        with the number of messages.
+        """
+        chunks = self.encode_batches(request, messages, projection)
+        # زیر ASGI تکرارگر همگام پیش از ارسال کامل در حافظه جمع می‌شود
+        if isinstance(request._request, ASGIRequest):
+            return iterate_in_thread(chunks)
+        return chunks
+
+    def encode_batches(self, request, messages, projection):
+        queryset = (
+            projection.queryset(messages.no_cache())
+            .order_by("-created_at", "-id")
+            .batch_size(self.stream_batch_size)
+        )
+        # iter() روی QuerySet آن را از ابتدا بازخوانی می‌کند؛ یک generator واحد لازم است
+        cursor = (message for message in queryset)
+        renderer = FastJSONRenderer()
+        separator = b"["
+        while True:
+            page = list(islice(cursor, self.stream_batch_size))
+            if not page:
+                break
+            # آرایه هر دسته بدون کروشه‌هایش به بقیه خروجی چسبانده می‌شود
+            data = self.serialize_page(request, page, projection)
+            yield separator + renderer.render(data)[1:-1]
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
 
     def create(self, request):
         logger.info("Creating new message")
@@ -202,21 +409,127 @@ class MessageViewSet(viewsets.ViewSet):
                 message = Message(**serializer.validated_data)
                 message.user_id = str(request.mongo_user.id)
                 message.save()
-                logger.info(f"Message created successfully with id: {message.id}")
-                return Response(
-                    MessageSerializer(message).data, status=status.HTTP_201_CREATED
-                )
+                logger.info("Message created successfully with id: %s", message.id)
+                data = MessageSerializer(message).data
+                publish_message_event("message.created", message, data)
+                return Response(data, status=status.HTTP_201_CREATED)
             except ValidationError as e:
-                logger.error(f"Message validation error: {str(e)}")
+                logger.error("Message validation error: %s", e)
                 return Response(
                     {"error": "خطا در اعتبارسنجی داده‌ها"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        logger.error(f"Message creation failed with errors: {serializer.errors}")
+        logger.error("Message creation failed with errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        """Validate and insert a batch of messages; errors are reported per item"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"detail": "فهرستی از پیام‌ها الزامی است."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > self.bulk_max_size:
+            return Response(
+                {"detail": f"حداکثر {self.bulk_max_size} پیام در هر درخواست مجاز است."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        logger.info("Bulk creating %s messages", len(items))
+
+        context = self.get_bulk_context(items)
+        user_id = str(request.mongo_user.id)
+        errors = []
+        messages = []  # (index, message)
+        for index, item in enumerate(items):
+            serializer = MessageSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                errors.append({"index": index, "errors": serializer.errors})
+                continue
+            try:
+                message = Message(**serializer.validated_data)
+                message.user_id = user_id
+                message.validate()
+            except ValidationError as e:
+                logger.error("Message validation error: %s", e)
+                errors.append(
+                    {"index": index, "errors": {"detail": "خطا در اعتبارسنجی داده‌ها"}}
+                )
+                continue
+            messages.append((index, message))
+
+        created = []
+        if messages:
+            documents = [message.to_mongo() for _, message in messages]
+            failed = set()
+            try:
+                # unordered: خطای یک سند مانع درج بقیه نمی‌شود
+                Message._get_collection().insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    position = write_error["index"]
+                    failed.add(position)
+                    errors.append(
+                        {
+                            "index": messages[position][0],
+                            "errors": {"detail": "خطا در ذخیره پیام"},
+                        }
+                    )
+                logger.error("Bulk insert failed for %s messages", len(failed))
+            for position, (_, message) in enumerate(messages):
+                if position not in failed:
+                    message.id = documents[position]["_id"]
+                    message._created = False
+                    created.append(message)
+
+        data = MessageSerializer(created, many=True).data
+        for message, item in zip(created, data):
+            publish_message_event("message.created", message, item)
+        logger.info(
+            "Bulk create finished: %s created, %s failed", len(created), len(errors)
+        )
+
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        errors.sort(key=lambda error: error["index"])
+        return Response({"created": data, "errors": errors}, status=response_status)
+
+    def get_bulk_context(self, items):
+        """Resolve every referenced challenge and parent with one query each"""
+        challenge_ids = set()
+        parent_ids = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            challenge_id = item.get("challenge")
+            parent_id = item.get("parent_message")
+            if isinstance(challenge_id, str) and ObjectId.is_valid(challenge_id):
+                challenge_ids.add(ObjectId(challenge_id))
+            if isinstance(parent_id, str) and ObjectId.is_valid(parent_id):
+                parent_ids.add(ObjectId(parent_id))
+
+        challenges = set()
+        if challenge_ids:
+            # وضعیت‌ها در کش می‌مانند تا انتشار رویدادها دوباره نخواند
+            challenges = set(get_challenge_states(challenge_ids))
+            prefetch_archive_states(challenges)
+        parent_messages = {}
+        if parent_ids:
+            parent_messages = {
+                parent["_id"]: parent.get("is_deleted", False)
+                for parent in Message.objects(id__in=parent_ids)
+                .only("is_deleted")
+                .as_pymongo()
+            }
+        return {"challenges": challenges, "parent_messages": parent_messages}
+
     def destroy(self, request, pk=None):
-        logger.info(f"Attempting to delete message with id: {pk}")
+        logger.info("Attempting to delete message with id: %s", pk)
         try:
             message = Message.objects(id=pk).first()
             if not message:
@@ -234,32 +547,85 @@ class MessageViewSet(viewsets.ViewSet):
 
             message.is_deleted = True
             message.save()
-            logger.info(f"Message soft deleted successfully with id: {pk}")
+            invalidate_message(message.id)
+            logger.info("Message soft deleted successfully with id: %s", pk)
+            publish_message_event("message.deleted", message, {"id": str(message.id)})
             return Response(status=status.HTTP_204_NO_CONTENT)
         except ValidationError:
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=["get"])
+    def thread(self, request, pk=None):
+        """Root message and its replies, fetched with one $graphLookup"""
+        logger.info("Retrieving thread for message with id: %s", pk)
+        if not ObjectId.is_valid(pk):
+            return Response(
+                {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        max_depth = get_int_param(
+            request, "max_depth", self.thread_default_depth, self.thread_max_depth
+        )
+        limit = get_int_param(
+            request, "limit", self.thread_default_size, self.thread_max_size
+        )
+
+        result = self.get_thread(Message.objects, pk, max_depth, limit)
+        if not result or not result["root"]:
+            # رشته‌های چالش‌های قدیمی در مجموعه آرشیو هستند
+            result = self.get_thread(archived_messages(), pk, max_depth, limit)
+        if not result or not result["root"]:
+            return Response(
+                {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        context = {"user_id": str(request.mongo_user.id)}
+        replies = result["replies"][:limit]
+        depths = [reply.pop("depth") + 1 for reply in replies]
+        data = MessageSerializer(
+            [Message._from_son(reply) for reply in replies], many=True, context=context
+        ).data
+        for item, depth in zip(data, depths):
+            item["depth"] = depth
+        return Response(
+            {
+                "root": MessageSerializer(
+                    Message._from_son(result["root"][0]), context=context
+                ).data,
+                "replies": data,
+                "truncated": len(result["replies"]) > limit,
+            }
+        )
+
+    def get_thread(self, queryset, pk, max_depth, limit):
+        collection = queryset._collection
+        pipeline = thread_pipeline(collection.name, pk, max_depth, limit)
+        return next(collection.aggregate(pipeline), None)
+
     @action(detail=True, methods=["post"])
     def like(self, request, pk=None):
-        logger.info(f"Attempting to like message with id: {pk}")
+        logger.info("Attempting to like message with id: %s", pk)
         try:
-            message = Message.objects(id=pk).first()
-            if not message:
-                return Response(
-                    {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
-                )
-
             user_id = str(request.mongo_user.id)
-            if user_id not in (message.likes or []):
-                Message.objects(id=pk).update_one(add_to_set__likes=user_id)
-                message.reload()
-                logger.info(f"Message liked successfully with id: {pk}")
+            # افزودن لایک و افزایش شمارنده در یک عملیات اتمیک
+            message = Message.objects(id=pk, likes__ne=user_id).modify(
+                add_to_set__likes=user_id, inc__likes_count=1, new=True
+            )
+            if message:
+                logger.info("Message liked successfully with id: %s", pk)
+                publish_likes_event(message)
             else:
-                logger.info(f"Message already liked by user: {user_id}")
+                message = Message.objects(id=pk).first()
+                if not message:
+                    return Response(
+                        {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
+                    )
+                logger.info("Message already liked by user: %s", user_id)
 
-            return Response(MessageSerializer(message).data)
+            return Response(
+                MessageSerializer(message, context={"user_id": user_id}).data
+            )
         except ValidationError:
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
@@ -267,21 +633,25 @@ class MessageViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=["delete"])
     def unlike(self, request, pk=None):
-        logger.info(f"Attempting to unlike message with id: {pk}")
+        logger.info("Attempting to unlike message with id: %s", pk)
         try:
-            message = Message.objects(id=pk).first()
-            if not message:
-                return Response(
-                    {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
-                )
-
             user_id = str(request.mongo_user.id)
-            if user_id in (message.likes or []):
-                Message.objects(id=pk).update_one(pull__likes=user_id)
-                message.reload()
-                logger.info(f"Message unliked successfully with id: {pk}")
+            message = Message.objects(id=pk, likes=user_id).modify(
+                pull__likes=user_id, dec__likes_count=1, new=True
+            )
+            if message:
+                logger.info("Message unliked successfully with id: %s", pk)
+                publish_likes_event(message)
+            else:
+                message = Message.objects(id=pk).first()
+                if not message:
+                    return Response(
+                        {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
+                    )
 
-            return Response(MessageSerializer(message).data)
+            return Response(
+                MessageSerializer(message, context={"user_id": user_id}).data
+            )
         except ValidationError:
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
@@ -289,18 +659,23 @@ class MessageViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=["post"])
     def report(self, request, pk=None):
-        logger.info(f"Attempting to report message with id: {pk}")
+        logger.info("Attempting to report message with id: %s", pk)
+        serializer = MessageReportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
-            message = Message.objects(id=pk).first()
-            if not message:
+            case = record_report(
+                pk,
+                str(request.mongo_user.id),
+                serializer.validated_data.get("reason") or None,
+            )
+            if not case:
                 return Response(
                     {"detail": "پیام پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
                 )
 
-            message.is_reported = True
-            message.save()
-            logger.info(f"Message reported successfully with id: {pk}")
-            return Response({"reported": True})
+            logger.info("Message reported successfully with id: %s", pk)
+            return Response({"reported": True, "report_count": case.report_count})
         except ValidationError:
             return Response(
                 {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
@@ -312,11 +687,17 @@ class ChallengeResponseViewSet(viewsets.ViewSet):
 
     def list(self, request):
         logger.info("Listing challenge responses")
-        responses = ChallengeResponse.objects(
-            user_id=str(request.mongo_user.id)
-        ).order_by("-answered_at")
-        serializer = ChallengeResponseSerializer(responses, many=True)
-        return Response(serializer.data)
+        responses = ChallengeResponse.objects(user_id=str(request.mongo_user.id))
+        fields = requested_fields(request, ChallengeResponseSerializer)
+        paginator = KeysetPagination(ordering_field="answered_at")
+        responses = only_requested(
+            responses, ChallengeResponseSerializer, fields, paginator.ordering_field
+        )
+        page = paginator.paginate_queryset(responses, request, view=self)
+        if fields is None or "challenge" in fields:
+            prefetch_references(page, "challenge")
+        serializer = ChallengeResponseSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request):
         logger.info("Creating challenge response")
@@ -327,7 +708,7 @@ class ChallengeResponseViewSet(viewsets.ViewSet):
                 response.user_id = str(request.mongo_user.id)  # اصلاح شده
                 response.save()
                 logger.info(
-                    f"Challenge response created successfully with id: {response.id}"
+                    "Challenge response created successfully with id: %s", response.id
                 )
                 return Response(
                     ChallengeResponseSerializer(response).data,
@@ -340,13 +721,13 @@ class ChallengeResponseViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             except ValidationError as e:
-                logger.error(f"Challenge response validation error: {str(e)}")
+                logger.error("Challenge response validation error: %s", e)
                 return Response(
                     {"error": "خطا در اعتبارسنجی داده‌ها"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
         logger.error(
-            f"Challenge response creation failed with errors: {serializer.errors}"
+            "Challenge response creation failed with errors: %s", serializer.errors
         )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -369,7 +750,7 @@ class SubmitMoodAPIView(views.APIView):
                 {"message": "حال روحی ثبت شد."}, status=status.HTTP_201_CREATED
             )
         except ValidationError as e:
-            logger.error(f"Mood validation error: {str(e)}")
+            logger.error("Mood validation error: %s", e)
             return Response(
                 {"error": "خطا در ثبت حال روحی"}, status=status.HTTP_400_BAD_REQUEST
             )
@@ -377,32 +758,110 @@ class SubmitMoodAPIView(views.APIView):
 
 class MoodSuggestionsAPIView(views.APIView):
     permission_classes = [IsAuthenticatedMongo]
+    renderer_classes = [FastJSONRenderer]
 
     def get(self, request):
         logger.info("Getting mood suggestions")
         last_mood = (
-            UserMood.objects(user=request.mongo_user).order_by("-created_at").first()
+            UserMood.objects(user=request.mongo_user)
+            .order_by("-created_at")
+            .only("mood")
+            .first()
+        )
+        mood = last_mood.mood if last_mood else None
+        # پیشنهادها به آخرین حال کاربر هم وابسته‌اند
+        return conditional_get(
+            request,
+            content_etag("suggestions", mood),
+            lambda: self.suggestions(mood),
+            private=True,
         )
-        if not last_mood:
+
+    def suggestions(self, mood):
+        if not mood:
             return Response({"suggestions": []}, status=status.HTTP_200_OK)
 
-        contents = Content.objects(mood_tags=last_mood.mood).order_by("-created_at")[
-            :20
-        ]
-        serializer = ContentSerializer(contents, many=True)
-        return Response({"suggestions": serializer.data}, status=status.HTTP_200_OK)
+        contents = CONTENT_LIST.queryset(
+            Content.objects(mood_tags=mood).order_by("-created_at")
+        )[:20]
+        return Response(
+            {"suggestions": CONTENT_LIST.serialize(list(contents))},
+            status=status.HTTP_200_OK,
+        )
 
 
 class PopularContentAPIView(views.APIView):
+    renderer_classes = [FastJSONRenderer]
+
     def get(self, request):
         logger.info("Getting popular content")
-        contents = Content.objects(is_popular=True).order_by("-created_at")[:10]
-        serializer = ContentSerializer(contents, many=True)
-        return Response({"popular": serializer.data}, status=status.HTTP_200_OK)
+        return conditional_get(request, content_etag("popular"), self.popular)
+
+    def popular(self):
+        contents = CONTENT_LIST.queryset(
+            Content.objects(is_popular=True).order_by("-created_at")
+        )[:10]
+        return Response(
+            {"popular": CONTENT_LIST.serialize(list(contents))},
+            status=status.HTTP_200_OK,
+        )
 
 
 class CategoryListAPIView(views.APIView):
     def get(self, request):
         logger.info("Getting content categories")
+        return conditional_get(request, content_etag("categories"), self.categories)
+
+    def categories(self):
         categories = Content.objects.distinct("category")
         return Response({"categories": categories}, status=status.HTTP_200_OK)
+
+
+class SearchAPIView(views.APIView):
+    permission_classes = [IsAuthenticatedMongo, IsNotBanned]
+
+    def get(self, request):
+        query = normalize_persian(request.query_params.get("q", ""))
+        search_type = request.query_params.get("type", "messages")
+        if not query:
+            return Response(
+                {"detail": "عبارت جستجو الزامی است."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        logger.info("Searching %s for: %s", search_type, query)
+
+        paginator = RankedPagination()
+        if search_type == "messages":
+            messages = Message.objects(is_deleted=False)
+            challenge_id = request.query_params.get("challenge_id")
+            if challenge_id:
+                if not ObjectId.is_valid(challenge_id):
+                    return Response(
+                        {"detail": "شناسه چالش نامعتبر است."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                messages = messages.filter(challenge=challenge_id)
+            messages = (
+                messages.search_text(query, language="none")
+                .exclude("likes")
+                .order_by("$text_score")
+            )
+            page = paginator.paginate_queryset(messages, request, view=self)
+            data = MessageSerializer(
+                page, many=True, context={"liked_ids": get_liked_ids(request, page)}
+            ).data
+        elif search_type == "content":
+            contents = Content.objects.search_text(query, language="none").order_by(
+                "$text_score"
+            )
+            page = paginator.paginate_queryset(contents, request, view=self)
+            data = ContentSerializer(page, many=True).data
+        else:
+            return Response(
+                {"detail": "نوع جستجو نامعتبر است."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        for item, document in zip(data, page):
+            item["score"] = document.get_text_score()
+        return paginator.get_paginated_response(data)
@@ -0,0 +1,113 @@
+import logging
+
+from bson import ObjectId
+from chat.archive import modify_message
+from chat.auth_backends import IsAdminUser, IsAuthenticatedMongo
+from chat.models import MessageReport, ModerationCase
+from chat.moderation import resolve_case
+from chat.pagination import KeysetPagination
+from chat.prefetch import prefetch_references
+from chat.realtime import publish_message_event
+from chat.serializers import MessageReportSerializer, ModerationCaseSerializer
+from chat.validation_cache import invalidate_message
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+class ModerationCaseViewSet(viewsets.ViewSet):
+    """Queue of reported messages for admins, most recently reported first"""
+
+    permission_classes = [IsAuthenticatedMongo, IsAdminUser]
+
+    def list(self, request):
+        logger.info("Listing open moderation cases")
+        # از ایندکس جزئی روی موارد حل‌نشده استفاده می‌کند
+        cases = ModerationCase.objects(resolved=False)
+        paginator = KeysetPagination(ordering_field="last_reported_at")
+        page = paginator.paginate_queryset(cases, request, view=self)
+        prefetch_references(page, "message")
+        serializer = ModerationCaseSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, pk=None):
+        logger.info("Retrieving moderation case with id: %s", pk)
+        if not ObjectId.is_valid(pk):
+            return Response(
+                {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        case = ModerationCase.objects(id=pk).first()
+        if not case:
+            return Response(
+                {"detail": "مورد پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(ModerationCaseSerializer(case).data)
+
+    @action(detail=True, methods=["get"])
+    def reports(self, request, pk=None):
+        """Individual reports behind a case, newest first"""
+        logger.info("Listing reports for moderation case with id: %s", pk)
+        if not ObjectId.is_valid(pk):
+            return Response(
+                {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        case = ModerationCase.objects(id=pk).only("message").as_pymongo().first()
+        if not case:
+            return Response(
+                {"detail": "مورد پیدا نشد."}, status=status.HTTP_404_NOT_FOUND
+            )
+        reports = MessageReport.objects(message=case["message"])
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(reports, request, view=self)
+        serializer = MessageReportSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["post"])
+    def resolve(self, request, pk=None):
+        """Close a case: ``{"resolution": "dismissed" | "deleted"}``"""
+        resolution = request.data.get("resolution", "dismissed")
+        logger.info("Resolving moderation case %s as %s", pk, resolution)
+        if resolution not in ("dismissed", "deleted"):
+            return Response(
+                {"resolution": ["مقدار نامعتبر است."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ObjectId.is_valid(pk):
+            return Response(
+                {"detail": "شناسه نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        not_found = Response(
+            {"detail": "مورد پیدا نشد یا قبلاً بررسی شده است."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+        if resolution == "deleted":
+            # پیام پیش از بستن مورد حذف می‌شود تا مورد بی‌جهت «حذف شده» ثبت نشود
+            case = (
+                ModerationCase.objects(id=pk, resolved=False)
+                .only("message")
+                .as_pymongo()
+                .first()
+            )
+            if not case:
+                return not_found
+            message = modify_message(case["message"], set__is_deleted=True)
+            if message is None:
+                return Response(
+                    {"detail": "پیام این مورد پیدا نشد."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            invalidate_message(message.id)
+            publish_message_event("message.deleted", message, {"id": str(message.id)})
+
+        case = resolve_case(pk, resolution, str(request.mongo_user.id))
+        if not case:
+            return not_found
+        if resolution == "deleted":
+            case.message = message
+        else:
+            # پیام بایگانی‌شده در مجموعه داغ نیست و به جای خطا None می‌شود
+            prefetch_references([case], "message")
+        return Response(ModerationCaseSerializer(case).data)
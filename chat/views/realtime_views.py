@@ -0,0 +1,137 @@
+# chat/views/realtime_views.py
+import asyncio
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from chat.auth_backends import MongoJWTAuthentication, is_user_banned
+from chat.realtime import challenge_channel, get_broker, room_channel
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+# فاصله ارسال پیام نگه‌دارنده اتصال (ثانیه)
+KEEPALIVE_SECONDS = 15
+
+WEBSOCKET_ROUTES = [
+    (re.compile(r"^/ws/challenges/(?P<pk>[0-9a-fA-F]{24})/$"), challenge_channel),
+    (re.compile(r"^/ws/rooms/(?P<pk>[0-9a-fA-F]{24})/$"), room_channel),
+]
+
+
+def resolve_user(token):
+    user, claims = MongoJWTAuthentication().authenticate_credentials(token)
+    return None if is_user_banned(user, claims) else user
+
+
+async def authenticate_token(token):
+    """Resolve an access token to a non-banned user, or ``None``"""
+    if not token:
+        return None
+    try:
+        return await sync_to_async(resolve_user)(token)
+    except AuthenticationFailed:
+        return None
+
+
+def get_request_token(request):
+    # EventSource نمی‌تواند هدر بفرستد، پس توکن از query string هم پذیرفته می‌شود
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    return request.GET.get("token")
+
+
+def encode_event(event):
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+
+
+async def event_stream(channel):
+    subscription = get_broker().subscribe(channel)
+    try:
+        yield ": connected\n\n"
+        while True:
+            event = await subscription.get(timeout=KEEPALIVE_SECONDS)
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {encode_event(event)}\n\n"
+    finally:
+        subscription.close()
+
+
+async def stream_events(request, channel, pk):
+    # زیر WSGI جریان بی‌پایان پیش از ارسال کامل خوانده می‌شود و worker را قفل می‌کند
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "جریان رویدادها فقط روی سرور ASGI در دسترس است."}, status=501
+        )
+    if not ObjectId.is_valid(pk):
+        return JsonResponse({"detail": "شناسه نامعتبر است."}, status=400)
+    user = await authenticate_token(get_request_token(request))
+    if user is None:
+        return JsonResponse({"detail": "احراز هویت ناموفق بود."}, status=401)
+
+    logger.info("Opening event stream for %s", channel(pk))
+    response = StreamingHttpResponse(
+        event_stream(channel(pk)), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def challenge_events(request, challenge_id):
+    """Server-Sent Events for messages of one challenge (ASGI only)"""
+    return await stream_events(request, challenge_channel, challenge_id)
+
+
+async def room_events(request, room_id):
+    """Server-Sent Events for messages of every challenge in a room (ASGI only)"""
+    return await stream_events(request, room_channel, room_id)
+
+
+async def websocket_application(scope, receive, send):
+    """Raw ASGI WebSocket endpoint at ``/ws/challenges/<id>/`` and ``/ws/rooms/<id>/``"""
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    channel = None
+    for pattern, channel_name in WEBSOCKET_ROUTES:
+        match = pattern.match(scope["path"])
+        if match:
+            channel = channel_name(match.group("pk"))
+            break
+    if channel is None:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    user = await authenticate_token(query.get("token", [None])[0])
+    if user is None:
+        await send({"type": "websocket.close", "code": 4401})
+        return
+
+    await send({"type": "websocket.accept"})
+    logger.info("WebSocket subscribed to %s", channel)
+    subscription = get_broker().subscribe(channel)
+
+    async def forward():
+        async for event in subscription:
+            await send({"type": "websocket.send", "text": encode_event(event)})
+
+    forwarder = asyncio.create_task(forward())
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        forwarder.cancel()
+        subscription.close()